@@ -44,8 +44,27 @@ def create_app(config_class=Config):
     from app.admin import bp as admin_bp
     app.register_blueprint(admin_bp)
 
+    # Maintenance commands (`flask backfill-latest`, ...)
+    from app.commands import bp as commands_bp
+    app.register_blueprint(commands_bp)
+
     # This import ensures that the models are registered with SQLAlchemy
     # before any database operations are performed.
     from app import models
 
+    # Let readers and the ingest writer work side by side on SQLite
+    from app.storage import configure_sqlite
+    with app.app_context():
+        configure_sqlite(db.engine, app.config['SQLITE_JOURNAL_MODE'])
+
+    # Event-driven offline detection is started by run.py and asgi.py with the
+    # server; under other servers it starts with the first request
+    if app.config['OFFLINE_DETECTION'] == 'event':
+        from app.offline import ensure_offline_monitor
+        app.before_request(ensure_offline_monitor)
+
+    # Load the in-memory recent readings before the first request, if enabled
+    from app.recent import warm_up_recent_readings
+    warm_up_recent_readings(app)
+
     return app
@@ -0,0 +1,109 @@
+# /app/access.py
+
+import threading
+import time
+from flask import current_app
+from flask_login import UserMixin
+from app import db
+from app.models import User, user_device_association
+
+class UserIdentity(UserMixin):
+    """
+    The columns of a logged-in User that request handling reads, detached
+    from any session so it can be shared between requests.
+    """
+
+    def __init__(self, user):
+        self.id = user.id
+        self.full_name = user.full_name
+        self.email = user.email
+        self.role = user.role
+        self.loaded_at = time.monotonic()
+
+    def __repr__(self):
+        return f'<UserIdentity {self.full_name}>'
+
+class AccessIndex:
+    """
+    Process-local cache of user-device assignments: user id -> frozenset of
+    device ids for the user-facing views, and device id -> recipient emails
+    for alerting. Both come from one query over user_device_association and
+    are rebuilt together.
+
+    It also caches the identity Flask-Login loads on every request for
+    USER_CACHE_TTL seconds. Admin edits invalidate both explicitly; the TTLs
+    are the fallback for changes made by other processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices = None     # user id -> frozenset of device ids
+        self._recipients = None  # device id -> tuple of emails
+        self._loaded_at = 0.0
+        self._users = {}         # user id -> UserIdentity
+        self.loads = 0
+        self.user_hits = 0
+        self.user_misses = 0
+
+    def _assignments(self):
+        with self._lock:
+            if self._devices is not None and time.monotonic() - self._loaded_at < current_app.config['ACCESS_INDEX_TTL']:
+                return self._devices, self._recipients
+        rows = db.session.query(user_device_association.c.user_id, user_device_association.c.device_id, User.email).join(
+            User, User.id == user_device_association.c.user_id
+        ).all()
+        devices, recipients = {}, {}
+        for user_id, device_id, email in rows:
+            devices.setdefault(user_id, set()).add(device_id)
+            recipients.setdefault(device_id, []).append(email)
+        devices = {user_id: frozenset(ids) for user_id, ids in devices.items()}
+        recipients = {device_id: tuple(emails) for device_id, emails in recipients.items()}
+        with self._lock:
+            self._devices, self._recipients = devices, recipients
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+        return devices, recipients
+
+    def device_ids(self, user_id):
+        """Frozenset of the ids of the devices assigned to a user."""
+        return self._assignments()[0].get(user_id, frozenset())
+
+    def recipients(self, device_id):
+        """Emails of the users assigned to a device."""
+        return self._assignments()[1].get(device_id, ())
+
+    def user(self, user_id):
+        """The UserIdentity of a user id, or None if there is no such user."""
+        with self._lock:
+            identity = self._users.get(user_id)
+            if identity is not None and time.monotonic() - identity.loaded_at < current_app.config['USER_CACHE_TTL']:
+                self.user_hits += 1
+                return identity
+            self.user_misses += 1
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = UserIdentity(user)
+        with self._lock:
+            self._users[user_id] = identity
+        return identity
+
+    def invalidate(self):
+        """Forgets all assignments and cached identities."""
+        with self._lock:
+            self._devices = None
+            self._recipients = None
+            self._users.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users_with_devices': len(self._devices) if self._devices is not None else None,
+                'devices_with_recipients': len(self._recipients) if self._recipients is not None else None,
+                'loads': self.loads,
+                'cached_identities': len(self._users),
+                'identity_hits': self.user_hits,
+                'identity_misses': self.user_misses
+            }
+
+access_index = AccessIndex()
@@ -1,12 +1,22 @@
 # /app/admin.py
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from app.auth import admin_required
 # Ensure all necessary models are imported
-from app.models import User, Device, AlertLog, SensorData 
+from app.models import User, Device, AlertLog, AlertRule, ReportingPolicy, SensorData, DeviceLatest
 from app import db
-from app.email import send_alert_email
+from app.email import queue_alert_email, notification_stats
+from app.registry import device_registry
+from app.access import access_index
+from app.storage import touch_device_latest
+from app.pagination import keyset_paginate, requested_page_size
+from app.offline import get_offline_monitor
+from app.archive import delete_device_archive
+from app.rollups import delete_device_rollups
+from app.rules import METRICS, sync_alert_statuses
+from app.reporting import DEFAULT_CATEGORY, default_policy, reporting_advisor
+from app.routes import ALERT_TYPES
 # Import datetime and timedelta for checking online status
 from datetime import datetime, timedelta 
 
@@ -25,25 +35,20 @@ def dashboard():
     device_count = Device.query.count()
     
     # Determine Online/Offline status of devices
-    # A device is considered offline if it hasn't sent data in the last 5 minutes
-    five_minutes_ago = datetime.utcnow() - timedelta(minutes=5)
-    
-    # Subquery to find the latest timestamp for each device
-    subquery = db.session.query(
-        SensorData.device_id,
-        db.func.max(SensorData.timestamp).label('max_timestamp')
-    ).group_by(SensorData.device_id).subquery()
+    # A device is considered offline if it hasn't sent data within its offline threshold
+    now = datetime.utcnow()
+    default_offline_after = current_app.config['OFFLINE_AFTER_MINUTES']
     
     # Left outer join to include devices that have never sent data
-    latest_device_logs = db.session.query(Device, subquery.c.max_timestamp).outerjoin(
-        subquery, Device.id == subquery.c.device_id
+    latest_device_logs = db.session.query(Device.id, Device.offline_after_minutes, DeviceLatest.timestamp).outerjoin(
+        DeviceLatest, Device.id == DeviceLatest.device_id
     ).all()
     
     online_devices = 0
     offline_devices = 0
-    for device, max_timestamp in latest_device_logs:
-        # A device is online if it has a timestamp that is more recent than 5 minutes ago
-        if max_timestamp and max_timestamp > five_minutes_ago:
+    for device_id, offline_after, max_timestamp in latest_device_logs:
+        # A device is online if its latest reading is newer than its offline threshold
+        if max_timestamp and max_timestamp > now - timedelta(minutes=offline_after or default_offline_after):
             online_devices += 1
         else:
             offline_devices += 1
@@ -96,11 +101,11 @@ def add_user():
             new_user.set_password(password)
         
         db.session.add(new_user)
-        db.session.commit()
 
         subject = "Welcome to the Environmental Monitoring System"
         body = f"Hello {full_name},\n\nAn account has been created for you. You can now log in."
-        send_alert_email(recipient=new_user.email, subject=subject, body=body)
+        queue_alert_email(recipient=new_user.email, subject=subject, body=body)
+        db.session.commit()
 
         flash(f'User {full_name} has been created successfully!')
         return redirect(url_for('admin.users'))
@@ -130,6 +135,9 @@ def edit_user(user_id):
         user_to_edit.devices = [device for device in all_devices if str(device.id) in assigned_device_ids]
 
         db.session.commit()
+        # Recipient lists of any device may have changed
+        access_index.invalidate()
+        device_registry.invalidate()
         flash(f'User {user_to_edit.full_name} updated successfully!')
         return redirect(url_for('admin.users'))
 
@@ -149,6 +157,8 @@ def delete_user(user_id):
         
     db.session.delete(user_to_delete)
     db.session.commit()
+    access_index.invalidate()
+    device_registry.invalidate()
     flash(f'User {user_to_delete.full_name} has been deleted.')
     return redirect(url_for('admin.users'))
 
@@ -162,6 +172,63 @@ def devices():
     all_devices = Device.query.all()
     return render_template('admin/devices.html', devices=all_devices)
 
+# Threshold fields of the add/edit device forms -> the rule bound they set.
+# Each edits the device's first rule on the metric; /admin/devices/<id>/rules
+# manages every rule, including hysteresis and minimum duration.
+THRESHOLD_FORM_FIELDS = {
+    'temp_threshold_high': ('temperature', 'high_threshold'),
+    'humidity_threshold_low': ('humidity', 'low_threshold'),
+    'humidity_threshold_high': ('humidity', 'high_threshold'),
+    'voltage_threshold_low': ('ac_voltage', 'low_threshold'),
+    'voltage_threshold_high': ('ac_voltage', 'high_threshold'),
+}
+
+def _form_float(name):
+    return float(request.form.get(name)) if request.form.get(name) else None
+
+def _first_rules(device):
+    first = {}
+    for rule in device.rules.order_by(AlertRule.id):
+        first.setdefault(rule.metric, rule)
+    return first
+
+def threshold_form_values(device):
+    """Current values of the device form's threshold fields."""
+    first = _first_rules(device)
+    values = {}
+    for field, (metric, bound) in THRESHOLD_FORM_FIELDS.items():
+        values[field] = getattr(first[metric], bound) if metric in first else None
+    values['alert_on_water'] = 'water_detected' in first
+    return values
+
+def apply_threshold_form(device):
+    """
+    Saves the device form's threshold fields as rules. Only the bounds the
+    form shows are changed, so a low band, hysteresis or duration set on the
+    Rules page survives; a rule is deleted once neither bound is left.
+    """
+    first = _first_rules(device)
+    bounds = {}
+    for field, (metric, bound) in THRESHOLD_FORM_FIELDS.items():
+        bounds.setdefault(metric, {})[bound] = _form_float(field)
+    water = first.get('water_detected')
+    if request.form.get('alert_on_water') != 'on':
+        bounds['water_detected'] = {'high_threshold': None}
+    elif water is None or water.high_threshold is None:
+        # A reading with water_detected true (1) is above 0
+        bounds['water_detected'] = {'high_threshold': 0.0}
+    for metric, values in bounds.items():
+        rule = first.get(metric)
+        if rule is None:
+            if any(value is not None for value in values.values()):
+                db.session.add(AlertRule(device_id=device.id, metric=metric, **values))
+            continue
+        for bound, value in values.items():
+            setattr(rule, bound, value)
+        if rule.low_threshold is None and rule.high_threshold is None:
+            db.session.delete(rule)
+    sync_alert_statuses(device)
+
 @bp.route('/devices/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -171,15 +238,17 @@ def add_device():
             name=request.form.get('name'),
             unique_hardware_id=request.form.get('unique_hardware_id'),
             category=request.form.get('category'),
-            temp_threshold_high=float(request.form.get('temp_threshold_high')) if request.form.get('temp_threshold_high') else None,
-            humidity_threshold_low=float(request.form.get('humidity_threshold_low')) if request.form.get('humidity_threshold_low') else None,
-            humidity_threshold_high=float(request.form.get('humidity_threshold_high')) if request.form.get('humidity_threshold_high') else None,
-            voltage_threshold_low=float(request.form.get('voltage_threshold_low')) if request.form.get('voltage_threshold_low') else None,
-            voltage_threshold_high=float(request.form.get('voltage_threshold_high')) if request.form.get('voltage_threshold_high') else None,
-            alert_on_water=request.form.get('alert_on_water') == 'on'
+            offline_after_minutes=int(request.form.get('offline_after_minutes')) if request.form.get('offline_after_minutes') else None,
+            realert_after_minutes=int(request.form.get('realert_after_minutes')) if request.form.get('realert_after_minutes') else None
         )
         db.session.add(new_device)
+        db.session.flush()
+        apply_threshold_form(new_device)
         db.session.commit()
+        device_registry.invalidate(new_device.unique_hardware_id)
+        monitor = get_offline_monitor()
+        if monitor is not None:
+            monitor.update_settings(new_device)
         flash(f'Device {new_device.name} has been added successfully!')
         return redirect(url_for('admin.devices'))
     return render_template('admin/add_device.html')
@@ -190,19 +259,106 @@ def add_device():
 def edit_device(device_id):
     device_to_edit = Device.query.get_or_404(device_id)
     if request.method == 'POST':
+        previous_hardware_id = device_to_edit.unique_hardware_id
         device_to_edit.name = request.form.get('name')
         device_to_edit.unique_hardware_id = request.form.get('unique_hardware_id')
         device_to_edit.category = request.form.get('category')
-        device_to_edit.temp_threshold_high = float(request.form.get('temp_threshold_high')) if request.form.get('temp_threshold_high') else None
-        device_to_edit.humidity_threshold_low = float(request.form.get('humidity_threshold_low')) if request.form.get('humidity_threshold_low') else None
-        device_to_edit.humidity_threshold_high = float(request.form.get('humidity_threshold_high')) if request.form.get('humidity_threshold_high') else None
-        device_to_edit.voltage_threshold_low = float(request.form.get('voltage_threshold_low')) if request.form.get('voltage_threshold_low') else None
-        device_to_edit.voltage_threshold_high = float(request.form.get('voltage_threshold_high')) if request.form.get('voltage_threshold_high') else None
-        device_to_edit.alert_on_water = request.form.get('alert_on_water') == 'on'
+        apply_threshold_form(device_to_edit)
+        device_to_edit.offline_after_minutes = int(request.form.get('offline_after_minutes')) if request.form.get('offline_after_minutes') else None
+        device_to_edit.realert_after_minutes = int(request.form.get('realert_after_minutes')) if request.form.get('realert_after_minutes') else None
+        touch_device_latest([device_to_edit.id])
         db.session.commit()
+        device_registry.invalidate(previous_hardware_id)
+        device_registry.invalidate(device_to_edit.unique_hardware_id)
+        monitor = get_offline_monitor()
+        if monitor is not None:
+            monitor.update_settings(device_to_edit)
         flash(f'Device {device_to_edit.name} updated successfully!')
         return redirect(url_for('admin.devices'))
-    return render_template('admin/edit_device.html', device=device_to_edit)
+    return render_template('admin/edit_device.html', device=device_to_edit, thresholds=threshold_form_values(device_to_edit))
+
+@bp.route('/devices/<int:device_id>/rules', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def device_rules(device_id):
+    """Lists, adds, updates and deletes a device's alert rules."""
+    device = Device.query.get_or_404(device_id)
+    if request.method == 'POST':
+        action = request.form.get('action')
+        if action == 'delete':
+            rule = AlertRule.query.filter_by(id=request.form.get('rule_id', type=int), device_id=device.id).first_or_404()
+            db.session.delete(rule)
+            flash(f'Rule on {rule.metric} deleted.')
+        else:
+            if action == 'update':
+                rule = AlertRule.query.filter_by(id=request.form.get('rule_id', type=int), device_id=device.id).first_or_404()
+            else:
+                rule = AlertRule(device_id=device.id, metric=request.form.get('metric'))
+                if rule.metric not in METRICS:
+                    flash('Unknown metric.')
+                    return redirect(url_for('admin.device_rules', device_id=device.id))
+            rule.low_threshold = _form_float('low_threshold')
+            rule.high_threshold = _form_float('high_threshold')
+            rule.hysteresis = _form_float('hysteresis') or 0.0
+            rule.min_duration_seconds = int(request.form.get('min_duration_seconds') or 0)
+            if rule.low_threshold is None and rule.high_threshold is None:
+                flash('A rule needs a low or a high threshold.')
+                return redirect(url_for('admin.device_rules', device_id=device.id))
+            if rule.hysteresis < 0 or rule.min_duration_seconds < 0:
+                flash('Hysteresis and minimum duration cannot be negative.')
+                return redirect(url_for('admin.device_rules', device_id=device.id))
+            db.session.add(rule)
+            flash(f'Rule on {rule.metric} saved.')
+        sync_alert_statuses(device)
+        touch_device_latest([device.id])
+        db.session.commit()
+        device_registry.invalidate(device.unique_hardware_id)
+        return redirect(url_for('admin.device_rules', device_id=device.id))
+    rules = device.rules.order_by(AlertRule.metric, AlertRule.id).all()
+    return render_template('admin/device_rules.html', device=device, rules=rules, metrics=METRICS)
+
+@bp.route('/reporting', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def reporting():
+    """Lists, adds, updates and deletes the reporting policies of device categories."""
+    if request.method == 'POST':
+        action = request.form.get('action')
+        if action == 'delete':
+            policy = ReportingPolicy.query.get_or_404(request.form.get('policy_id', type=int))
+            db.session.delete(policy)
+            flash(f'Reporting policy for {policy.category} deleted.')
+        else:
+            if action == 'update':
+                policy = ReportingPolicy.query.get_or_404(request.form.get('policy_id', type=int))
+            else:
+                category = (request.form.get('category') or '').strip() or DEFAULT_CATEGORY
+                if ReportingPolicy.query.filter_by(category=category).first():
+                    flash(f'{category} already has a reporting policy.')
+                    return redirect(url_for('admin.reporting'))
+                policy = ReportingPolicy(category=category)
+            policy.fast_seconds = int(request.form.get('fast_seconds') or 0)
+            policy.normal_seconds = int(request.form.get('normal_seconds') or 0)
+            policy.slow_seconds = int(request.form.get('slow_seconds') or 0)
+            policy.near_alert_percent = _form_float('near_alert_percent') or 0.0
+            policy.stable_change_percent = _form_float('stable_change_percent') or 0.0
+            if not 0 < policy.fast_seconds <= policy.normal_seconds <= policy.slow_seconds:
+                flash('Intervals must be positive, with fast <= normal <= slow.')
+                return redirect(url_for('admin.reporting'))
+            if policy.near_alert_percent < 0 or policy.stable_change_percent < 0:
+                flash('Percentages cannot be negative.')
+                return redirect(url_for('admin.reporting'))
+            db.session.add(policy)
+            flash(f'Reporting policy for {policy.category} saved.')
+        db.session.commit()
+        reporting_advisor.invalidate()
+        return redirect(url_for('admin.reporting'))
+    policies = ReportingPolicy.query.order_by(ReportingPolicy.category).all()
+    categories = sorted({category for category, in db.session.query(Device.category).distinct() if category})
+    return render_template(
+        'admin/reporting.html', policies=policies, categories=categories,
+        defaults=default_policy(), default_category=DEFAULT_CATEGORY
+    )
 
 @bp.route('/devices/delete/<int:device_id>', methods=['POST'])
 @login_required
@@ -210,8 +366,21 @@ def edit_device(device_id):
 def delete_device(device_id):
     """Handles deleting a device."""
     device_to_delete = Device.query.get_or_404(device_id)
+    # Bulk-delete the readings first rather than letting the cascade load them
+    SensorData.query.filter_by(device_id=device_id).delete(synchronize_session=False)
+    delete_device_rollups(device_id)
     db.session.delete(device_to_delete)
     db.session.commit()
+    delete_device_archive(device_id)
+    access_index.invalidate()
+    device_registry.invalidate(device_to_delete.unique_hardware_id)
+    recent = current_app.extensions.get('recent_readings')
+    if recent is not None:
+        recent.drop(device_id)
+    monitor = get_offline_monitor()
+    if monitor is not None:
+        monitor.forget(device_id)
+    reporting_advisor.forget(device_id)
     flash(f'Device {device_to_delete.name} has been deleted.')
     return redirect(url_for('admin.devices'))
 
@@ -222,8 +391,46 @@ def delete_device(device_id):
 @admin_required
 def alerts():
     """Shows a list of all alerts in the system for admin users."""
-    all_alerts = AlertLog.query.order_by(AlertLog.timestamp.desc()).all()
-    return render_template('admin/alerts.html', alerts=all_alerts)
+    selected_device_id = request.args.get('device_id', 'all')
+    selected_alert_type = request.args.get('alert_type', 'all')
+    query = AlertLog.query
+    if selected_device_id != 'all':
+        query = query.filter(AlertLog.device_id == int(selected_device_id))
+    if selected_alert_type != 'all':
+        query = query.filter(AlertLog.alert_type == selected_alert_type)
+    page = keyset_paginate(query, AlertLog.timestamp, AlertLog.id, requested_page_size(), descending=True)
+    return render_template(
+        'admin/alerts.html',
+        page=page,
+        devices=Device.query.all(),
+        alert_types=ALERT_TYPES,
+        selected_device_id=selected_device_id,
+        selected_alert_type=selected_alert_type
+    )
+
+
+@bp.route('/stats')
+@login_required
+@admin_required
+def stats():
+    """Returns in-process cache, pipeline and notification counters as JSON."""
+    writer = current_app.extensions.get('ingest_writer')
+    recent = current_app.extensions.get('recent_readings')
+    hub = current_app.extensions.get('event_hub')
+    monitor = current_app.extensions.get('offline_monitor')
+    async_ingest = current_app.extensions.get('async_ingest')
+    return jsonify({
+        'device_registry': device_registry.stats(),
+        'access_index': access_index.stats(),
+        'ingest_writer': writer.stats() if writer else None,
+        'async_ingest': async_ingest.stats() if async_ingest else None,
+        'recent_readings': recent.stats() if recent else None,
+        'event_hub': hub.stats() if hub else None,
+        'offline_monitor': monitor.stats() if monitor else None,
+        'reporting': reporting_advisor.stats(),
+        'notifications': notification_stats()
+    })
+
 @bp.route('/maintenance', methods=['GET', 'POST'])
 @login_required
 @admin_required
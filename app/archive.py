@@ -0,0 +1,262 @@
+# /app/archive.py
+
+import heapq
+import os
+import shutil
+import time
+import uuid
+from array import array
+from datetime import datetime, timedelta
+from itertools import groupby, islice
+from flask import current_app
+from app import db
+from app.models import Device, SensorData
+from app.timeutil import from_epoch_ms, to_epoch_ms
+
+# Parquet support is optional; without it the archive is simply never used.
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+ARCHIVE_COLUMNS = ('device_id', 'timestamp', 'temperature', 'humidity', 'ac_voltage', 'water_detected')
+
+# Rows per Parquet row group, and per batch when a partition is written or read
+ARCHIVE_ROW_GROUP_SIZE = 65536
+
+class ArchivedReading:
+    """A SensorData row read back from the archive, with the same attributes."""
+    __slots__ = ARCHIVE_COLUMNS + ('device',)
+
+    def __init__(self, device=None, **values):
+        for column in ARCHIVE_COLUMNS:
+            setattr(self, column, values.get(column))
+        self.device = device
+
+def archive_available():
+    return pq is not None
+
+def _schema():
+    return pa.schema([
+        ('device_id', pa.int64()),
+        ('timestamp', pa.timestamp('us')),
+        ('temperature', pa.float64()),
+        ('humidity', pa.float64()),
+        ('ac_voltage', pa.float64()),
+        ('water_detected', pa.bool_()),
+    ])
+
+def _month_key(timestamp):
+    return timestamp.strftime('%Y-%m')
+
+def _months_between(start, end):
+    """'YYYY-MM' keys of every month overlapping [start, end)."""
+    months = []
+    year, month = start.year, start.month
+    while datetime(year, month, 1) < end:
+        months.append(f'{year:04d}-{month:02d}')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def _partition_dir(device_id, month):
+    return os.path.join(current_app.config['ARCHIVE_DIR'], f'device={device_id}', f'month={month}')
+
+def delete_device_archive(device_id):
+    """Removes every archived partition of a device, e.g. when it is deleted."""
+    shutil.rmtree(os.path.join(current_app.config['ARCHIVE_DIR'], f'device={device_id}'), ignore_errors=True)
+
+def _partition_files(device_ids, month):
+    paths = []
+    for device_id in device_ids:
+        directory = _partition_dir(device_id, month)
+        if os.path.isdir(directory):
+            paths.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith('.parquet'))
+    return paths
+
+def has_archived_data(device_ids, start, end):
+    """Cheap check (directory listing only) for archive files overlapping a range."""
+    if not archive_available() or not os.path.isdir(current_app.config['ARCHIVE_DIR']):
+        return False
+    return any(_partition_files(device_ids, month) for month in _months_between(start, end))
+
+def _write_partition(device_id, month, rows):
+    """
+    Writes a device-month partition as one file: `rows` (sorted by timestamp)
+    merged with the rows archived for the month before, duplicates dropped,
+    and the old files removed once the new one is in place. Both sides are
+    streamed into the file ARCHIVE_ROW_GROUP_SIZE rows at a time.
+    """
+    directory = _partition_dir(device_id, month)
+    os.makedirs(directory, exist_ok=True)
+    old_paths = _partition_files([device_id], month)
+    old_rows = heapq.merge(*(_iter_file(path) for path in old_paths), key=_row_timestamp)
+    # New rows come first, so they win over an archived copy of the same reading
+    merged = merge_archived(rows, old_rows, key=_row_timestamp)
+    writer = final_path = temp_path = None
+    try:
+        while True:
+            chunk = list(islice(merged, ARCHIVE_ROW_GROUP_SIZE))
+            if not chunk:
+                break
+            if writer is None:
+                final_path = os.path.join(directory, f'part-{chunk[0]["timestamp"]:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.parquet')
+                # Write under a temporary name so readers never see a half-written file;
+                # until the old files are gone they read both and drop the duplicates
+                temp_path = final_path + '.tmp'
+                writer = pq.ParquetWriter(temp_path, _schema(), compression='zstd')
+            writer.write_table(pa.Table.from_pylist(chunk, schema=_schema()), row_group_size=ARCHIVE_ROW_GROUP_SIZE)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(temp_path)
+        raise
+    if writer is None:
+        return
+    writer.close()
+    os.replace(temp_path, final_path)
+    for path in old_paths:
+        os.remove(path)
+
+def _archive_month(device_id, month, rows, batch_size, pause):
+    """Writes one device-month of rows to its partition, then deletes them from SQLite in batches."""
+    # Only the keys are kept (as epoch milliseconds in an array), not the rows
+    keys = array('q')
+    def tracked():
+        for row in rows:
+            keys.append(to_epoch_ms(row['timestamp']))
+            yield row
+    _write_partition(device_id, month, tracked())
+    for start in range(0, len(keys), batch_size):
+        # Deleted by key, so a late reading that arrived meanwhile is kept
+        timestamps = [from_epoch_ms(key) for key in keys[start:start + batch_size]]
+        SensorData.query.filter(
+            SensorData.device_id == device_id, SensorData.timestamp.in_(timestamps)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        if pause:
+            time.sleep(pause)
+    return len(keys)
+
+def _device_rows(device_id, cutoff, batch_size):
+    """A device's SensorData rows older than `cutoff` as dicts, read in timestamp-keyed batches."""
+    columns = [getattr(SensorData, column) for column in ARCHIVE_COLUMNS]
+    last_timestamp = datetime.min
+    while True:
+        batch = db.session.query(*columns).filter(
+            SensorData.device_id == device_id, SensorData.timestamp > last_timestamp, SensorData.timestamp < cutoff
+        ).order_by(SensorData.timestamp).limit(batch_size).all()
+        if not batch:
+            return
+        yield from (row._asdict() for row in batch)
+        last_timestamp = batch[-1].timestamp
+
+def archive_readings(cutoff, batch_size, pause=0.0):
+    """
+    Moves SensorData rows older than `cutoff` into Parquet files partitioned
+    by device and month, one file per partition. A device-month is read in
+    batches of `batch_size` rows and streamed into its file, then deleted in
+    batches that are each their own short transaction, so the SQLite write
+    lock is never held for long. Returns the number of rows archived.
+
+    Files are written before the rows are deleted; if the job dies in between,
+    the rows are archived again next time and merged into the same file.
+    """
+    if not archive_available():
+        raise RuntimeError("pyarrow is required to archive readings (pip install pyarrow)")
+    total = 0
+    # Walk one device at a time so every batch is a primary-key range
+    device_ids = [device_id for (device_id,) in db.session.query(Device.id).order_by(Device.id)]
+    for device_id in device_ids:
+        month_groups = groupby(_device_rows(device_id, cutoff, batch_size), key=lambda row: _month_key(row['timestamp']))
+        for month, rows in month_groups:
+            total += _archive_month(device_id, month, rows, batch_size, pause)
+    return total
+
+def _row_timestamp(row):
+    return row['timestamp']
+
+def _row_key(row):
+    return (row['timestamp'], row['device_id'])
+
+def _iter_file(path, start=None, end=None, descending=False):
+    """
+    Rows (as dicts) of one partition file in [start, end), in timestamp order.
+    Row groups outside the range are skipped by their statistics and the rest
+    are read one batch at a time.
+    """
+    parquet_file = pq.ParquetFile(path)
+    timestamp_column = parquet_file.schema_arrow.get_field_index('timestamp')
+    row_groups = []
+    for index in range(parquet_file.metadata.num_row_groups):
+        stats = parquet_file.metadata.row_group(index).column(timestamp_column).statistics
+        if stats is not None and stats.has_min_max and (
+            (start is not None and stats.max < start) or (end is not None and stats.min >= end)
+        ):
+            continue
+        row_groups.append(index)
+    if not row_groups:
+        return
+    if descending:
+        batches = (parquet_file.read_row_group(index, columns=list(ARCHIVE_COLUMNS)) for index in reversed(row_groups))
+    else:
+        batches = parquet_file.iter_batches(batch_size=ARCHIVE_ROW_GROUP_SIZE, row_groups=row_groups, columns=list(ARCHIVE_COLUMNS))
+    for batch in batches:
+        timestamps = batch.column('timestamp')
+        if start is not None:
+            batch = batch.filter(pc.greater_equal(timestamps, pa.scalar(start, type=pa.timestamp('us'))))
+            timestamps = batch.column('timestamp')
+        if end is not None:
+            batch = batch.filter(pc.less(timestamps, pa.scalar(end, type=pa.timestamp('us'))))
+        rows = batch.to_pylist()
+        yield from (reversed(rows) if descending else rows)
+
+def merge_archived(rows, archived, key):
+    """
+    Merges readings from SQLite with archived ones, both sorted by `key`
+    ((timestamp, device_id)), keeping one copy of a reading that is in both,
+    e.g. after an interrupted archive run.
+    """
+    previous = None
+    for row in heapq.merge(rows, archived, key=key):
+        current = key(row)
+        if current != previous:
+            yield row
+        previous = current
+
+def iter_archived(device_ids, start, end, descending=False):
+    """
+    Yields archived rows (as dicts) in [start, end) ordered by (timestamp, device_id),
+    one month partition at a time, k-way merging the per-device files batch by
+    batch so memory stays bounded by a row group per file.
+    """
+    if not has_archived_data(device_ids, start, end):
+        return
+    months = _months_between(start, end)
+    for month in (reversed(months) if descending else months):
+        files = [_iter_file(path, start, end, descending) for path in _partition_files(device_ids, month)]
+        previous = None
+        for row in heapq.merge(*files, key=_row_key, reverse=descending):
+            current = _row_key(row)
+            if current != previous:
+                yield row
+            previous = current
+
+def archived_page_source(device_ids, start, end, devices_by_id):
+    """
+    Returns an `extra_source` for keyset_paginate that serves archived
+    readings of `device_ids` in [start, end) as ArchivedReading objects.
+    """
+    def source(lower, upper, reverse, limit):
+        range_start = max(start, lower[0]) if lower else start
+        range_end = min(end, upper[0] + timedelta(microseconds=1)) if upper else end
+        if range_start >= range_end:
+            return []
+        rows = (
+            row for row in iter_archived(device_ids, range_start, range_end, descending=reverse)
+            if (lower is None or (row['timestamp'], row['device_id']) > lower)
+            and (upper is None or (row['timestamp'], row['device_id']) < upper)
+        )
+        return [ArchivedReading(devices_by_id.get(row['device_id']), **row) for row in islice(rows, limit)]
+    return source
@@ -0,0 +1,429 @@
+# /app/async_ingest.py
+
+import asyncio
+import io
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from app.models import truncate_to_millis
+from app.offline import start_offline_monitor
+from app.registry import device_registry
+from app.payloads import decode_payload
+from app.reporting import reporting_advisor
+
+INGEST_PATHS = ('/api/ingest', '/api/ingest/batch')
+
+class AsyncIngestBatcher:
+    """
+    Group commit for the asyncio ingest server. Requests wait on a future
+    while their readings sit in an asyncio queue; one task hands everything
+    queued so far (up to INGEST_FLUSH_MAX_ROWS rows) to a single writer
+    thread as one commit_readings call. While a commit runs, the next batch
+    builds up, so a burst costs a few transactions rather than one per
+    request, without the fixed linger of the write-behind writer. Requests
+    are answered only after their readings are committed, with the rows
+    that were stored; if a commit fails, every request in it gets a 500 and
+    the devices resend.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.max_rows = app.config['INGEST_FLUSH_MAX_ROWS']
+        self._queue = asyncio.Queue(maxsize=app.config['INGEST_QUEUE_MAX_SIZE'])
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='async-ingest-writer')
+        self._task = None
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.rows_failed = 0
+        self.requests_rejected = 0
+        self.max_flush_size = 0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def commit(self, readings):
+        """
+        Commits (device, timestamp, sensor_readings) tuples together with
+        whatever other requests queued meanwhile and returns the SensorData
+        row mappings of its readings that were stored. Returns None
+        without waiting if the queue is full; raises if the commit failed.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((readings, future))
+        except asyncio.QueueFull:
+            self.requests_rejected += 1
+            return None
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            rows = len(batch[0][0])
+            while rows < self.max_rows and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                rows += len(batch[-1][0])
+            started = time.perf_counter()
+            stored, error = await loop.run_in_executor(self._executor, self._flush, batch)
+            self.flushes += 1
+            if error is None:
+                self.rows_flushed += rows
+            else:
+                self.rows_failed += rows
+            self.max_flush_size = max(self.max_flush_size, rows)
+            self.total_flush_ms += (time.perf_counter() - started) * 1000
+            # A key stored once belongs to the first request that sent it
+            remaining = {(row['device_id'], row['timestamp']): row for row in stored or ()}
+            for readings, future in batch:
+                keys = [(device.id, truncate_to_millis(timestamp)) for device, timestamp, _ in readings]
+                own = [remaining.pop(key) for key in keys if key in remaining]
+                if future.done():
+                    continue  # The client went away
+                if error is None:
+                    future.set_result(own)
+                else:
+                    future.set_exception(error)
+
+    def _flush(self, batch):
+        """Commits a batch in the writer thread; returns (stored rows, None) or (None, error)."""
+        # Imported here to avoid a circular import with the routes module
+        from app.routes import commit_readings
+        with self.app.app_context():
+            try:
+                return commit_readings([reading for readings, _ in batch for reading in readings]), None
+            except Exception as e:
+                # The registry entries involved were dropped, so the devices'
+                # retries are evaluated against the committed alert state
+                print(f"Error committing {sum(len(readings) for readings, _ in batch)} queued readings: {e}")
+                return None, e
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'flushes': self.flushes,
+            'rows_flushed': self.rows_flushed,
+            'rows_failed': self.rows_failed,
+            'requests_rejected': self.requests_rejected,
+            'max_flush_size': self.max_flush_size,
+            'avg_flush_size': round(self.rows_flushed / self.flushes, 1) if self.flushes else 0,
+            'avg_flush_ms': round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0
+        }
+
+def _wsgi_environ(scope, body):
+    """The WSGI environ of an ASGI HTTP request (PEP 3333)."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name, value = name.decode('latin1'), value.decode('latin1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+class IngestASGI:
+    """
+    ASGI application for asgi.py. Device ingest (/api/ingest and
+    /api/ingest/batch) runs on the event loop: payloads are parsed and
+    validated there, device lookups only leave the loop on a registry miss,
+    and readings are committed through an AsyncIngestBatcher. An idle
+    keep-alive device connection costs a socket, not a thread.
+
+    Every other request is passed to the Flask app as WSGI on a pool of
+    ASGI_WSGI_THREADS threads, so the UI behaves as under a threaded WSGI
+    server. /stream only borrows a thread to authenticate and subscribe;
+    its frames come from the in-process event hub and are sent from the
+    loop, so open dashboards do not use up the pool.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.batcher = None
+        self._wsgi_executor = ThreadPoolExecutor(
+            max_workers=flask_app.config['ASGI_WSGI_THREADS'], thread_name_prefix='asgi-wsgi'
+        )
+        self._lookup_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='asgi-lookup')
+        self.max_body_bytes = flask_app.config['ASGI_MAX_BODY_BYTES']
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        self._start()
+        body = await self._read_body(scope, receive, send)
+        if body is None:
+            return
+        if scope['method'] == 'POST' and scope['path'] in INGEST_PATHS:
+            await self._ingest(scope, body, send)
+        else:
+            await self._wsgi(scope, body, receive, send)
+
+    def _start(self):
+        if self.batcher is None:
+            self.batcher = AsyncIngestBatcher(self.flask_app)
+            self.batcher.start()
+            self.flask_app.extensions['async_ingest'] = self.batcher
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._start()
+                await asyncio.get_running_loop().run_in_executor(self._lookup_executor, start_offline_monitor, self.flask_app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, scope, receive, send):
+        """
+        Reads the request body, or answers 413 and returns None as soon as
+        it is known to exceed ASGI_MAX_BODY_BYTES. Also returns None if the
+        client disconnected.
+        """
+        too_large = (413, {"error": f"Request body exceeds {self.max_body_bytes} bytes"})
+        for name, value in scope['headers']:
+            if name == b'content-length' and value.isdigit() and int(value) > self.max_body_bytes:
+                await self._send_json(send, *too_large)
+                return None
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                await self._send_json(send, *too_large)
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    async def _send_json(send, status, payload, headers=()):
+        body = json.dumps(payload).encode()
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())
+        ] + [(name.encode('latin1'), value.encode('latin1')) for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _devices(self, hardware_ids):
+        """Resolves hardware IDs, querying the database (off the loop) only on a miss."""
+        with self.flask_app.app_context():
+            found, missing = device_registry.cached(hardware_ids)
+        if missing:
+            found.update(await asyncio.get_running_loop().run_in_executor(
+                self._lookup_executor, self._load_devices, missing
+            ))
+        return found
+
+    def _load_devices(self, hardware_ids):
+        with self.flask_app.app_context():
+            return device_registry.load(hardware_ids)
+
+    async def _recommended_intervals(self, readings):
+        """recommended_intervals, loading the reporting policies off the loop when they are stale."""
+        # Imported here to avoid a circular import with the routes module
+        from app.routes import recommended_intervals
+        with self.flask_app.app_context():
+            fresh = reporting_advisor.is_fresh()
+        if not fresh:
+            await asyncio.get_running_loop().run_in_executor(self._lookup_executor, self._load_policies)
+        with self.flask_app.app_context():
+            return recommended_intervals(readings)
+
+    def _load_policies(self):
+        with self.flask_app.app_context():
+            reporting_advisor.policies()
+
+    async def _ingest(self, scope, body, send):
+        # Imported here to avoid a circular import with the routes module
+        from app.routes import (
+            batch_hardware_ids, batch_payload_records, ingest_payload_error, mark_duplicates, parse_reading_timestamp,
+            single_ingest_reply, validate_batch
+        )
+        headers = {name: value.decode('latin1') for name, value in scope['headers']}
+        req_data, error = decode_payload(
+            body, headers.get(b'content-type'), headers.get(b'content-encoding'),
+            self.flask_app.config['INGEST_MAX_DECODED_BYTES'], single=scope['path'] == '/api/ingest'
+        )
+        if not error:
+            with self.flask_app.app_context():
+                if scope['path'] == '/api/ingest':
+                    error = ingest_payload_error(req_data)
+                else:
+                    records, error = batch_payload_records(req_data)
+        if error:
+            await self._send_json(send, error[1], {"error": error[0]})
+            return
+
+        if scope['path'] == '/api/ingest':
+            device = (await self._devices([req_data['device_id']])).get(req_data['device_id'])
+            if not device:
+                await self._send_json(send, 403, {"error": f"Device with ID '{req_data['device_id']}' is not registered."})
+                return
+            # The device's timestamp, or stamped on arrival as the Flask route does
+            timestamp = parse_reading_timestamp(req_data.get('timestamp')) or datetime.utcnow()
+            readings = [(device, timestamp, req_data['data'])]
+            results = None
+        else:
+            hardware_ids = batch_hardware_ids(records)
+            devices = await self._devices(hardware_ids) if hardware_ids else {}
+            results, readings = validate_batch(records, devices)
+
+        try:
+            stored = await self.batcher.commit(readings) if readings else []
+        except Exception:
+            await self._send_json(send, 500, {"error": "Could not store the readings"})
+            return
+        if stored is None:
+            await self._send_json(send, 503, {"error": "Ingest queue is full, retry later"}, [('Retry-After', '1')])
+            return
+        intervals = await self._recommended_intervals(readings) if readings else {}
+        if results is None:
+            await self._send_json(send, 200, single_ingest_reply(stored, intervals[req_data['device_id']]))
+        else:
+            accepted = mark_duplicates(results, readings, stored)
+            await self._send_json(send, 200, {
+                "status": "success" if accepted == len(records) else "partial",
+                "accepted": accepted,
+                "rejected": len(records) - accepted,
+                "results": results,
+                "next_report_seconds": intervals
+            })
+
+    async def _wsgi(self, scope, body, receive, send):
+        loop = asyncio.get_running_loop()
+        disconnected = threading.Event()
+        # /stream hands its event hub subscriber over through the environ
+        detached = []
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+            if detached:
+                detached[0].wake()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            # The whole response is produced in one pool thread, so streaming
+            # responses (exports) keep their request context and never block
+            # the loop; each chunk waits until it has been sent.
+            response = {}
+
+            def start_response(status, headers, exc_info=None):
+                response['status'] = int(status.split(' ', 1)[0])
+                response['headers'] = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+                return lambda data: None  # write() is not supported
+
+            environ = _wsgi_environ(scope, body)
+            if scope['path'] == '/stream':
+                environ['envmon.stream'] = detached
+            iterable = self.flask_app(environ, start_response)
+            started = False
+            try:
+                if detached:
+                    # The body is sent by _stream; it has no length
+                    headers = [header for header in response['headers'] if header[0] != b'content-length']
+                    send_from_thread({'type': 'http.response.start', 'status': response['status'], 'headers': headers})
+                    return
+                for chunk in iterable:
+                    if disconnected.is_set():
+                        return
+                    if not started:
+                        send_from_thread({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+                        started = True
+                    if chunk:
+                        send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                if not started:
+                    send_from_thread({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+                send_from_thread({'type': 'http.response.body', 'body': b''})
+            finally:
+                close = getattr(iterable, 'close', None)
+                if close is not None:
+                    close()
+
+        watcher = loop.create_task(watch_disconnect())
+        try:
+            await loop.run_in_executor(self._wsgi_executor, run)
+            if detached:
+                await self._stream(detached[0], disconnected, send)
+        finally:
+            watcher.cancel()
+
+    async def _stream(self, subscriber, disconnected, send):
+        """Sends a detached /stream subscriber's frames from the event loop, as the view's generator would."""
+        loop = asyncio.get_running_loop()
+        config = self.flask_app.config
+        keepalive = config['EVENTS_KEEPALIVE_SECONDS']
+        linger = config['EVENTS_LINGER_MS'] / 1000.0
+        ready = asyncio.Event()
+        subscriber.waker = lambda: loop.call_soon_threadsafe(ready.set)
+        if subscriber.ready.is_set() or disconnected.is_set():
+            ready.set()
+        hub = self.flask_app.extensions['event_hub']
+        try:
+            await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+            checked = time.monotonic()
+            while not subscriber.dropped and not disconnected.is_set():
+                try:
+                    await asyncio.wait_for(ready.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    if linger:
+                        await asyncio.sleep(linger)
+                if disconnected.is_set():
+                    return
+                if time.monotonic() - checked >= keepalive:
+                    # Reloading the assignments may query the database
+                    await loop.run_in_executor(self._lookup_executor, self._refresh_access, hub, subscriber)
+                    checked = time.monotonic()
+                ready.clear()
+                frames = subscriber.drain()
+                # A comment line keeps proxies from closing an idle stream
+                body = ''.join(frames) if frames else ': keepalive\n\n'
+                await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            hub.unsubscribe(subscriber)
+
+    def _refresh_access(self, hub, subscriber):
+        with self.flask_app.app_context():
+            hub.refresh_access(subscriber)
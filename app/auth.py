@@ -5,6 +5,7 @@ from flask_login import login_user, logout_user, current_user
 # We need to import the 'login' manager and the 'User' model
 from app import db, login
 from app.models import User
+from app.access import access_index
 from functools import wraps
 from flask_login import current_user
 from flask import abort
@@ -20,7 +21,7 @@ def admin_required(f):
 # This is the function we moved from models.py
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    return access_index.user(int(id))
 
 bp = Blueprint('auth', __name__)
 
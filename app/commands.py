@@ -0,0 +1,676 @@
+# /app/commands.py
+
+import asyncio
+import click
+import gzip
+import json
+import multiprocessing
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import Blueprint, current_app
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models import User, Device, SensorData, AlertLog, AlertRule, NotificationOutbox, DeviceLatest
+from app.storage import upsert_device_latest
+from app.rollups import RESOLUTIONS, update_rollups
+from app.timeutil import to_epoch_ms
+from app.archive import archive_readings
+from app.events import EventHub
+from app.payloads import MSGPACK_TYPES, READINGS_TYPE, decode_payload, msgpack, pack_readings
+from app.pagination import keyset_query
+from app.offline import CONNECTION_LOSS, connection_state_query, offline_devices_query, raise_connection_loss_alerts
+from app.registry import device_registry
+from app.rules import METRICS
+
+# Blueprint that only carries `flask <command>` CLI commands
+bp = Blueprint('commands', __name__, cli_group=None)
+
+@bp.cli.command('backfill-latest')
+def backfill_latest():
+    """One-off fill of the DeviceLatest table from existing SensorData."""
+    subquery = db.session.query(
+        SensorData.device_id,
+        db.func.max(SensorData.timestamp).label('max_timestamp')
+    ).group_by(SensorData.device_id).subquery()
+
+    latest_rows = db.session.query(SensorData).join(
+        subquery,
+        db.and_(
+            SensorData.device_id == subquery.c.device_id,
+            SensorData.timestamp == subquery.c.max_timestamp
+        )
+    ).all()
+
+    rows = [{
+        'device_id': log.device_id,
+        'temperature': log.temperature,
+        'humidity': log.humidity,
+        'ac_voltage': log.ac_voltage,
+        'water_detected': log.water_detected,
+        'timestamp': log.timestamp
+    } for log in latest_rows if log.device_id is not None]
+    upsert_device_latest(rows)
+    db.session.commit()
+    click.echo(f"Backfilled latest readings for {len({row['device_id'] for row in rows})} device(s).")
+
+@bp.cli.command('backfill-rollups')
+@click.option('--chunk-size', default=5000, show_default=True, help='Readings aggregated per transaction.')
+def backfill_rollups(chunk_size):
+    """Rebuilds the rollup tables from existing SensorData."""
+    for _, model, _ in RESOLUTIONS:
+        model.query.delete()
+    db.session.commit()
+
+    total = 0
+    # Each chunk is a primary-key range seek: one device, timestamps after the last chunk
+    device_ids = [device_id for (device_id,) in db.session.query(Device.id).order_by(Device.id)]
+    for device_id in device_ids:
+        last_timestamp = datetime.min
+        while True:
+            chunk = db.session.query(
+                SensorData.device_id, SensorData.timestamp, SensorData.temperature,
+                SensorData.humidity, SensorData.ac_voltage, SensorData.water_detected
+            ).filter(
+                SensorData.device_id == device_id, SensorData.timestamp > last_timestamp
+            ).order_by(SensorData.timestamp).limit(chunk_size).all()
+            if not chunk:
+                break
+            update_rollups([row._asdict() for row in chunk])
+            db.session.commit()
+            total += len(chunk)
+            last_timestamp = chunk[-1].timestamp
+    click.echo(f"Rebuilt rollups from {total} reading(s).")
+
+@bp.cli.command('archive-readings')
+@click.option('--days', type=int, default=None, help='Archive readings older than this many days (default: RETENTION_DAYS).')
+@click.option('--batch-size', type=int, default=None, help='Rows moved per transaction (default: ARCHIVE_BATCH_SIZE).')
+def archive_readings_command(days, batch_size):
+    """Moves readings past the retention window into Parquet archive files."""
+    config = current_app.config
+    days = config['RETENTION_DAYS'] if days is None else days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    try:
+        total = archive_readings(cutoff, batch_size or config['ARCHIVE_BATCH_SIZE'], config['ARCHIVE_BATCH_PAUSE'])
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Archived {total} reading(s) older than {cutoff:%Y-%m-%d %H:%M} to {config['ARCHIVE_DIR']}.")
+
+# Tables that grow with history; hot queries must never scan them
+HISTORY_TABLES = ('sensor_data', 'alert_log') + tuple(model.__tablename__ for _, model, _ in RESOLUTIONS)
+
+def hot_queries(device_ids, start, end):
+    """
+    The read paths that run on every page view or checker pass, built by
+    the same helpers the views use. Paged queries read the page after a
+    cursor at `end`.
+    """
+    # Imported here to avoid a circular import with the routes module
+    from app.routes import alert_log_query, history_chart_query, latest_readings_query, raw_history_query
+    queries = {
+        'history chart (raw)': history_chart_query(device_ids, start, end),
+        'history table page': keyset_query(
+            raw_history_query(device_ids, start, end), SensorData.timestamp, SensorData.device_id, after=(start, 0)
+        ).limit(51),
+        'alerts page': keyset_query(
+            alert_log_query(device_ids), AlertLog.timestamp, AlertLog.id, descending=True, after=(end, 2 ** 31)
+        ).limit(51),
+        'dashboard latest': latest_readings_query(device_ids),
+        'checker offline devices': offline_devices_query(end),
+        'offline monitor expired devices': connection_state_query(device_ids),
+    }
+    for name, model, _ in RESOLUTIONS:
+        queries[f'history chart ({name})'] = history_chart_query(device_ids, start, end, model)
+    return queries
+
+def explain_query_plan(conn, query):
+    """The EXPLAIN QUERY PLAN steps of a statement or ORM query on a SQLite connection."""
+    stmt = getattr(query, 'statement', query)
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in conn.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+def history_table_scans(plan):
+    """
+    The plan steps that read a whole history table without an index ("SCAN t",
+    or "SCAN TABLE t" before SQLite 3.36). A walk along an index ("SCAN t
+    USING [COVERING] INDEX i") is how ordered pages are served and is not one.
+    """
+    pattern = re.compile(r'SCAN (TABLE )?(%s)( AS \w+)?$' % '|'.join(HISTORY_TABLES))
+    return [step for step in plan if pattern.match(step)]
+
+def seed_plan_database(engine, devices, readings_per_device):
+    """Creates the schema in `engine` and fills it with synthetic history."""
+    db.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(db.insert(Device), [
+            {'id': i, 'name': f'Device {i}', 'unique_hardware_id': f'PLAN_{i}'} for i in range(1, devices + 1)
+        ])
+        for device_id in range(1, devices + 1):
+            conn.execute(db.insert(SensorData), [{
+                'device_id': device_id, 'temperature': 22.0, 'humidity': 50.0, 'ac_voltage': 230.0,
+                'water_detected': False, 'timestamp': now - timedelta(minutes=i)
+            } for i in range(readings_per_device)])
+            conn.execute(db.insert(AlertLog), [{
+                'device_id': device_id, 'alert_type': 'High Temperature' if i % 2 else 'Connection Loss',
+                'message': 'seeded', 'timestamp': now - timedelta(hours=i)
+            } for i in range(readings_per_device // 10)])
+            conn.execute(db.insert(DeviceLatest), [{
+                'device_id': device_id, 'temperature': 22.0, 'humidity': 50.0, 'ac_voltage': 230.0,
+                'water_detected': False, 'timestamp': now
+            }])
+        conn.execute(text('ANALYZE'))
+
+@bp.cli.command('check-query-plans')
+@click.option('--devices', default=200, show_default=True, help='Devices to seed.')
+@click.option('--readings', default=500, show_default=True, help='Readings to seed per device.')
+def check_query_plans(devices, readings):
+    """
+    Seeds a scratch SQLite database, runs EXPLAIN QUERY PLAN on every hot
+    query and exits non-zero if any of them scans a history table.
+    """
+    engine = create_engine('sqlite://')
+    seed_plan_database(engine, devices, readings)
+    now = datetime.utcnow()
+    device_ids = list(range(1, min(devices, 5) + 1))
+    failures = 0
+    with engine.connect() as conn:
+        for name, query in hot_queries(device_ids, now - timedelta(days=1), now).items():
+            plan = explain_query_plan(conn, query)
+            scans = history_table_scans(plan)
+            status = 'FAIL' if scans else 'ok'
+            failures += bool(scans)
+            click.echo(f"[{status}] {name}: {'; '.join(plan)}")
+    if failures:
+        raise SystemExit(f"{failures} hot query plan(s) fall back to a table scan.")
+
+# SQL statements a page view may issue once the logged-in user and the
+# access index are cached
+PAGE_QUERY_BUDGETS = {
+    '/dashboard': 2,        # devices, latest readings not held in memory
+    '/api/dashboard': 2,    # change aggregate, changed devices
+    '/alerts': 2,           # devices, alert page
+    '/history': 3,          # devices, chart series, table page
+    '/history/export': 1,   # readings
+}
+
+# SQL statements a single-reading POST /api/ingest issues once the device is
+# cached: the reading, DeviceLatest, one upsert per rollup table, and the
+# SELECT that refreshes the device's alert state. That refresh runs on every
+# ingest on purpose: when the readings change nothing no compare-and-set is
+# issued, so a snapshot that missed another worker's alert would never see
+# the recovery.
+INGEST_QUERY_BUDGET = 3 + len(RESOLUTIONS)
+
+@bp.cli.command('check-query-counts')
+@click.option('--devices', default=50, show_default=True, help='Devices to seed and assign to the user.')
+def check_query_counts(devices):
+    """
+    Serves each user-facing page twice, and posts a reading twice, from a
+    scratch in-memory app and exits non-zero if the second request issues more
+    SQL statements than its budget.
+    """
+    from app import create_app
+    from config import Config
+
+    class ScratchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+        TESTING = True
+        OFFLINE_DETECTION = 'poll'
+    app = create_app(ScratchConfig)
+
+    now = datetime.utcnow()
+    with app.app_context():
+        db.create_all()
+        user = User(full_name='Query Check', email='query-check@example.com', role='user')
+        user.set_password('query-check')
+        user.devices = [Device(name=f'Device {i}', unique_hardware_id=f'QUERY_{i}') for i in range(devices)]
+        db.session.add(user)
+        db.session.commit()
+        device_ids = [device.id for device in user.devices]
+        db.session.execute(db.insert(DeviceLatest), [{
+            'device_id': device_id, 'temperature': 22.0, 'humidity': 50.0, 'ac_voltage': 230.0,
+            'water_detected': False, 'timestamp': now
+        } for device_id in device_ids])
+        db.session.execute(db.insert(AlertLog), [{
+            'device_id': device_id, 'alert_type': 'High Temperature', 'message': 'seeded', 'timestamp': now
+        } for device_id in device_ids])
+        db.session.commit()
+        engine = db.engine
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda conn, cursor, statement, *args: statements.append(statement))
+    client = app.test_client()
+    client.post('/login', data={'email': 'query-check@example.com', 'password': 'query-check'})
+    failures = 0
+    for url, budget in PAGE_QUERY_BUDGETS.items():
+        counts = []
+        for _ in range(2):
+            statements.clear()
+            response = client.get(url)
+            response.get_data()
+            counts.append(len(statements))
+        ok = response.status_code == 200 and counts[-1] <= budget
+        failures += not ok
+        click.echo(f"[{'ok' if ok else 'FAIL'}] {url}: {counts[-1]} statement(s), budget {budget} "
+                   f"(first view {counts[0]}, status {response.status_code})")
+    counts = []
+    for value in (21.0, 22.0):
+        statements.clear()
+        response = client.post('/api/ingest', json={'device_id': 'QUERY_0', 'data': {'temperature': value}})
+        counts.append(len(statements))
+    ok = response.status_code == 200 and counts[-1] <= INGEST_QUERY_BUDGET
+    failures += not ok
+    click.echo(f"[{'ok' if ok else 'FAIL'}] POST /api/ingest: {counts[-1]} statement(s), budget {INGEST_QUERY_BUDGET} "
+               f"(first post {counts[0]}, status {response.status_code})")
+    if failures:
+        raise SystemExit(f"{failures} request(s) exceed their query budget.")
+
+async def _post_readings(host, port, connections, requests_per_connection, hardware_ids, timeout):
+    """
+    Client side of benchmark-ingest: opens every connection first, then has
+    each post its readings one after another over HTTP/1.1 keep-alive.
+    """
+    connect_slots = asyncio.Semaphore(500)
+    start = asyncio.Event()
+    pending_connects = [connections]
+    latencies, statuses, errors = [], {}, {'connect': 0, 'request': 0}
+
+    async def connect():
+        async with connect_slots:
+            return await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+
+    async def request(reader, writer, body):
+        writer.write(
+            f"POST /api/ingest HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        head = (await reader.readuntil(b'\r\n\r\n')).decode('latin1').lower()
+        length = int(re.search(r'content-length: *(\d+)', head).group(1))
+        await reader.readexactly(length)
+        return int(head.split(' ', 2)[1]), 'connection: close' in head or head.startswith('http/1.0')
+
+    async def device(index):
+        try:
+            reader, writer = await connect()
+        except (OSError, asyncio.TimeoutError):
+            errors['connect'] += 1
+            reader = writer = None
+        pending_connects[0] -= 1
+        if not pending_connects[0]:
+            start.set()
+        await start.wait()
+        if writer is None:
+            return
+        try:
+            for i in range(requests_per_connection):
+                body = json.dumps({'device_id': hardware_ids[(index + i) % len(hardware_ids)], 'data': {
+                    'temperature': 22.5, 'humidity': 50.0, 'ac_voltage': 230.0
+                }}).encode()
+                started = time.perf_counter()
+                status, closed = await asyncio.wait_for(request(reader, writer, body), timeout)
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+                if closed and i + 1 < requests_per_connection:
+                    writer.close()
+                    reader, writer = await connect()
+        except (OSError, ValueError, AttributeError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            errors['request'] += 1
+        finally:
+            writer.close()
+
+    tasks = [asyncio.ensure_future(device(index)) for index in range(connections)]
+    await start.wait()
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    return latencies, statuses, errors, time.perf_counter() - started
+
+@bp.cli.command('benchmark-ingest')
+@click.option('--url', default='http://127.0.0.1:5000', show_default=True, help='Server to load.')
+@click.option('--connections', default=1000, show_default=True, help='Concurrent keep-alive device connections.')
+@click.option('--requests', 'requests_per_connection', default=5, show_default=True, help='Readings posted per connection.')
+@click.option('--devices', default=200, show_default=True, help='Devices to spread the readings over (BENCH_<n>, registered if missing).')
+@click.option('--timeout', default=60.0, show_default=True, help='Seconds before a connect or request counts as failed.')
+def benchmark_ingest(url, connections, requests_per_connection, devices, timeout):
+    """
+    Posts single readings to /api/ingest of a running server over many
+    concurrent keep-alive connections, the way a large fleet of small
+    devices does, and reports failures, throughput and latency. Run it
+    against run.py and against asgi.py to compare the two.
+    """
+    hardware_ids = [f'BENCH_{i}' for i in range(devices)]
+    known = {hardware_id for (hardware_id,) in db.session.query(Device.unique_hardware_id).filter(Device.unique_hardware_id.in_(hardware_ids))}
+    if len(known) < devices:
+        db.session.add_all([Device(name=hardware_id, unique_hardware_id=hardware_id) for hardware_id in hardware_ids if hardware_id not in known])
+        db.session.commit()
+        click.echo(f"Registered {devices - len(known)} benchmark device(s).")
+
+    host, _, port = url.split('://', 1)[-1].rstrip('/').partition(':')
+    latencies, statuses, errors, elapsed = asyncio.run(
+        _post_readings(host, int(port or 80), connections, requests_per_connection, hardware_ids, timeout)
+    )
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+    click.echo(f"{connections - errors['connect']}/{connections} connections open, "
+               f"{len(latencies)} requests in {elapsed:.1f}s ({len(latencies) / elapsed:.0f}/s), statuses {statuses}")
+    click.echo(f"latency: p50 {percentile(0.5):.1f} ms, p99 {percentile(0.99):.1f} ms, max {percentile(1):.1f} ms")
+    click.echo(f"failed connects: {errors['connect']}, failed connections mid-run: {errors['request']}")
+
+@bp.cli.command('benchmark-event-hub')
+@click.option('--subscribers', default=1000, show_default=True, help='Concurrent /stream clients to simulate.')
+@click.option('--devices', default=100, show_default=True, help='Devices publishing readings.')
+@click.option('--devices-per-subscriber', default=10, show_default=True, help='Devices assigned to each client.')
+@click.option('--rate', default=500, show_default=True, help='Readings published per second.')
+@click.option('--seconds', default=10, show_default=True, help='How long to publish for.')
+def benchmark_event_hub(subscribers, devices, devices_per_subscriber, rate, seconds):
+    """
+    Drives an EventHub with one consumer thread per simulated client, the
+    way /stream serves them, and reports fan-out throughput and delivery
+    latency. Exits non-zero if any client had to be dropped.
+    """
+    hub = EventHub(current_app.config['EVENTS_CLIENT_BUFFER'])
+    linger = current_app.config['EVENTS_LINGER_MS'] / 1000.0
+    rng = random.Random(0)
+    latencies = []
+    latencies_lock = threading.Lock()
+    stop = threading.Event()
+
+    def consume(subscriber):
+        own = []
+        while not stop.is_set() and not subscriber.dropped:
+            frames = subscriber.get_all(0.2, linger)
+            if frames:
+                # The oldest frame of a batch waited longest
+                sent = json.loads(frames[0].split('data: ', 1)[1])['sent']
+                own.append(time.perf_counter() - sent)
+        with latencies_lock:
+            latencies.extend(own)
+
+    threads = []
+    for _ in range(subscribers):
+        subscriber = hub.subscribe(rng.sample(range(1, devices + 1), min(devices_per_subscriber, devices)))
+        thread = threading.Thread(target=consume, args=(subscriber,), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    total = rate * seconds
+    publish_time = 0.0
+    started = time.perf_counter()
+    for i in range(total):
+        # Pace the publisher to the requested rate
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        t = time.perf_counter()
+        hub.publish(rng.randint(1, devices), 'reading', {'temperature': 22.5, 'humidity': 50.0, 'sent': t})
+        publish_time += time.perf_counter() - t
+    elapsed = time.perf_counter() - started
+    time.sleep(0.5)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    stats = hub.stats()
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+    click.echo(f"{subscribers} subscribers, {total} readings in {elapsed:.1f}s ({total / elapsed:.0f}/s), "
+               f"{stats['delivered']} deliveries ({stats['delivered'] / elapsed:.0f}/s)")
+    click.echo(f"publish cost: avg {publish_time / total * 1e6:.0f} us per reading")
+    click.echo(f"delivery latency (oldest event per wakeup): p50 {percentile(0.5):.2f} ms, p99 {percentile(0.99):.2f} ms, max {percentile(1):.2f} ms")
+    click.echo(f"dropped clients: {stats['dropped_clients']}")
+    if stats['dropped_clients']:
+        raise SystemExit(f"{stats['dropped_clients']} client(s) fell behind and were dropped.")
+
+def _stress_app(database_uri):
+    """An app on the stress test's shared database, one per process."""
+    from app import create_app
+    from config import Config
+
+    class StressConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_uri
+        TESTING = True
+        OFFLINE_DETECTION = 'poll'
+        RECENT_READINGS_CAPACITY = 0
+    return create_app(StressConfig)
+
+def _stress_worker(database_uri, hardware_ids, readings, seed, barrier, results):
+    """
+    One ingest worker of stress-alert-transitions: posts readings that flip
+    the temperature rule at random, then checks for offline devices at the
+    same moment as every other worker.
+    """
+    # Imported here to avoid a circular import with the routes module
+    from app.routes import commit_readings
+    app = _stress_app(database_uri)
+    rng = random.Random(seed)
+    retries = 0
+    with app.app_context():
+        barrier.wait()
+        for _ in range(readings):
+            hardware_id = rng.choice(hardware_ids)
+            data = {'temperature': rng.choice((20.0, 40.0))}
+            while True:
+                try:
+                    commit_readings([(device_registry.get(hardware_id), datetime.utcnow(), data)])
+                    break
+                except OperationalError:
+                    retries += 1  # SQLite busy; the device would resend
+        barrier.wait()
+        now = datetime.utcnow() + timedelta(days=1)
+        while True:
+            try:
+                raise_connection_loss_alerts(db.session.execute(offline_devices_query(now)).all(), now)
+                db.session.commit()
+                break
+            except OperationalError:
+                db.session.rollback()
+                retries += 1
+    results.put(retries)
+
+@bp.cli.command('stress-alert-transitions')
+@click.option('--processes', default=4, show_default=True, help='Worker processes ingesting at once.')
+@click.option('--devices', default=3, show_default=True, help='Devices the readings are spread over.')
+@click.option('--readings', default=300, show_default=True, help='Readings posted per process.')
+def stress_alert_transitions(processes, devices, readings):
+    """
+    Runs several ingest processes against one scratch SQLite database, all
+    flipping the same devices' temperature alert, and exits non-zero if any
+    device's AlertLog has a duplicate or lost transition: alerts and
+    recoveries must alternate and end in the state the rule is in. Every
+    process then looks for offline devices at once, which must alert about
+    each device exactly once.
+    """
+    directory = tempfile.mkdtemp(prefix='stress-alerts-')
+    database_uri = 'sqlite:///' + os.path.join(directory, 'stress.db') + '?timeout=30'
+    app = _stress_app(database_uri)
+    hardware_ids = [f'STRESS_{i}' for i in range(devices)]
+    with app.app_context():
+        db.create_all()
+        user = User(full_name='Stress Test', email='stress@example.com', role='user')
+        user.set_password('stress')
+        user.devices = [Device(name=f'Stress {i}', unique_hardware_id=hardware_id) for i, hardware_id in enumerate(hardware_ids)]
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all([AlertRule(device_id=device.id, metric='temperature', high_threshold=30.0) for device in user.devices])
+        db.session.commit()
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = [
+        context.Process(target=_stress_worker, args=(database_uri, hardware_ids, readings, seed, barrier, results))
+        for seed in range(processes)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    retries = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    texts = METRICS['temperature']
+    failures = 0
+    with app.app_context():
+        stored = db.session.query(SensorData).count()
+        click.echo(f"{processes} processes stored {stored} readings in {elapsed:.1f}s ({retries} busy retries)")
+        for device in Device.query.order_by(Device.id):
+            logs = [alert_type for alert_type, in db.session.query(AlertLog.alert_type).filter(
+                AlertLog.device_id == device.id, AlertLog.alert_type != CONNECTION_LOSS
+            ).order_by(AlertLog.id)]
+            # A duplicate or lost transition shows up as the same entry twice in a row
+            out_of_sequence = sum(previous == log for previous, log in zip([texts['Normal'].alert_type] + logs, logs))
+            active = AlertRule.query.filter_by(device_id=device.id).one().active
+            state_ok = active == (bool(logs) and logs[-1] == texts['High'].alert_type) and device.temp_alert_status == active
+            connection_losses = AlertLog.query.filter_by(device_id=device.id, alert_type=CONNECTION_LOSS).count()
+            emails = NotificationOutbox.query.filter_by(device_name=device.name).count()
+            ok = not out_of_sequence and state_ok and connection_losses == 1 and emails == len(logs) + 1
+            failures += not ok
+            click.echo(f"[{'ok' if ok else 'FAIL'}] {device.name}: {len(logs)} transitions, {out_of_sequence} out of sequence, "
+                       f"rule {'in alert' if active else 'normal'} ({'consistent' if state_ok else 'INCONSISTENT'}), "
+                       f"{connection_losses} Connection Loss alert(s), {emails} email(s)")
+    if failures:
+        raise SystemExit(f"{failures} device(s) have duplicate or lost alert transitions.")
+
+@bp.cli.command('benchmark-payloads')
+@click.option('--devices', default=10, show_default=True, help='Devices the readings come from.')
+@click.option('--batch-size', default=100, show_default=True, help='Readings per batch body.')
+@click.option('--seconds', default=0.5, show_default=True, help='How long to decode each format for.')
+def benchmark_payloads(devices, batch_size, seconds):
+    """
+    Compares the ingest body formats: bytes per reading for a single reading
+    (what rpi_monitor.py posts) and for a batch, and how many readings per
+    second the server decodes from each.
+    """
+    rng = random.Random(0)
+    now = time.time()
+    readings = [(f'RPI_SERVER_ROOM_{i % devices:02d}', round(now - batch_size + i, 3), {
+        'temperature': round(rng.uniform(18, 30), 2), 'humidity': round(rng.uniform(30, 60), 2),
+        'ac_voltage': round(rng.uniform(225, 235), 2), 'water_detected': False
+    }) for i in range(batch_size)]
+
+    def as_records(batch):
+        return [{'device_id': hardware_id, 'timestamp': timestamp, 'data': data} for hardware_id, timestamp, data in batch]
+    formats = {'json': ('application/json', lambda batch: json.dumps(as_records(batch)).encode())}
+    if msgpack is not None:
+        formats['msgpack'] = (MSGPACK_TYPES[0], lambda batch: msgpack.packb(as_records(batch)))
+    formats['binary'] = (READINGS_TYPE, pack_readings)
+
+    max_bytes = current_app.config['INGEST_MAX_DECODED_BYTES']
+    click.echo(f"{'format':<16}{'single bytes':>14}{'batch bytes/reading':>22}{'decoded readings/s':>21}")
+    for name, (content_type, encode) in formats.items():
+        for encoding in (None, 'gzip'):
+            compress = gzip.compress if encoding else (lambda body: body)
+            single = compress(encode(readings[:1]))
+            batch = compress(encode(readings))
+            decoded = 0
+            started = time.perf_counter()
+            while time.perf_counter() - started < seconds:
+                records, _ = decode_payload(batch, content_type, encoding, max_bytes)
+                decoded += len(records)
+            rate = decoded / (time.perf_counter() - started)
+            label = name + ('+gzip' if encoding else '')
+            click.echo(f"{label:<16}{len(single):>14}{len(batch) / batch_size:>22.1f}{rate:>21,.0f}")
+    if msgpack is None:
+        click.echo("msgpack is not installed; MessagePack was skipped.")
+
+# sensor_data before the compact layout: surrogate key, text timestamps,
+# float measurements and two secondary indexes
+LEGACY_SENSOR_DATA = """
+CREATE TABLE sensor_data (
+    id INTEGER NOT NULL PRIMARY KEY, temperature FLOAT, humidity FLOAT, ac_voltage FLOAT,
+    water_detected BOOLEAN, timestamp DATETIME, device_id INTEGER
+);
+CREATE INDEX ix_sensor_data_timestamp ON sensor_data (timestamp);
+CREATE INDEX ix_sensor_data_device_id_timestamp ON sensor_data (device_id, timestamp);
+"""
+
+@bp.cli.command('benchmark-storage')
+@click.option('--devices', default=100, show_default=True, help='Devices the readings come from.')
+@click.option('--readings', default=100000, show_default=True, help='Readings per device, one every 30 seconds.')
+@click.option('--directory', default=None, help='Where to build the scratch databases (default: a temporary directory).')
+def benchmark_storage(devices, readings, directory):
+    """
+    Builds sensor_data in the legacy and the compact layout with the same
+    synthetic history (the defaults make 10M rows, about 35 days), then
+    compares file size, bulk insert time and the range scans /history
+    issues. Needs a few GB of free disk with the defaults.
+    """
+    directory = directory or tempfile.mkdtemp(prefix='benchmark-storage-')
+    os.makedirs(directory, exist_ok=True)
+    base = datetime(2026, 1, 1)
+    def generate(compact):
+        rng = random.Random(1)
+        for i in range(readings):
+            timestamp = base + timedelta(seconds=30 * i)
+            for device_id in range(1, devices + 1):
+                temperature, humidity, voltage = (round(rng.uniform(low, high), 2) for low, high in ((18, 32), (30, 70), (220, 240)))
+                if compact:
+                    yield device_id, to_epoch_ms(timestamp), round(temperature * 100), round(humidity * 100), round(voltage * 100), 0
+                else:
+                    yield temperature, humidity, voltage, 0, timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'), device_id
+
+    layouts = {
+        'legacy': ("INSERT INTO sensor_data (temperature, humidity, ac_voltage, water_detected, timestamp, device_id) "
+                   "VALUES (?, ?, ?, ?, ?, ?)", 'timestamp', lambda value: value.strftime('%Y-%m-%d %H:%M:%S.%f')),
+        'compact': ("INSERT INTO sensor_data (device_id, ts_epoch_ms, temperature, humidity, ac_voltage, water_detected) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", 'ts_epoch_ms', to_epoch_ms),
+    }
+    ranges = (('1 device x 1 day', 1, 1, 300), ('1 device x 7 days', 1, 7, 100),
+              ('10 devices x 1 day', 10, 1, 50), (f'{devices} devices x 1 day', devices, 1, 10))
+    days_stored = readings * 30 / 86400
+    results = {}
+    for name, (insert_sql, time_column, bind) in layouts.items():
+        path = os.path.join(directory, f'{name}.db')
+        if os.path.exists(path):
+            os.remove(path)
+        engine = create_engine(f'sqlite:///{path}')
+        with engine.begin() as conn:
+            if name == 'compact':
+                SensorData.__table__.create(conn)
+            else:
+                for statement in LEGACY_SENSOR_DATA.split(';'):
+                    if statement.strip():
+                        conn.execute(text(statement))
+        engine.dispose()
+        conn = sqlite3.connect(path)
+        started = time.perf_counter()
+        conn.executemany(insert_sql, generate(name == 'compact'))
+        conn.commit()
+        results[name] = {'file size': f'{os.path.getsize(path) / 2 ** 20:.0f} MB',
+                         'bulk insert': f'{time.perf_counter() - started:.0f} s'}
+        conn.execute('ANALYZE')
+        rng = random.Random(2)
+        for label, device_count, days, repeats in ranges:
+            if days >= days_stored:
+                continue
+            total = 0
+            started = None
+            for attempt in range(repeats + 1):  # The first run only warms the cache
+                device_ids = rng.sample(range(1, devices + 1), min(device_count, devices))
+                start = base + timedelta(days=rng.uniform(0, days_stored - days))
+                marks = ', '.join('?' * len(device_ids))
+                rows = conn.execute(
+                    f"SELECT * FROM sensor_data WHERE device_id IN ({marks}) AND {time_column} >= ? AND {time_column} < ? "
+                    f"ORDER BY {time_column}", (*device_ids, bind(start), bind(start + timedelta(days=days)))
+                ).fetchall()
+                if attempt == 0:
+                    started = time.perf_counter()
+                else:
+                    total += len(rows)
+            elapsed = (time.perf_counter() - started) / repeats * 1000
+            results[name][label] = f'{elapsed:.1f} ms ({total // repeats} rows)'
+        conn.close()
+
+    click.echo(f"{devices * readings:,} readings from {devices} devices over {days_stored:.0f} days, in {directory}")
+    click.echo(f"{'':<24}{'legacy':>24}{'compact':>24}")
+    for label in results['legacy']:
+        click.echo(f"{label:<24}{results['legacy'][label]:>24}{results['compact'][label]:>24}")
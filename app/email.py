@@ -1,8 +1,10 @@
 # /app/email.py
 
+from datetime import datetime, timedelta
 from flask_mail import Message
-from app import mail # We will create this 'mail' object in the next step
+from app import db, mail
 from flask import current_app
+from app.models import NotificationOutbox
 
 def send_alert_email(recipient, subject, body):
     """Sends an email alert."""
@@ -12,4 +14,183 @@ def send_alert_email(recipient, subject, body):
         mail.send(msg)
         print(f"Alert email sent successfully to {recipient}")
     except Exception as e:
-        print(f"Error sending email: {e}")
\ No newline at end of file
+        print(f"Error sending email: {e}")
+
+def _held_until(kind):
+    """When an email of `kind` becomes due; alerts wait for a digest window."""
+    now = datetime.utcnow()
+    if kind == 'alert':
+        return now + timedelta(seconds=current_app.config['ALERT_DIGEST_SECONDS'])
+    return now
+
+def queue_alert_email(recipient, subject, body, kind='message', device_name=None):
+    """
+    Adds an email to the notification outbox. Nothing is sent here: the row is
+    written with the caller's transaction and delivered later by the worker
+    (see notification_worker.py), so request latency never depends on SMTP.
+    Emails of kind 'alert' are held for ALERT_DIGEST_SECONDS so that a burst
+    of them reaches each recipient as one digest.
+    """
+    db.session.add(NotificationOutbox(
+        recipient=recipient, subject=subject, body=body, kind=kind,
+        device_name=device_name, next_attempt_at=_held_until(kind)
+    ))
+
+def queue_alert_emails(messages, kind='alert'):
+    """
+    Bulk version of queue_alert_email for (recipient, subject, body,
+    device name) tuples.
+    """
+    if messages:
+        next_attempt_at = _held_until(kind)
+        db.session.execute(db.insert(NotificationOutbox), [
+            {'recipient': recipient, 'subject': subject, 'body': body, 'kind': kind,
+             'device_name': device_name, 'next_attempt_at': next_attempt_at}
+            for recipient, subject, body, device_name in messages
+        ])
+
+def _digest(recipient, items):
+    """Subject and body of a digest of outbox alert emails, oldest first."""
+    devices = list(dict.fromkeys(item.device_name for item in items if item.device_name))
+    subject = f"Alert digest: {len(items)} notifications for {len(devices)} device(s)"
+    lines = [
+        f"{len(items)} alert notifications for {recipient} were grouped into this digest.",
+        "",
+        f"Affected devices: {', '.join(devices) or '-'}",
+    ]
+    for item in items:
+        lines += ["", f"{item.created_at:%Y-%m-%d %H:%M:%S} UTC  {item.subject}", item.body]
+    return subject, "\n".join(lines)
+
+def coalesce_alert_emails(now=None):
+    """
+    Once the oldest held alert of a recipient is due, folds all of that
+    recipient's held alerts into a single digest email. A recipient with
+    just one is sent it as is. Returns the number of digests queued; the
+    caller commits.
+    """
+    now = now or datetime.utcnow()
+    held = (NotificationOutbox.status == 'pending', NotificationOutbox.kind == 'alert')
+    due = db.select(NotificationOutbox.recipient).where(*held, NotificationOutbox.next_attempt_at <= now)
+    items = db.session.execute(
+        db.select(NotificationOutbox).where(*held, NotificationOutbox.recipient.in_(due))
+        .order_by(NotificationOutbox.recipient, NotificationOutbox.created_at, NotificationOutbox.id)
+    ).scalars().all()
+    by_recipient = {}
+    for item in items:
+        by_recipient.setdefault(item.recipient, []).append(item)
+
+    digests = 0
+    for recipient, group in by_recipient.items():
+        if len(group) < 2:
+            continue
+        subject, body = _digest(recipient, group)
+        db.session.add(NotificationOutbox(recipient=recipient, subject=subject, body=body, kind='digest', next_attempt_at=now))
+        for item in group:
+            item.status = 'merged'
+        digests += 1
+    return digests
+
+def _schedule_retry(item, error):
+    """Records a failed delivery attempt and backs off exponentially."""
+    item.attempts += 1
+    item.last_error = str(error)[:255]
+    if item.attempts >= current_app.config['OUTBOX_MAX_ATTEMPTS']:
+        item.status = 'failed'
+        print(f"Giving up on email to {item.recipient} after {item.attempts} attempts: {error}")
+        return
+    delay = min(
+        current_app.config['OUTBOX_RETRY_BASE_SECONDS'] * 2 ** (item.attempts - 1),
+        current_app.config['OUTBOX_RETRY_MAX_SECONDS']
+    )
+    item.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+    print(f"Error sending email to {item.recipient} (attempt {item.attempts}), retrying in {delay}s: {error}")
+
+def deliver_pending_emails(batch_size=None):
+    """
+    Sends due outbox emails over a single SMTP connection and records the
+    outcome of each one. Returns the number of emails processed.
+    """
+    batch_size = batch_size or current_app.config['OUTBOX_BATCH_SIZE']
+    now = datetime.utcnow()
+    digests = coalesce_alert_emails(now)
+    if digests:
+        db.session.commit()
+        print(f"Folded held alert emails into {digests} digest(s).")
+    pending = NotificationOutbox.query.filter(
+        NotificationOutbox.status == 'pending',
+        NotificationOutbox.next_attempt_at <= now
+    ).order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id).limit(batch_size).all()
+    if not pending:
+        return 0
+
+    sender = current_app.config['MAIL_DEFAULT_SENDER']
+    remaining = list(pending)
+    try:
+        with mail.connect() as conn:
+            while remaining:
+                item = remaining[0]
+                msg = Message(item.subject, sender=sender, recipients=[item.recipient])
+                msg.body = item.body
+                try:
+                    conn.send(msg)
+                    item.status = 'sent'
+                    item.attempts += 1
+                    item.sent_at = datetime.utcnow()
+                except Exception as e:
+                    _schedule_retry(item, e)
+                remaining.pop(0)
+    except Exception as e:
+        # The connection itself failed; everything not yet attempted is retried later.
+        for item in remaining:
+            _schedule_retry(item, e)
+
+    db.session.commit()
+    return len(pending)
+
+def notification_stats(minutes=None):
+    """
+    Outbox counters over the last NOTIFICATION_STATS_MINUTES: emails sent
+    over SMTP, emails queued by kind, alerts folded into digests, and both
+    per recipient. `pending` and `failed` are the current totals.
+    """
+    minutes = minutes or current_app.config['NOTIFICATION_STATS_MINUTES']
+    since = datetime.utcnow() - timedelta(minutes=minutes)
+    count = db.func.count(NotificationOutbox.id)
+    queued = db.session.execute(
+        db.select(NotificationOutbox.recipient, NotificationOutbox.kind, NotificationOutbox.status, count)
+        .where(NotificationOutbox.created_at >= since)
+        .group_by(NotificationOutbox.recipient, NotificationOutbox.kind, NotificationOutbox.status)
+    ).all()
+    sent = db.session.execute(
+        db.select(NotificationOutbox.recipient, count)
+        .where(NotificationOutbox.status == 'sent', NotificationOutbox.sent_at >= since)
+        .group_by(NotificationOutbox.recipient)
+    ).all()
+    backlog = dict(db.session.execute(
+        db.select(NotificationOutbox.status, count)
+        .where(NotificationOutbox.status.in_(('pending', 'failed')))
+        .group_by(NotificationOutbox.status)
+    ).all())
+
+    by_kind, recipients, merged = {}, {}, 0
+    for recipient, kind, status, n in queued:
+        per_recipient = recipients.setdefault(recipient, {'queued': 0, 'merged': 0, 'sent': 0})
+        if kind == 'digest':
+            continue  # Counted when sent; its alerts were counted as queued
+        by_kind[kind] = by_kind.get(kind, 0) + n
+        per_recipient['queued'] += n
+        if status == 'merged':
+            per_recipient['merged'] += n
+            merged += n
+    for recipient, n in sent:
+        recipients.setdefault(recipient, {'queued': 0, 'merged': 0, 'sent': 0})['sent'] = n
+    return {
+        'window_minutes': minutes,
+        'smtp_sent': sum(n for _, n in sent),
+        'queued': by_kind,
+        'merged_into_digests': merged,
+        'pending': backlog.get('pending', 0),
+        'failed': backlog.get('failed', 0),
+        'per_recipient': recipients
+    }
@@ -0,0 +1,167 @@
+# /app/events.py
+
+import json
+import threading
+import time
+from collections import deque
+from flask import current_app
+from app.access import access_index
+
+def sse_frame(event, data):
+    """Encodes one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+class Subscriber:
+    """One /stream connection: its user, the devices it may see and its bounded buffer."""
+
+    def __init__(self, device_ids, buffer_size, user_id=None):
+        self.device_ids = frozenset(device_ids)
+        self.user_id = user_id
+        self.buffer_size = buffer_size
+        self.frames = deque()
+        self.ready = threading.Event()
+        # Called from the publishing thread whenever `ready` is set, so a
+        # reader on an event loop can be woken without a waiting thread
+        self.waker = None
+        self.dropped = False
+        # True while the hub delivers to it
+        self.active = False
+
+    def put(self, frame):
+        """Buffers a frame; returns False if the buffer is full."""
+        if len(self.frames) >= self.buffer_size:
+            return False
+        self.frames.append(frame)
+        if not self.ready.is_set():
+            self.wake()
+        return True
+
+    def wake(self):
+        self.ready.set()
+        if self.waker is not None:
+            self.waker()
+
+    def get_all(self, timeout, linger=0.0):
+        """
+        Waits up to `timeout` seconds and returns every buffered frame
+        (possibly none). After the first frame arrives it lingers for
+        `linger` seconds to collect more, so a busy client is woken at most
+        once per linger period instead of once per event.
+        """
+        if self.ready.wait(timeout) and linger:
+            time.sleep(linger)
+        return self.drain()
+
+    def drain(self):
+        """Returns every buffered frame without waiting."""
+        # Clear before draining: a frame added meanwhile sets it again
+        self.ready.clear()
+        frames = []
+        while self.frames:
+            frames.append(self.frames.popleft())
+        return frames
+
+class EventHub:
+    """
+    In-process fan-out of live readings and alert transitions to /stream
+    clients. Subscribers are indexed by device, so publishing costs one
+    non-blocking put per interested client. Each event is encoded once. A
+    client whose buffer is full is dropped (its stream ends and the browser
+    reconnects and resyncs) rather than slowing ingest down.
+    """
+
+    def __init__(self, buffer_size):
+        self.buffer_size = buffer_size
+        self._by_device = {}
+        self._lock = threading.Lock()
+        self.subscribers = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, device_ids, user_id=None):
+        subscriber = Subscriber(device_ids, self.buffer_size, user_id)
+        with self._lock:
+            self._add(subscriber)
+            subscriber.active = True
+            self.subscribers += 1
+        return subscriber
+
+    def _add(self, subscriber):
+        for device_id in subscriber.device_ids:
+            self._by_device.setdefault(device_id, set()).add(subscriber)
+
+    def refresh_access(self, subscriber):
+        """
+        Re-reads the devices the subscriber's user is assigned from the
+        access index (needs an app context), so an open stream follows
+        assignment changes instead of keeping the set it subscribed with.
+        """
+        device_ids = access_index.device_ids(subscriber.user_id)
+        with self._lock:
+            if not subscriber.active or device_ids == subscriber.device_ids:
+                return
+            for device_id in subscriber.device_ids - device_ids:
+                subscribers = self._by_device.get(device_id)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._by_device[device_id]
+            subscriber.device_ids = device_ids
+            self._add(subscriber)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._remove(subscriber)
+
+    def _remove(self, subscriber):
+        if not subscriber.active:
+            return
+        for device_id in subscriber.device_ids:
+            subscribers = self._by_device.get(device_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._by_device[device_id]
+        subscriber.active = False
+        self.subscribers -= 1
+
+    def publish(self, device_id, event, data):
+        """Queues an event for every subscriber allowed to see `device_id`."""
+        frame = sse_frame(event, data)
+        with self._lock:
+            self.published += 1
+            subscribers = self._by_device.get(device_id)
+            if not subscribers:
+                return
+            for subscriber in list(subscribers):
+                if subscriber.put(frame):
+                    self.delivered += 1
+                else:
+                    subscriber.dropped = True
+                    subscriber.wake()
+                    self.dropped += 1
+                    self._remove(subscriber)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': self.subscribers,
+                'published': self.published,
+                'delivered': self.delivered,
+                'dropped_clients': self.dropped,
+                'buffer_size': self.buffer_size
+            }
+
+_hub_lock = threading.Lock()
+
+def get_event_hub():
+    """Returns the app's event hub, creating it on first use."""
+    app = current_app._get_current_object()
+    hub = app.extensions.get('event_hub')
+    if hub is None:
+        with _hub_lock:
+            hub = app.extensions.get('event_hub')
+            if hub is None:
+                hub = app.extensions['event_hub'] = EventHub(app.config['EVENTS_CLIENT_BUFFER'])
+    return hub
@@ -3,7 +3,46 @@
 from app import db
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
-from datetime import datetime
+from sqlalchemy.orm import declared_attr
+from datetime import datetime, timezone
+from app.timeutil import from_epoch_ms, to_epoch_ms
+
+# --- Compact column types used by the SensorData table ---
+class EpochMillis(db.TypeDecorator):
+    """Naive UTC datetime stored as integer milliseconds since the epoch."""
+    impl = db.BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return to_epoch_ms(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return from_epoch_ms(value)
+
+class ScaledFloat(db.TypeDecorator):
+    """Float stored as an integer number of 1/scale units (e.g. centi-degrees)."""
+    impl = db.Integer
+    cache_ok = True
+
+    def __init__(self, scale=100):
+        super().__init__()
+        self.scale = scale
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else int(round(float(value) * self.scale))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else value / self.scale
+
+def truncate_to_millis(timestamp):
+    """Drops sub-millisecond precision, which the SensorData table cannot store."""
+    return timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
 
 # Association table to link users and devices
 user_device_association = db.Table('user_device_association',
@@ -40,43 +79,184 @@ class Device(db.Model):
     name = db.Column(db.String(120), nullable=False)
     unique_hardware_id = db.Column(db.String(120), unique=True, nullable=False)
     category = db.Column(db.String(120), default='default')
-    
-    # --- All Alert Thresholds ---
-    temp_threshold_high = db.Column(db.Float)
-    humidity_threshold_low = db.Column(db.Float)
-    humidity_threshold_high = db.Column(db.Float)
-    alert_on_water = db.Column(db.Boolean, default=True)
-    # --- NEW VOLTAGE THRESHOLDS ---
-    voltage_threshold_low = db.Column(db.Float)
-    voltage_threshold_high = db.Column(db.Float)
+
+    # Alert thresholds are AlertRule rows (see app/rules.py)
 
     # --- All Alert Statuses ---
+    # Whether any of the device's rules on the metric is in alert; kept in
+    # step by the rule engine and read by the dashboards
     temp_alert_status = db.Column(db.Boolean, default=False)
     humidity_alert_status = db.Column(db.Boolean, default=False)
     water_alert_status = db.Column(db.Boolean, default=False)
     # --- NEW VOLTAGE STATUS ---
     voltage_alert_status = db.Column(db.Boolean, default=False)
+    # Bumped by every change to the device's alert state (its status flags,
+    # its rules' state, Connection Loss alerts). Writers compare-and-set it,
+    # so two processes can never both act on the same old state.
+    alert_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # --- Connection Loss Settings (minutes; NULL uses the app defaults) ---
+    offline_after_minutes = db.Column(db.Integer)
+    realert_after_minutes = db.Column(db.Integer)
 
 
     # Relationships
-    sensor_data = db.relationship('SensorData', backref='device', lazy='dynamic')
+    # device_id is part of a reading's primary key, so readings go with their device
+    sensor_data = db.relationship('SensorData', backref='device', lazy='dynamic', cascade='all, delete-orphan')
     alerts = db.relationship('AlertLog', backref='device', lazy='dynamic')
+    rules = db.relationship('AlertRule', backref='device', lazy='dynamic', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Device {self.name}>'
 
 class SensorData(db.Model):
-    """Represents a single data log from a device's sensors."""
-    id = db.Column(db.Integer, primary_key=True)
+    """
+    Represents a single data log from a device's sensors.
+
+    Readings are only ever looked up by device and time range, so the table
+    is clustered on (device_id, timestamp) instead of a surrogate id: on
+    SQLite it is a WITHOUT ROWID table whose primary key is the only index.
+    Timestamps are stored as epoch milliseconds and measurements as scaled
+    integers, which SQLite packs into 1-6 bytes each. A device therefore
+    stores at most one reading per millisecond.
+    """
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), primary_key=True)
+    timestamp = db.Column('ts_epoch_ms', EpochMillis, key='timestamp', primary_key=True, default=datetime.utcnow)
+    temperature = db.Column(ScaledFloat(100))
+    humidity = db.Column(ScaledFloat(100))
+    ac_voltage = db.Column(ScaledFloat(100))
+    water_detected = db.Column(db.Boolean, default=False)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    def __repr__(self):
+        return f'<SensorData from Device {self.device_id} at {self.timestamp}>'
+
+class DeviceLatest(db.Model):
+    """Holds the most recent reading of each device, upserted by ingest."""
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), primary_key=True)
     temperature = db.Column(db.Float)
     humidity = db.Column(db.Float)
     ac_voltage = db.Column(db.Float)
     water_detected = db.Column(db.Boolean, default=False)
-    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
-    device_id = db.Column(db.Integer, db.ForeignKey('device.id'))
+    timestamp = db.Column(db.DateTime, nullable=False)
+    # Server time of the last change to this device's dashboard state (new
+    # reading, alert status or device details); drives /api/dashboard?since=
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    device = db.relationship('Device', backref=db.backref('latest', uselist=False, cascade='all, delete-orphan'))
 
     def __repr__(self):
-        return f'<SensorData from Device {self.device_id} at {self.timestamp}>'
+        return f'<DeviceLatest for Device {self.device_id} at {self.timestamp}>'
+
+class SensorRollupMixin:
+    """
+    Columns shared by the rollup tables (one per bucket length in
+    app.rollups.RESOLUTIONS). Each row aggregates every reading of one
+    device inside one time bucket.
+    """
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    reading_count = db.Column(db.Integer, default=0, nullable=False)
+    temperature_min = db.Column(db.Float)
+    temperature_max = db.Column(db.Float)
+    temperature_sum = db.Column(db.Float)
+    temperature_count = db.Column(db.Integer, default=0, nullable=False)
+    humidity_min = db.Column(db.Float)
+    humidity_max = db.Column(db.Float)
+    humidity_sum = db.Column(db.Float)
+    humidity_count = db.Column(db.Integer, default=0, nullable=False)
+    ac_voltage_min = db.Column(db.Float)
+    ac_voltage_max = db.Column(db.Float)
+    ac_voltage_sum = db.Column(db.Float)
+    ac_voltage_count = db.Column(db.Integer, default=0, nullable=False)
+    # True if water was detected at any point in the bucket
+    water_detected = db.Column(db.Boolean, default=False)
+
+    @declared_attr
+    def device(cls):
+        return db.relationship('Device')
+
+    # --- Averages, exposed under the raw reading names so rollup rows
+    # --- can be rendered wherever SensorData rows are.
+    @property
+    def timestamp(self):
+        return self.bucket
+
+    @property
+    def temperature(self):
+        return self.temperature_sum / self.temperature_count if self.temperature_count else None
+
+    @property
+    def humidity(self):
+        return self.humidity_sum / self.humidity_count if self.humidity_count else None
+
+    @property
+    def ac_voltage(self):
+        return self.ac_voltage_sum / self.ac_voltage_count if self.ac_voltage_count else None
+
+class SensorRollupMinute(SensorRollupMixin, db.Model):
+    """Per-minute aggregates of SensorData."""
+
+class SensorRollupFiveMinute(SensorRollupMixin, db.Model):
+    """Per-5-minute aggregates of SensorData."""
+
+class SensorRollupQuarterHour(SensorRollupMixin, db.Model):
+    """Per-15-minute aggregates of SensorData."""
+
+class SensorRollupHour(SensorRollupMixin, db.Model):
+    """Per-hour aggregates of SensorData."""
+
+class SensorRollupSixHour(SensorRollupMixin, db.Model):
+    """Per-6-hour aggregates of SensorData."""
+
+class SensorRollupDay(SensorRollupMixin, db.Model):
+    """Per-day aggregates of SensorData."""
+
+class AlertRule(db.Model):
+    """
+    One alert condition of a device: `metric` (a reading field) going below
+    `low_threshold` or above `high_threshold`. The alert fires once the
+    condition has held for `min_duration_seconds` and clears once the value
+    is back inside the thresholds by at least `hysteresis`.
+
+    The rule's alert state is kept on the row: `active` while in alert, and
+    `pending_since` from the first reading of a run that breaks the rule.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable=False, index=True)
+    metric = db.Column(db.String(64), nullable=False)
+    low_threshold = db.Column(db.Float)
+    high_threshold = db.Column(db.Float)
+    hysteresis = db.Column(db.Float, nullable=False, default=0.0)
+    min_duration_seconds = db.Column(db.Integer, nullable=False, default=0)
+
+    # --- Alert State ---
+    active = db.Column(db.Boolean, nullable=False, default=False)
+    pending_since = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<AlertRule {self.metric} for Device {self.device_id}>'
+
+class ReportingPolicy(db.Model):
+    """
+    How often the devices of a category are asked to report (see
+    app/reporting.py): every `fast_seconds` while in or near an alert,
+    `normal_seconds` while their readings change and `slow_seconds` while
+    they are stable. The 'default' category covers every other device.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    category = db.Column(db.String(120), unique=True, nullable=False)
+    fast_seconds = db.Column(db.Integer, nullable=False, default=10)
+    normal_seconds = db.Column(db.Integer, nullable=False, default=60)
+    slow_seconds = db.Column(db.Integer, nullable=False, default=300)
+    # Within this percentage of a rule threshold counts as near an alert
+    near_alert_percent = db.Column(db.Float, nullable=False, default=10.0)
+    # Readings moving less than this percentage per minute count as stable
+    stable_change_percent = db.Column(db.Float, nullable=False, default=1.0)
+
+    def __repr__(self):
+        return f'<ReportingPolicy {self.category}>'
 
 class AlertLog(db.Model):
     """Represents a single alert event in the system."""
@@ -86,5 +266,33 @@ class AlertLog(db.Model):
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     device_id = db.Column(db.Integer, db.ForeignKey('device.id'))
 
+    __table_args__ = (
+        db.Index('ix_alert_log_device_id_timestamp', 'device_id', 'timestamp'),
+        db.Index('ix_alert_log_device_id_alert_type_timestamp', 'device_id', 'alert_type', 'timestamp'),
+    )
+
     def __repr__(self):
         return f'<AlertLog for Device {self.device_id} at {self.timestamp}>'
+
+class NotificationOutbox(db.Model):
+    """Represents an email notification waiting to be delivered by the worker."""
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    # 'message' (e.g. welcome emails), 'alert' (may be folded into a digest),
+    # 'critical' (an alert that is never held back) or 'digest'
+    kind = db.Column(db.String(10), default='message', server_default='message', nullable=False)
+    # Device the alert is about, listed in digests
+    device_name = db.Column(db.String(120))
+    # 'pending' until delivered ('sent'), out of retries ('failed') or folded
+    # into a digest ('merged')
+    status = db.Column(db.String(10), default='pending', nullable=False, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, index=True)
+
+    def __repr__(self):
+        return f'<NotificationOutbox to {self.recipient} ({self.status})>'
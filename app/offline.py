@@ -0,0 +1,335 @@
+# /app/offline.py
+
+import atexit
+import heapq
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models import Device, DeviceLatest, AlertLog
+from app.email import queue_alert_emails
+
+CONNECTION_LOSS = 'Connection Loss'
+
+# TODO: Make the recipient dynamic in the future
+ADMIN_EMAIL = 'admin@example.com'
+
+def connection_settings(device):
+    """
+    (offline after, re-alert after) of a device as minutes. A device is
+    offline once it has not reported for the first, and is alerted about
+    again at most once per the second. NULL columns use the app defaults.
+    """
+    config = current_app.config
+    return (
+        device.offline_after_minutes or config['OFFLINE_AFTER_MINUTES'],
+        device.realert_after_minutes or config['REALERT_AFTER_MINUTES']
+    )
+
+def _setting_columns():
+    config = current_app.config
+    return (
+        db.func.coalesce(Device.offline_after_minutes, config['OFFLINE_AFTER_MINUTES']),
+        db.func.coalesce(Device.realert_after_minutes, config['REALERT_AFTER_MINUTES'])
+    )
+
+def _minutes_before(now, minutes):
+    """SQL for `now` minus a per-row number of minutes."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return db.literal(now, db.DateTime) - db.func.make_interval(0, 0, 0, 0, 0, minutes)
+    # SQLite keeps DateTime as 'YYYY-MM-DD HH:MM:SS.ffffff' text, which
+    # compares correctly with what datetime() returns
+    return db.func.datetime(db.literal(now, db.DateTime), db.func.printf('-%d minutes', minutes))
+
+def offline_devices_query(now):
+    """
+    (device id, name, offline after minutes, alert version) of every device
+    that is offline at `now` and has no recent Connection Loss alert, in a
+    single statement. Devices that never reported are offline too.
+    """
+    offline_after, realert_after = _setting_columns()
+    recent_alert = db.select(AlertLog.id).where(
+        AlertLog.device_id == Device.id,
+        AlertLog.alert_type == CONNECTION_LOSS,
+        AlertLog.timestamp > _minutes_before(now, realert_after)
+    ).exists()
+    return db.select(Device.id, Device.name, offline_after, Device.alert_version).outerjoin(
+        DeviceLatest, DeviceLatest.device_id == Device.id
+    ).where(
+        db.or_(DeviceLatest.timestamp.is_(None), DeviceLatest.timestamp < _minutes_before(now, offline_after)),
+        ~recent_alert
+    )
+
+def connection_state_query(device_ids=None):
+    """
+    (device id, name, offline after, re-alert after, last seen, last
+    Connection Loss alert, alert version) per device, for the offline monitor.
+    """
+    offline_after, realert_after = _setting_columns()
+    last_alert = db.select(db.func.max(AlertLog.timestamp)).where(
+        AlertLog.device_id == Device.id,
+        AlertLog.alert_type == CONNECTION_LOSS
+    ).scalar_subquery()
+    query = db.select(
+        Device.id, Device.name, offline_after, realert_after, DeviceLatest.timestamp, last_alert, Device.alert_version
+    ).outerjoin(DeviceLatest, DeviceLatest.device_id == Device.id)
+    if device_ids is not None:
+        query = query.where(Device.id.in_(device_ids))
+    return query
+
+def raise_connection_loss_alerts(devices, now):
+    """
+    Bulk-inserts a Connection Loss AlertLog row and an outbox email for
+    each (device id, name, offline after minutes, alert version). Each
+    device is first claimed by bumping its alert_version if it still has the
+    version that was read, in one UPDATE; a device whose version moved on
+    was alerted about by another checker or has reported meanwhile, and is
+    skipped. Returns the devices alerted about; the caller commits.
+    """
+    if not devices:
+        return []
+    claimed = set(db.session.execute(
+        db.update(Device).where(
+            db.tuple_(Device.id, Device.alert_version).in_([(device[0], device[3]) for device in devices])
+        ).values(alert_version=Device.alert_version + 1).returning(Device.id)
+    ).scalars())
+    devices = [device for device in devices if device[0] in claimed]
+    alerts, emails = [], []
+    for device_id, name, offline_after, _ in devices:
+        message = f"Connection Loss Alert for device '{name}'. No data has been received in over {offline_after} minutes."
+        alerts.append({'device_id': device_id, 'alert_type': CONNECTION_LOSS, 'message': message, 'timestamp': now})
+        emails.append((ADMIN_EMAIL, f"Device Offline: {name}", message, name))
+    if alerts:
+        db.session.execute(db.insert(AlertLog), alerts)
+        queue_alert_emails(emails)
+    return devices
+
+class OfflineMonitor:
+    """
+    Event-driven connection loss detection, used when OFFLINE_DETECTION is
+    'event'. Ingest records when each device was last seen; a min-heap
+    holds the time each device goes offline, and one thread sleeps until
+    the earliest of them.
+
+    The heap has one entry per device and is not touched on every reading:
+    when an entry comes due for a device that has reported since, it is
+    simply pushed back to its new deadline. Only devices whose in-memory
+    deadline has really passed are checked against the database (which also
+    catches readings committed by other processes) and alerted about.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._heap = []
+        self._scheduled = {}      # device id -> time of its live heap entry
+        self._last_seen = {}      # device id -> newest reading timestamp
+        self._offline_after = {}  # device id -> timedelta
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='offline-monitor', daemon=True)
+        self.wakeups = 0
+        self.rescheduled = 0
+        self.checked = 0
+        self.alerts = 0
+
+    def warm_up(self):
+        """Schedules every device from the database."""
+        now = datetime.utcnow()
+        rows = db.session.execute(connection_state_query()).all()
+        with self._cond:
+            for row in rows:
+                when, alert = self._deadline_from_state(row, now)
+                self._schedule(row.id, now if alert else when)
+                self._offline_after[row.id] = timedelta(minutes=row[2])
+                if row[4] is not None:
+                    self._last_seen[row.id] = row[4]
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+
+    def _schedule(self, device_id, when):
+        """Moves a device's heap entry to `when`; the old entry goes stale."""
+        self._scheduled[device_id] = when
+        heapq.heappush(self._heap, (when, device_id))
+        if self._heap[0] == (when, device_id):
+            self._cond.notify()
+
+    def seen(self, last_seen):
+        """Records committed readings given as {device id: newest timestamp}."""
+        default = timedelta(minutes=self.app.config['OFFLINE_AFTER_MINUTES'])
+        with self._cond:
+            for device_id, timestamp in last_seen.items():
+                previous = self._last_seen.get(device_id)
+                if previous is not None and previous >= timestamp:
+                    continue
+                self._last_seen[device_id] = timestamp
+                # A later deadline is picked up lazily when the entry comes due
+                deadline = timestamp + self._offline_after.get(device_id, default)
+                scheduled = self._scheduled.get(device_id)
+                if scheduled is None or deadline < scheduled:
+                    self._schedule(device_id, deadline)
+
+    def update_settings(self, device):
+        """
+        Applies a device's (possibly changed) settings, e.g. after an admin
+        edit, by looking at the device again right away.
+        """
+        with self._cond:
+            self._offline_after[device.id] = timedelta(minutes=connection_settings(device)[0])
+            self._schedule(device.id, datetime.utcnow())
+
+    def forget(self, device_id):
+        with self._cond:
+            self._scheduled.pop(device_id, None)
+            self._last_seen.pop(device_id, None)
+            self._offline_after.pop(device_id, None)
+
+    def _pop_due(self, now):
+        """Pops the devices whose in-memory deadline has passed."""
+        default = timedelta(minutes=self.app.config['OFFLINE_AFTER_MINUTES'])
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, device_id = heapq.heappop(self._heap)
+            if self._scheduled.get(device_id) != when:
+                continue  # Stale entry
+            last_seen = self._last_seen.get(device_id)
+            if last_seen is not None:
+                deadline = last_seen + self._offline_after.get(device_id, default)
+                if deadline > now:
+                    # Reported since the entry was pushed
+                    self._schedule(device_id, deadline)
+                    self.rescheduled += 1
+                    continue
+            del self._scheduled[device_id]
+            due.append(device_id)
+        return due
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                now = datetime.utcnow()
+                due = self._pop_due(now)
+                if not due:
+                    timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+                self.wakeups += 1
+            with self.app.app_context():
+                try:
+                    self._check(due)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error checking {len(due)} devices for connection loss: {e}")
+                    # Try again a minute later rather than losing the devices
+                    retry = datetime.utcnow() + timedelta(minutes=1)
+                    with self._cond:
+                        for device_id in due:
+                            if device_id not in self._scheduled:
+                                self._schedule(device_id, retry)
+
+    @staticmethod
+    def _deadline_from_state(row, now):
+        """
+        (next time to look at the device, whether to alert now) from a
+        connection_state_query row.
+        """
+        device_id, name, offline_after, realert_after, last_seen, last_alert, _ = row
+        offline_at = last_seen + timedelta(minutes=offline_after) if last_seen is not None else now
+        if offline_at > now:
+            return offline_at, False
+        if last_alert is not None and last_alert + timedelta(minutes=realert_after) > now:
+            return last_alert + timedelta(minutes=realert_after), False
+        return now + timedelta(minutes=realert_after), True
+
+    def _check(self, device_ids):
+        """Confirms expired devices against the database and alerts about them."""
+        now = datetime.utcnow()
+        rows = db.session.execute(connection_state_query(device_ids)).all()
+        offline, schedule = [], {}
+        for row in rows:
+            schedule[row.id], alert = self._deadline_from_state(row, now)
+            if alert:
+                offline.append((row.id, row.name, row[2], row.alert_version))
+        offline = raise_connection_loss_alerts(offline, now)
+        db.session.commit()
+        for _, name, _, _ in offline:
+            print(f"ALERT: Device '{name}' appears to be offline. Sending notification.")
+        with self._cond:
+            self.checked += len(device_ids)
+            self.alerts += len(offline)
+            for row in rows:
+                self._offline_after[row.id] = timedelta(minutes=row[2])
+                last_seen = self._last_seen.get(row.id)
+                if row[4] is not None and (last_seen is None or last_seen < row[4]):
+                    self._last_seen[row.id] = row[4]
+                # A reading may have moved the device meanwhile
+                if row.id not in self._scheduled:
+                    self._schedule(row.id, schedule[row.id])
+            for device_id in set(device_ids) - schedule.keys():
+                # Deleted meanwhile
+                self._last_seen.pop(device_id, None)
+                self._offline_after.pop(device_id, None)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'devices': len(self._scheduled),
+                'heap_entries': len(self._heap),
+                'next_deadline': self._heap[0][0].isoformat() if self._heap else None,
+                'wakeups': self.wakeups,
+                'rescheduled': self.rescheduled,
+                'checked': self.checked,
+                'alerts': self.alerts
+            }
+
+_monitor_lock = threading.Lock()
+
+def start_offline_monitor(app):
+    """
+    Starts the offline monitor when the server starts (run.py, asgi.py), so
+    devices that stay silent after a restart are still alerted about when
+    nobody posts or browses. Does nothing unless OFFLINE_DETECTION is
+    'event', or before the tables exist; the first request starts it then.
+    """
+    with app.app_context():
+        try:
+            get_offline_monitor()
+        except OperationalError:
+            db.session.rollback()
+
+def ensure_offline_monitor():
+    """
+    before_request hook registered by create_app in 'event' mode: starts the
+    monitor with the first request if the server did not (e.g. under `flask
+    run`), then unregisters itself so later requests skip it.
+    """
+    app = current_app._get_current_object()
+    if get_offline_monitor() is not None:
+        # Rebound rather than edited in place: Flask may be iterating the old list
+        app.before_request_funcs[None] = [func for func in app.before_request_funcs[None] if func is not ensure_offline_monitor]
+
+def get_offline_monitor():
+    """
+    Returns the app's offline monitor, warming it up and starting it on
+    first use, or None unless OFFLINE_DETECTION is 'event'.
+    """
+    app = current_app._get_current_object()
+    if app.config['OFFLINE_DETECTION'] != 'event':
+        return None
+    monitor = app.extensions.get('offline_monitor')
+    if monitor is None:
+        with _monitor_lock:
+            monitor = app.extensions.get('offline_monitor')
+            if monitor is None:
+                monitor = OfflineMonitor(app)
+                monitor.warm_up()
+                monitor.start()
+                app.extensions['offline_monitor'] = monitor
+    return monitor
@@ -0,0 +1,105 @@
+# /app/pagination.py
+
+import heapq
+from datetime import datetime
+from flask import current_app, request
+from app import db
+
+class KeysetPage:
+    """One page of rows plus the cursors of its neighbouring pages."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+def encode_cursor(timestamp, row_id):
+    return f"{timestamp.isoformat()}_{row_id}"
+
+def decode_cursor(value):
+    """Returns (timestamp, id) for a cursor string, or None if it is malformed."""
+    if not value:
+        return None
+    try:
+        timestamp, row_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        return None
+
+def requested_page_size():
+    """Reads ?page_size=, clamped to the configured bounds."""
+    page_size = request.args.get('page_size', current_app.config['PAGE_SIZE'], type=int)
+    return max(1, min(page_size, current_app.config['MAX_PAGE_SIZE']))
+
+def keyset_query(query, timestamp_col, id_col, descending=False, after=None, before=None):
+    """
+    `query` narrowed to the rows after (or, walking backwards, before) a
+    (timestamp, id) cursor and ordered in reading direction; the page is
+    its first rows.
+    """
+    key = db.tuple_(timestamp_col, id_col)
+    # Walking backwards means reading the opposite direction and flipping the result
+    backwards = before is not None
+    if after is not None and not backwards:
+        query = query.filter(key < after if descending else key > after)
+    elif backwards:
+        query = query.filter(key > before if descending else key < before)
+    if descending != backwards:
+        return query.order_by(timestamp_col.desc(), id_col.desc())
+    return query.order_by(timestamp_col.asc(), id_col.asc())
+
+def keyset_paginate(query, timestamp_col, id_col, page_size, descending=False, extra_source=None):
+    """
+    Paginates `query` on (timestamp, id) using the ?after= / ?before= cursors
+    of the current request. `id_col` is any integer column that makes the
+    key unique (the row id, or device_id for SensorData). Each page is a range seek on the index, so its
+    cost does not grow with how deep into the history the user has gone,
+    unlike OFFSET pagination.
+
+    `extra_source(lower, upper, reverse, limit)` may supply rows stored
+    elsewhere (e.g. the archive): it must return up to `limit` rows strictly
+    between the exclusive (timestamp, id) bounds (None = unbounded), sorted
+    descending if `reverse` is set. They are merged into the page.
+    """
+    after = decode_cursor(request.args.get('after'))
+    before = decode_cursor(request.args.get('before'))
+    id_attr = id_col.key
+
+    def row_key(row):
+        return row.timestamp, getattr(row, id_attr)
+
+    backwards = before is not None
+    reverse_order = descending != backwards
+    rows = keyset_query(query, timestamp_col, id_col, descending, after, before).limit(page_size + 1).all()
+    if extra_source is not None:
+        if descending:
+            lower, upper = (before, None) if backwards else (None, after)
+        else:
+            lower, upper = (None, before) if backwards else (after, None)
+        extra = extra_source(lower, upper, reverse_order, page_size + 1)
+        merged = []
+        for row in heapq.merge(rows, extra, key=row_key, reverse=reverse_order):
+            # A row can exist in both places if an archive batch was interrupted
+            if merged and row_key(merged[-1]) == row_key(row):
+                continue
+            merged.append(row)
+            if len(merged) > page_size:
+                break
+        rows = merged
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    def cursor(row):
+        return encode_cursor(*row_key(row))
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if backwards:
+            next_cursor = cursor(rows[-1])
+            prev_cursor = cursor(rows[0]) if has_more else None
+        else:
+            next_cursor = cursor(rows[-1]) if has_more else None
+            prev_cursor = cursor(rows[0]) if after is not None else None
+    return KeysetPage(rows, next_cursor, prev_cursor)
@@ -0,0 +1,152 @@
+# /app/payloads.py
+
+import json
+import struct
+import zlib
+
+# MessagePack support is optional; without it msgpack bodies get a 415.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+READINGS_TYPE = 'application/x-envmon-readings'
+
+# The fixed binary layout of READINGS_TYPE, in network byte order:
+#
+#   header   b'EM', version (1), number of hardware IDs (up to 255)
+#   IDs      per ID: its length in bytes, then the ID in UTF-8
+#   count    number of records (unsigned 16 bits)
+#   records  16 bytes each: index of the hardware ID in the table above,
+#            epoch milliseconds (0 = stamp on arrival), temperature and
+#            humidity and AC voltage as hundredths (signed, unsigned,
+#            unsigned 16 bits), water detected (0 / 1)
+#
+# Measurements are hundredths like in SensorData, so nothing is lost, and a
+# batch names each device once however many readings it carries. The
+# largest value of a field means it was not read.
+_MAGIC = b'EM'
+_VERSION = 1
+_HEADER = struct.Struct('!2sBB')
+_COUNT = struct.Struct('!H')
+_RECORD = struct.Struct('!BqhHHB')
+_MISSING_TEMPERATURE = -0x8000
+_MISSING = 0xFFFF
+_MISSING_WATER = 0xFF
+
+def _scaled(value, missing):
+    return missing if value is None else round(value * 100)
+
+def pack_readings(readings):
+    """
+    Encodes (hardware ID, epoch seconds or None, sensor_readings) tuples in
+    the READINGS_TYPE layout. Raises struct.error for a value out of range.
+    """
+    ids = {}
+    records = []
+    for hardware_id, timestamp, data in readings:
+        index = ids.setdefault(hardware_id, len(ids))
+        water = data.get('water_detected')
+        records.append(_RECORD.pack(
+            index,
+            0 if timestamp is None else round(timestamp * 1000),
+            _scaled(data.get('temperature'), _MISSING_TEMPERATURE),
+            _scaled(data.get('humidity'), _MISSING),
+            _scaled(data.get('ac_voltage'), _MISSING),
+            _MISSING_WATER if water is None else int(bool(water))
+        ))
+    parts = [_HEADER.pack(_MAGIC, _VERSION, len(ids))]
+    for hardware_id in ids:
+        encoded = hardware_id.encode('utf8')
+        parts.append(struct.pack('!B', len(encoded)) + encoded)
+    parts.append(_COUNT.pack(len(records)))
+    return b''.join(parts + records)
+
+def unpack_readings(body):
+    """
+    Decodes a READINGS_TYPE body into the records of a JSON batch:
+    {device_id, timestamp (epoch seconds or None), data}. Raises ValueError
+    if the body is malformed.
+    """
+    try:
+        magic, version, id_count = _HEADER.unpack_from(body)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Unknown binary readings format")
+        offset = _HEADER.size
+        ids = []
+        for _ in range(id_count):
+            length = body[offset]
+            ids.append(body[offset + 1:offset + 1 + length].decode('utf8'))
+            offset += 1 + length
+        count, = _COUNT.unpack_from(body, offset)
+        offset += _COUNT.size
+        if len(body) != offset + count * _RECORD.size:
+            raise ValueError("Binary readings body has the wrong length")
+        records = []
+        for index, timestamp, temperature, humidity, ac_voltage, water in _RECORD.iter_unpack(body[offset:]):
+            records.append({
+                'device_id': ids[index],
+                'timestamp': timestamp / 1000 if timestamp else None,
+                'data': {
+                    'temperature': None if temperature == _MISSING_TEMPERATURE else temperature / 100,
+                    'humidity': None if humidity == _MISSING else humidity / 100,
+                    'ac_voltage': None if ac_voltage == _MISSING else ac_voltage / 100,
+                    'water_detected': None if water == _MISSING_WATER else bool(water)
+                }
+            })
+        return records
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError("Malformed binary readings") from e
+
+def _gunzip(body, max_bytes):
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    try:
+        body = decompressor.decompress(body, max_bytes + 1)
+    except zlib.error:
+        return None, ("Invalid gzip body", 400)
+    if len(body) > max_bytes:
+        return None, (f"Decompressed body exceeds {max_bytes} bytes", 413)
+    if not decompressor.eof:
+        return None, ("Invalid gzip body", 400)
+    return body, None
+
+def decode_payload(body, content_type, content_encoding, max_bytes, single=False):
+    """
+    Decodes an ingest request body into the JSON shape the ingest routes
+    validate. A gzip Content-Encoding is undone first (up to max_bytes);
+    the body is then read as MessagePack or the binary READINGS_TYPE layout
+    if its Content-Type says so, and as JSON otherwise. A binary body sent
+    to a single-reading endpoint (`single`) must hold exactly one reading.
+    Returns (data, None), or (None, (message, status)).
+    """
+    encoding = (content_encoding or 'identity').strip().lower()
+    if encoding == 'gzip':
+        body, error = _gunzip(body, max_bytes)
+        if error:
+            return None, error
+    elif encoding != 'identity':
+        return None, (f"Unsupported Content-Encoding '{content_encoding}'", 415)
+
+    content_type = (content_type or '').split(';', 1)[0].strip().lower()
+    if content_type == READINGS_TYPE:
+        try:
+            records = unpack_readings(body)
+        except ValueError as e:
+            return None, (str(e), 400)
+        if not single:
+            return records, None
+        if len(records) != 1:
+            return None, ("Expected exactly one binary reading", 400)
+        return records[0], None
+    if content_type in MSGPACK_TYPES:
+        if msgpack is None:
+            return None, ("MessagePack bodies are not supported by this server", 415)
+        try:
+            return msgpack.unpackb(body, timestamp=3), None
+        except (ValueError, TypeError):
+            return None, ("Invalid MessagePack", 400)
+    try:
+        return json.loads(body), None
+    except ValueError:
+        return None, ("Invalid JSON", 400)
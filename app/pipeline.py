@@ -0,0 +1,164 @@
+# /app/pipeline.py
+
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+
+class IngestWriter:
+    """
+    Write-behind ingest pipeline used when INGEST_MODE is 'write_behind'.
+
+    Request handlers only validate and enqueue readings. A single writer
+    thread owns the database writes and flushes the queue as one transaction
+    every INGEST_FLUSH_INTERVAL_MS milliseconds or INGEST_FLUSH_MAX_ROWS rows,
+    whichever comes first, so concurrent requests never compete for the
+    SQLite writer lock.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.flush_interval = app.config['INGEST_FLUSH_INTERVAL_MS'] / 1000.0
+        self.flush_max_rows = app.config['INGEST_FLUSH_MAX_ROWS']
+        self.put_timeout = app.config['INGEST_QUEUE_PUT_TIMEOUT']
+        self._queue = queue.Queue(maxsize=app.config['INGEST_QUEUE_MAX_SIZE'])
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+        self._stats_lock = threading.Lock()
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.rows_failed = 0
+        self.rows_rejected = 0
+        self.last_flush_size = 0
+        self.max_flush_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, device, timestamp, sensor_readings):
+        """
+        Queues one reading. Blocks for at most INGEST_QUEUE_PUT_TIMEOUT seconds
+        when the queue is full and returns False if it is still full, so the
+        caller can push back on the device.
+        """
+        # Stamp the reading now; flushing may happen a little later.
+        item = (device, timestamp or datetime.utcnow(), sensor_readings)
+        try:
+            self._queue.put(item, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.rows_rejected += 1
+            return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _commit(self, batch):
+        """
+        Commits queued readings. The devices were already answered, so if
+        the group fails it is retried per device, and a device that still
+        fails reading by reading; only readings that fail on their own are
+        lost. Returns how many that were.
+        """
+        # Imported here to avoid a circular import with the routes module
+        from app.routes import commit_readings
+        try:
+            commit_readings(batch)
+            return 0
+        except Exception as e:
+            if len(batch) == 1:
+                device, timestamp, sensor_readings = batch[0]
+                print(f"Error storing a queued reading of {device.unique_hardware_id} at {timestamp}: {e}")
+                return 1
+        per_device = {}
+        for reading in batch:
+            per_device.setdefault(reading[0].id, []).append(reading)
+        parts = list(per_device.values()) if len(per_device) > 1 else [[reading] for reading in batch]
+        return sum(self._commit(part) for part in parts)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        with self.app.app_context():
+            failed = self._commit(batch)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self.flushes += 1
+            self.rows_flushed += len(batch) - failed
+            self.rows_failed += failed
+            self.last_flush_size = len(batch)
+            self.max_flush_size = max(self.max_flush_size, len(batch))
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+
+    def stop(self):
+        """Stops the writer thread and flushes everything still queued."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.flush_max_rows:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'flushes': self.flushes,
+                'rows_flushed': self.rows_flushed,
+                'rows_failed': self.rows_failed,
+                'rows_rejected': self.rows_rejected,
+                'last_flush_size': self.last_flush_size,
+                'max_flush_size': self.max_flush_size,
+                'avg_flush_size': self.rows_flushed / self.flushes if self.flushes else 0,
+                'last_flush_ms': round(self.last_flush_ms, 2),
+                'max_flush_ms': round(self.max_flush_ms, 2),
+                'avg_flush_ms': round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0
+            }
+
+_writer_lock = threading.Lock()
+
+def get_ingest_writer():
+    """Returns the app's ingest writer, starting it on first use."""
+    app = current_app._get_current_object()
+    writer = app.extensions.get('ingest_writer')
+    if writer is None:
+        with _writer_lock:
+            writer = app.extensions.get('ingest_writer')
+            if writer is None:
+                writer = IngestWriter(app)
+                writer.start()
+                app.extensions['ingest_writer'] = writer
+    return writer
@@ -0,0 +1,238 @@
+# /app/recent.py
+
+import threading
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models import Device, SensorData
+from app.timeutil import from_epoch_ms, to_epoch_ms
+
+# Measurements kept per reading, in the order of the value rows below
+FIELDS = ('temperature', 'humidity', 'ac_voltage')
+
+class RecentReading:
+    """The newest reading of a device, shaped like a SensorData row."""
+    __slots__ = ('device_id', 'timestamp', 'temperature', 'humidity', 'ac_voltage', 'water_detected')
+
+    def __init__(self, device_id, timestamp, values, water_detected):
+        self.device_id = device_id
+        self.timestamp = timestamp
+        for field, value in zip(FIELDS, values):
+            setattr(self, field, None if np.isnan(value) else round(float(value), 2))
+        self.water_detected = bool(water_detected)
+
+class DeviceRingBuffer:
+    """
+    Fixed-size, array-backed ring of one device's most recent readings,
+    ordered by time. When full, the oldest reading is overwritten.
+
+    `covers_from` (epoch ms) is the point from which the buffer is known to
+    hold every reading of the device; older ranges must go to the database.
+    """
+
+    def __init__(self, capacity, covers_from):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.values = np.full((len(FIELDS), capacity), np.nan, dtype=np.float32)
+        self.water = np.zeros(capacity, dtype=np.bool_)
+        self.start = 0
+        self.size = 0
+        self.covers_from = covers_from
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + self.values.nbytes + self.water.nbytes
+
+    def _write(self, index, timestamp_ms, values, water):
+        self.timestamps[index] = timestamp_ms
+        self.values[:, index] = values
+        self.water[index] = water
+
+    def append(self, timestamp_ms, values, water):
+        if self.size:
+            newest = self.timestamps[(self.start + self.size - 1) % self.capacity]
+            if timestamp_ms <= newest:
+                self._insert_late(timestamp_ms, values, water)
+                return
+        if self.size < self.capacity:
+            self._write((self.start + self.size) % self.capacity, timestamp_ms, values, water)
+            self.size += 1
+        else:
+            # Overwrite the oldest reading; the next one becomes the oldest
+            self._write(self.start, timestamp_ms, values, water)
+            self.start = (self.start + 1) % self.capacity
+            self.covers_from = max(self.covers_from, int(self.timestamps[self.start]))
+
+    def _insert_late(self, timestamp_ms, values, water):
+        """Slow path for out-of-order readings: rebuilds the ring in order."""
+        if timestamp_ms < self.covers_from:
+            return
+        timestamps, value_rows, water_flags = self.ordered()
+        position = int(np.searchsorted(timestamps, timestamp_ms))
+        if position < len(timestamps) and timestamps[position] == timestamp_ms:
+            return  # Already held (one reading per device and millisecond)
+        timestamps = np.insert(timestamps, position, timestamp_ms)
+        value_rows = np.insert(value_rows, position, values, axis=1)
+        water_flags = np.insert(water_flags, position, water)
+        if len(timestamps) > self.capacity:
+            timestamps, value_rows, water_flags = timestamps[1:], value_rows[:, 1:], water_flags[1:]
+            self.covers_from = max(self.covers_from, int(timestamps[0]))
+        self.size = len(timestamps)
+        self.start = 0
+        self.timestamps[:self.size] = timestamps
+        self.values[:, :self.size] = value_rows
+        self.water[:self.size] = water_flags
+
+    def ordered(self):
+        """Copies of (timestamps, values, water) from oldest to newest."""
+        order = (self.start + np.arange(self.size)) % self.capacity
+        return self.timestamps[order], self.values[:, order], self.water[order]
+
+    def latest(self):
+        if not self.size:
+            return None
+        index = (self.start + self.size - 1) % self.capacity
+        return int(self.timestamps[index]), self.values[:, index], self.water[index]
+
+class RecentReadings:
+    """
+    Process-local store of the last RECENT_READINGS_CAPACITY readings of
+    every device, filled by ingest after each commit. The dashboard and
+    short-range history charts are served from it without touching the
+    database. Only correct when the process that serves the pages also
+    handles all ingest, as `python run.py` or a single uvicorn worker of
+    asgi.py do, so it is off (capacity 0) unless enabled.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def warm_up(self):
+        """Loads the newest `capacity` readings of every device from the database."""
+        now_ms = to_epoch_ms(datetime.utcnow())
+        columns = [SensorData.timestamp] + [getattr(SensorData, field) for field in FIELDS] + [SensorData.water_detected]
+        buffers = {}
+        for (device_id,) in db.session.query(Device.id).all():
+            rows = db.session.query(*columns).filter(
+                SensorData.device_id == device_id
+            ).order_by(SensorData.timestamp.desc()).limit(self.capacity).all()
+            covers_from = to_epoch_ms(rows[-1][0]) if rows else now_ms
+            buffer = DeviceRingBuffer(self.capacity, covers_from)
+            for row in reversed(rows):
+                buffer.append(to_epoch_ms(row[0]), [np.nan if v is None else v for v in row[1:-1]], bool(row[-1]))
+            buffers[device_id] = buffer
+        with self._lock:
+            self._buffers = buffers
+
+    def extend(self, rows):
+        """Adds committed SensorData row mappings."""
+        with self._lock:
+            for row in rows:
+                timestamp_ms = to_epoch_ms(row['timestamp'])
+                buffer = self._buffers.get(row['device_id'])
+                if buffer is None:
+                    buffer = self._buffers[row['device_id']] = DeviceRingBuffer(self.capacity, timestamp_ms)
+                values = [np.nan if row.get(field) is None else float(row[field]) for field in FIELDS]
+                buffer.append(timestamp_ms, values, bool(row.get('water_detected')))
+
+    def drop(self, device_id):
+        with self._lock:
+            self._buffers.pop(device_id, None)
+
+    def latest(self, device_ids):
+        """
+        Returns ({device_id: RecentReading}, missing_ids); devices in
+        missing_ids have no buffered reading and need the database.
+        """
+        found, missing = {}, []
+        with self._lock:
+            for device_id in device_ids:
+                buffer = self._buffers.get(device_id)
+                latest = buffer.latest() if buffer is not None else None
+                if latest is None:
+                    missing.append(device_id)
+                    continue
+                timestamp_ms, values, water = latest
+                found[device_id] = RecentReading(device_id, from_epoch_ms(timestamp_ms), values, water)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def window(self, device_ids, start, end):
+        """
+        Readings of `device_ids` in [start, end) merged in time order, as
+        (epoch ms array, {field: float array}), or None if the range starts
+        before what the buffers are known to hold.
+        """
+        start_ms, end_ms = to_epoch_ms(start), to_epoch_ms(end)
+        timestamps, values = [], []
+        with self._lock:
+            for device_id in device_ids:
+                buffer = self._buffers.get(device_id)
+                if buffer is None or start_ms < buffer.covers_from:
+                    self.misses += 1
+                    return None
+                device_timestamps, device_values, _ = buffer.ordered()
+                lo, hi = np.searchsorted(device_timestamps, [start_ms, end_ms])
+                timestamps.append(device_timestamps[lo:hi])
+                values.append(device_values[:, lo:hi])
+            self.hits += 1
+        timestamps = np.concatenate(timestamps) if timestamps else np.empty(0, dtype=np.int64)
+        values = np.concatenate(values, axis=1) if values else np.empty((len(FIELDS), 0), dtype=np.float32)
+        order = np.argsort(timestamps, kind='stable')
+        return timestamps[order], {field: values[i, order] for i, field in enumerate(FIELDS)}
+
+    def stats(self):
+        with self._lock:
+            per_device = next(iter(self._buffers.values())).nbytes if self._buffers else 0
+            return {
+                'devices': len(self._buffers),
+                'capacity': self.capacity,
+                'readings': sum(buffer.size for buffer in self._buffers.values()),
+                'bytes_per_device': per_device,
+                'total_bytes': sum(buffer.nbytes for buffer in self._buffers.values()),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+_store_lock = threading.Lock()
+
+def warm_up_recent_readings(app):
+    """
+    Creates and warms up the app's recent-readings store at startup, so the
+    first dashboard view does not pay for it. Does nothing when
+    RECENT_READINGS_CAPACITY is 0, or before the tables exist (e.g. during
+    `flask db upgrade`); the store is then warmed up on first use.
+    """
+    if not app.config['RECENT_READINGS_CAPACITY']:
+        return
+    with app.app_context():
+        try:
+            get_recent_readings()
+        except OperationalError:
+            db.session.rollback()
+
+def get_recent_readings():
+    """
+    Returns the app's recent-readings store, warming it up from the database
+    if that did not happen at startup, or None when RECENT_READINGS_CAPACITY
+    is 0.
+    """
+    app = current_app._get_current_object()
+    if not app.config['RECENT_READINGS_CAPACITY']:
+        return None
+    store = app.extensions.get('recent_readings')
+    if store is None:
+        with _store_lock:
+            store = app.extensions.get('recent_readings')
+            if store is None:
+                store = RecentReadings(app.config['RECENT_READINGS_CAPACITY'])
+                store.warm_up()
+                app.extensions['recent_readings'] = store
+    return store
@@ -0,0 +1,125 @@
+# /app/registry.py
+
+import threading
+import time
+from flask import current_app
+from app.models import Device
+from app.rules import compile_rules
+from app.access import access_index
+
+# Device columns copied into each cache entry
+STATUS_FIELDS = (
+    'temp_alert_status', 'humidity_alert_status', 'water_alert_status', 'voltage_alert_status'
+)
+
+class DeviceEntry:
+    """
+    Snapshot of everything the ingest path needs to know about a device:
+    its id, category, compiled alert rules, alert state and the emails of
+    its assigned users. It exposes the same attribute names as the Device model.
+    """
+    __slots__ = (
+        'id', 'name', 'unique_hardware_id', 'category', 'offline_after_minutes', 'rules', 'alert_version', 'recipients', 'loaded_at'
+    ) + STATUS_FIELDS
+
+    def __init__(self, device, rules, recipients):
+        self.id = device.id
+        self.name = device.name
+        self.unique_hardware_id = device.unique_hardware_id
+        self.category = device.category
+        self.offline_after_minutes = device.offline_after_minutes
+        for field in STATUS_FIELDS:
+            setattr(self, field, getattr(device, field))
+        self.rules = rules
+        self.alert_version = device.alert_version
+        self.recipients = recipients
+        self.loaded_at = time.monotonic()
+
+    def __repr__(self):
+        return f'<DeviceEntry {self.name}>'
+
+class DeviceRegistry:
+    """
+    Process-local cache mapping hardware IDs to DeviceEntry snapshots.
+
+    Admin edits invalidate it explicitly. Entries also expire after
+    DEVICE_REGISTRY_TTL seconds so changes made by other processes
+    (other workers, the connection checker) are picked up eventually; alert
+    state is checked against the database on every ingest transaction
+    instead (see refresh_alert_state).
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def _is_fresh(self, entry):
+        return time.monotonic() - entry.loaded_at < current_app.config['DEVICE_REGISTRY_TTL']
+
+    def _load(self, hardware_ids):
+        """Loads devices and their rules with one query each; recipients come from the access index."""
+        devices = Device.query.filter(Device.unique_hardware_id.in_(hardware_ids)).all()
+        rules = compile_rules([device.id for device in devices])
+        self.loads += 1
+        return {
+            device.unique_hardware_id: DeviceEntry(device, rules[device.id], access_index.recipients(device.id))
+            for device in devices
+        }
+
+    def cached(self, hardware_ids):
+        """
+        Returns ({hardware_id: DeviceEntry} of the fresh cached entries, [the
+        other IDs]) without touching the database.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for hardware_id in hardware_ids:
+                entry = self._entries.get(hardware_id)
+                if entry is not None and self._is_fresh(entry):
+                    found[hardware_id] = entry
+                    self.hits += 1
+                else:
+                    missing.append(hardware_id)
+                    self.misses += 1
+        return found, missing
+
+    def load(self, hardware_ids):
+        """Loads and caches the entries of the registered IDs in hardware_ids."""
+        loaded = self._load(hardware_ids)
+        with self._lock:
+            self._entries.update(loaded)
+        return loaded
+
+    def get_many(self, hardware_ids):
+        """Returns {hardware_id: DeviceEntry} for every registered ID in hardware_ids."""
+        found, missing = self.cached(hardware_ids)
+        if missing:
+            found.update(self.load(missing))
+        return found
+
+    def get(self, hardware_id):
+        """Returns the DeviceEntry for a hardware ID, or None if it is not registered."""
+        return self.get_many([hardware_id]).get(hardware_id)
+
+    def invalidate(self, hardware_id=None):
+        """Drops one entry, or the whole cache when no hardware ID is given."""
+        with self._lock:
+            if hardware_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(hardware_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads
+            }
+
+device_registry = DeviceRegistry()
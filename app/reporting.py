@@ -0,0 +1,146 @@
+# /app/reporting.py
+
+import threading
+import time
+from collections import namedtuple
+from flask import current_app
+from app.models import ReportingPolicy
+
+DEFAULT_CATEGORY = 'default'
+
+Policy = namedtuple('Policy', 'fast_seconds normal_seconds slow_seconds near_alert_percent stable_change_percent')
+
+def default_policy():
+    """The policy of categories without a ReportingPolicy row, from the config."""
+    config = current_app.config
+    return Policy(
+        config['REPORT_FAST_SECONDS'], config['REPORT_NORMAL_SECONDS'], config['REPORT_SLOW_SECONDS'],
+        config['REPORT_NEAR_ALERT_PERCENT'], config['REPORT_STABLE_CHANGE_PERCENT']
+    )
+
+def near_alert(rules, values, percent):
+    """
+    Whether a reading is within `percent` of one of the thresholds of a
+    device's CompiledRules: percent of the band between a rule's low and
+    high thresholds, or of the threshold itself if the rule has only one.
+    """
+    for metric, (low, high) in zip(rules.metrics, rules.thresholds):
+        value = values.get(metric)
+        if value is None or isinstance(value, bool):
+            continue
+        for threshold in (low, high):
+            if threshold is None:
+                continue
+            scale = high - low if low is not None and high is not None else abs(threshold)
+            if abs(value - threshold) < scale * percent / 100:
+                return True
+    return False
+
+def changing(previous, current, percent):
+    """
+    Whether any measurement moved by at least `percent` of its value per
+    minute between two (timestamp, sensor_readings) readings, or None if
+    their timestamps do not allow to tell.
+    """
+    minutes = (current[0] - previous[0]).total_seconds() / 60
+    if minutes <= 0:
+        return None
+    for metric, value in current[1].items():
+        before = previous[1].get(metric)
+        if value is None or before is None or isinstance(value, bool) or isinstance(before, bool):
+            continue
+        try:
+            if abs(value - before) / max(abs(before), 1) * 100 / minutes >= percent:
+                return True
+        except TypeError:
+            continue  # Not a number
+    return False
+
+class ReportingAdvisor:
+    """
+    Decides the reporting interval the ingest endpoints recommend to each
+    device (next_report_seconds): the category's fast interval while one of
+    the device's rules is in alert or pending, or the reading is near a
+    threshold; the normal interval while its readings change, or when there
+    is nothing to compare with; the slow interval once they are stable.
+
+    Policies are cached for REPORTING_POLICY_TTL seconds, and the newest
+    reading of each device is kept to measure the rate of change, both per
+    process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._policies = None  # category -> Policy
+        self._loaded_at = 0.0
+        self._last = {}        # device id -> newest (timestamp, sensor_readings)
+        self.advised = {'fast': 0, 'normal': 0, 'slow': 0}
+
+    def is_fresh(self):
+        with self._lock:
+            return self._policies is not None and time.monotonic() - self._loaded_at < current_app.config['REPORTING_POLICY_TTL']
+
+    def policies(self):
+        """{category: Policy} of every ReportingPolicy row, loaded if stale."""
+        if self.is_fresh():
+            return self._policies
+        policies = {
+            row.category: Policy(row.fast_seconds, row.normal_seconds, row.slow_seconds, row.near_alert_percent, row.stable_change_percent)
+            for row in ReportingPolicy.query.all()
+        }
+        with self._lock:
+            self._policies = policies
+            self._loaded_at = time.monotonic()
+        return policies
+
+    def policy(self, category):
+        policies = self.policies()
+        return policies.get(category or DEFAULT_CATEGORY) or policies.get(DEFAULT_CATEGORY) or default_policy()
+
+    def advise(self, device, readings):
+        """
+        Seconds until a device (a DeviceEntry) should report again, given its
+        new readings as (timestamp, sensor_readings) pairs in time order.
+        """
+        policy = self.policy(device.category)
+        current = readings[-1]
+        with self._lock:
+            stored = self._last.get(device.id)
+            previous = readings[-2] if len(readings) > 1 else stored
+            if stored is None or stored[0] <= current[0]:
+                self._last[device.id] = current
+
+        rules = device.rules
+        if any(rules.active) or any(pending is not None for pending in rules.pending) \
+                or near_alert(rules, current[1], policy.near_alert_percent):
+            tier = 'fast'
+        elif previous is None or changing(previous, current, policy.stable_change_percent) is not False:
+            tier = 'normal'
+        else:
+            tier = 'slow'
+        seconds = getattr(policy, tier + '_seconds')
+        offline_after = (device.offline_after_minutes or current_app.config['OFFLINE_AFTER_MINUTES']) * 60
+        with self._lock:
+            self.advised[tier] += 1
+        return int(min(seconds, offline_after / 2))
+
+    def forget(self, device_id):
+        with self._lock:
+            self._last.pop(device_id, None)
+
+    def invalidate(self):
+        """Forgets the cached policies."""
+        with self._lock:
+            self._policies = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'policies': len(self._policies) if self._policies is not None else None,
+                'devices_tracked': len(self._last),
+                'advised_fast': self.advised['fast'],
+                'advised_normal': self.advised['normal'],
+                'advised_slow': self.advised['slow']
+            }
+
+reporting_advisor = ReportingAdvisor()
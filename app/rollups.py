@@ -0,0 +1,143 @@
+# /app/rollups.py
+
+from app import db
+from app.models import (
+    SensorRollupMinute, SensorRollupFiveMinute, SensorRollupQuarterHour,
+    SensorRollupHour, SensorRollupSixHour, SensorRollupDay
+)
+from app.storage import dialect_insert, UPSERT_CHUNK_SIZE
+from app.timeutil import from_epoch_ms, to_epoch_ms
+
+# (name, model, bucket length in seconds), finest first. Neighbouring levels
+# are at most 6x apart, so some level always lands near the point band
+# choose_resolution aims for.
+RESOLUTIONS = (
+    ('minute', SensorRollupMinute, 60),
+    ('5-minute', SensorRollupFiveMinute, 300),
+    ('15-minute', SensorRollupQuarterHour, 900),
+    ('hour', SensorRollupHour, 3600),
+    ('6-hour', SensorRollupSixHour, 21600),
+    ('day', SensorRollupDay, 86400),
+)
+
+# Rollup model -> bucket length in seconds
+BUCKET_SECONDS = {model: seconds for _, model, seconds in RESOLUTIONS}
+
+METRICS = ('temperature', 'humidity', 'ac_voltage')
+
+def bucket_start(timestamp, seconds):
+    """Truncates a naive UTC datetime to the start of its bucket."""
+    return from_epoch_ms(to_epoch_ms(timestamp) // (seconds * 1000) * seconds * 1000)
+
+def aggregate_rows(rows, seconds):
+    """Aggregates SensorData row mappings into {(device_id, bucket): values}."""
+    buckets = {}
+    for row in rows:
+        key = (row['device_id'], bucket_start(row['timestamp'], seconds))
+        agg = buckets.get(key)
+        if agg is None:
+            agg = {'device_id': key[0], 'bucket': key[1], 'reading_count': 0, 'water_detected': False}
+            for metric in METRICS:
+                agg.update({f'{metric}_min': None, f'{metric}_max': None, f'{metric}_sum': None, f'{metric}_count': 0})
+            buckets[key] = agg
+        agg['reading_count'] += 1
+        agg['water_detected'] = agg['water_detected'] or bool(row.get('water_detected'))
+        for metric in METRICS:
+            value = row.get(metric)
+            if value is None:
+                continue
+            agg[f'{metric}_min'] = value if agg[f'{metric}_min'] is None else min(agg[f'{metric}_min'], value)
+            agg[f'{metric}_max'] = value if agg[f'{metric}_max'] is None else max(agg[f'{metric}_max'], value)
+            agg[f'{metric}_sum'] = (agg[f'{metric}_sum'] or 0) + value
+            agg[f'{metric}_count'] += 1
+    return buckets
+
+def _merge_expressions(table, excluded, dialect):
+    """SQL that folds a new partial aggregate into an existing bucket row."""
+    def least(a, b):
+        if dialect == 'postgresql':
+            return db.func.least(a, b)
+        # SQLite's scalar min() returns NULL if either side is NULL
+        return db.func.coalesce(db.func.min(a, b), a, b)
+
+    def greatest(a, b):
+        if dialect == 'postgresql':
+            return db.func.greatest(a, b)
+        return db.func.coalesce(db.func.max(a, b), a, b)
+
+    merged = {
+        'reading_count': table.c.reading_count + excluded.reading_count,
+        'water_detected': db.or_(table.c.water_detected, excluded.water_detected),
+    }
+    for metric in METRICS:
+        merged[f'{metric}_min'] = least(table.c[f'{metric}_min'], excluded[f'{metric}_min'])
+        merged[f'{metric}_max'] = greatest(table.c[f'{metric}_max'], excluded[f'{metric}_max'])
+        merged[f'{metric}_sum'] = db.func.coalesce(table.c[f'{metric}_sum'], 0) + db.func.coalesce(excluded[f'{metric}_sum'], 0)
+        merged[f'{metric}_count'] = table.c[f'{metric}_count'] + excluded[f'{metric}_count']
+    return merged
+
+def _merge_into(existing, agg):
+    """Python equivalent of _merge_expressions for dialects without upserts."""
+    existing.reading_count += agg['reading_count']
+    existing.water_detected = existing.water_detected or agg['water_detected']
+    for metric in METRICS:
+        if not agg[f'{metric}_count']:
+            continue
+        for suffix, pick in (('min', min), ('max', max)):
+            current = getattr(existing, f'{metric}_{suffix}')
+            new = agg[f'{metric}_{suffix}']
+            setattr(existing, f'{metric}_{suffix}', new if current is None else pick(current, new))
+        setattr(existing, f'{metric}_sum', (getattr(existing, f'{metric}_sum') or 0) + agg[f'{metric}_sum'])
+        setattr(existing, f'{metric}_count', getattr(existing, f'{metric}_count') + agg[f'{metric}_count'])
+
+def update_rollups(rows):
+    """
+    Folds freshly inserted SensorData row mappings into every rollup table
+    in RESOLUTIONS inside the caller's transaction.
+    """
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    for _, model, seconds in RESOLUTIONS:
+        values = list(aggregate_rows(rows, seconds).values())
+        stmt = dialect_insert(model)
+        if stmt is None:
+            for agg in values:
+                existing = db.session.get(model, (agg['device_id'], agg['bucket']))
+                if existing is None:
+                    db.session.add(model(**agg))
+                else:
+                    _merge_into(existing, agg)
+            continue
+        for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+            chunk = stmt.values(values[start:start + UPSERT_CHUNK_SIZE])
+            chunk = chunk.on_conflict_do_update(
+                index_elements=['device_id', 'bucket'],
+                set_=_merge_expressions(model.__table__, chunk.excluded, dialect)
+            )
+            db.session.execute(chunk)
+
+def delete_device_rollups(device_id):
+    """Deletes a device's rows from every rollup table in the caller's transaction."""
+    for _, model, _ in RESOLUTIONS:
+        db.session.query(model).filter(model.device_id == device_id).delete(synchronize_session=False)
+
+def choose_resolution(start, end, min_points, max_points):
+    """
+    Picks the rollup whose bucket count per series over [start, end) comes
+    closest to the band [min_points, max_points], measured as a ratio, so
+    the rows read stay roughly constant whatever the range. Returns
+    (name, model), or ('raw', None) when even minute buckets would give
+    fewer than `min_points`.
+    """
+    span = (end - start).total_seconds()
+    if span / RESOLUTIONS[0][2] < min_points:
+        return 'raw', None
+    best = None
+    for name, model, seconds in RESOLUTIONS:
+        points = span / seconds
+        # 1 inside the band, otherwise how many times too few or too many
+        miss = max(min_points / points, points / max_points, 1)
+        if best is None or miss < best[0]:
+            best = (miss, name, model)
+    return best[1], best[2]
@@ -1,118 +1,386 @@
 # /app/routes.py
 
-from flask import render_template, request, jsonify, Blueprint
+from flask import render_template, request, jsonify, Blueprint, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
+import csv
+import hashlib
+import io
+import json
+import math
+import time
+import zlib
 from datetime import datetime, timedelta, timezone
 from app import db
-from app.models import Device, SensorData, AlertLog
-from app.email import send_alert_email
+from app.models import Device, SensorData, AlertLog, AlertRule, DeviceLatest, truncate_to_millis
+from app.registry import device_registry
+from app.access import access_index
+from app.pipeline import get_ingest_writer
+from app.storage import insert_sensor_rows, touch_device_latest, upsert_device_latest
+from app.rollups import BUCKET_SECONDS, update_rollups, choose_resolution
+from app.downsample import downsample_series
+from app.pagination import KeysetPage, keyset_paginate, keyset_query, requested_page_size
+from app.archive import ArchivedReading, archived_page_source, has_archived_data, iter_archived, merge_archived
+from app.recent import get_recent_readings
+from app.timeutil import EPOCH, from_epoch_ms, to_epoch_ms
+from app.events import get_event_hub
+from app.rules import alert_types, evaluate_alerts, refresh_alert_state
+from app.offline import get_offline_monitor
+from app.payloads import decode_payload
+from app.reporting import reporting_advisor
 
 bp = Blueprint('main', __name__)
 
+# Every alert_type written to AlertLog, used by the alert list filters
+ALERT_TYPES = alert_types() + ('Connection Loss',)
+
+# Device alert status column -> key used in the dashboard JSON and live events
+ALERT_STATUS_KEYS = {
+    'temp_alert_status': 'temperature',
+    'humidity_alert_status': 'humidity',
+    'water_alert_status': 'water',
+    'voltage_alert_status': 'voltage'
+}
+
 @bp.route('/')
 def index():
      return render_template('index.html')
 
-def check_and_send_alerts(device, sensor_readings):
-    """Stateful helper function to check all alert conditions."""
-    alert_recipients = [user.email for user in device.users]
-    if not alert_recipients:
-        return
-
-    # Check High Temperature
-    temp = sensor_readings.get('temperature')
-    if device.temp_threshold_high is not None and temp is not None:
-        is_in_alert = temp > device.temp_threshold_high
-        if is_in_alert and not device.temp_alert_status:
-            device.temp_alert_status = True
-            message = f"High Temperature Alert for device '{device.name}': Current temp ({temp}°C) exceeded threshold ({device.temp_threshold_high}°C)."
-            db.session.add(AlertLog(device_id=device.id, alert_type='High Temperature', message=message))
-            for email in alert_recipients:
-                send_alert_email(email, f"ALERT: High Temperature on {device.name}", message)
-        elif not is_in_alert and device.temp_alert_status:
-            device.temp_alert_status = False
-            message = f"Temperature Returned to Normal for device '{device.name}': Current temp is {temp}°C."
-            db.session.add(AlertLog(device_id=device.id, alert_type='Temperature Normal', message=message))
-            for email in alert_recipients:
-                send_alert_email(email, f"OK: Temperature Normal on {device.name}", message)
-
-    # Check Humidity
-    humidity = sensor_readings.get('humidity')
-    if humidity is not None:
-        is_in_hum_alert = (device.humidity_threshold_low is not None and humidity < device.humidity_threshold_low) or \
-                          (device.humidity_threshold_high is not None and humidity > device.humidity_threshold_high)
-        if is_in_hum_alert and not device.humidity_alert_status:
-            device.humidity_alert_status = True
-            alert_type = "Low Humidity" if (device.humidity_threshold_low and humidity < device.humidity_threshold_low) else "High Humidity"
-            message = f"{alert_type} Alert for device '{device.name}': Current humidity is {humidity}%."
-            db.session.add(AlertLog(device_id=device.id, alert_type=alert_type, message=message))
-            for email in alert_recipients:
-                send_alert_email(email, f"ALERT: Humidity Issue on {device.name}", message)
-        elif not is_in_hum_alert and device.humidity_alert_status:
-            device.humidity_alert_status = False
-            message = f"Humidity Returned to Normal for device '{device.name}': Current humidity is {humidity}%."
-            db.session.add(AlertLog(device_id=device.id, alert_type='Humidity Normal', message=message))
-            for email in alert_recipients:
-                send_alert_email(email, f"OK: Humidity Normal on {device.name}", message)
-
-    # --- NEW: Check AC Voltage ---
-    voltage = sensor_readings.get('ac_voltage')
-    if voltage is not None:
-        is_in_volt_alert = (device.voltage_threshold_low is not None and voltage < device.voltage_threshold_low) or \
-                           (device.voltage_threshold_high is not None and voltage > device.voltage_threshold_high)
-        if is_in_volt_alert and not device.voltage_alert_status:
-            device.voltage_alert_status = True
-            alert_type = "Low Voltage" if (device.voltage_threshold_low and voltage < device.voltage_threshold_low) else "High Voltage"
-            message = f"{alert_type} Alert for device '{device.name}': Current voltage is {voltage}V."
-            db.session.add(AlertLog(device_id=device.id, alert_type=alert_type, message=message))
-            for email in alert_recipients:
-                send_alert_email(email, f"ALERT: Voltage Issue on {device.name}", message)
-        elif not is_in_volt_alert and device.voltage_alert_status:
-            device.voltage_alert_status = False
-            message = f"Voltage Returned to Normal for device '{device.name}': Current voltage is {voltage}V."
-            db.session.add(AlertLog(device_id=device.id, alert_type='Voltage Normal', message=message))
-            for email in alert_recipients:
-                send_alert_email(email, f"OK: Voltage Normal on {device.name}", message)
-
-    # Check Water Leak
-    water_detected = sensor_readings.get('water_detected', False)
-    if device.alert_on_water:
-        if water_detected and not device.water_alert_status:
-            device.water_alert_status = True
-            message = f"CRITICAL: Water Leak Detected for device '{device.name}'."
-            db.session.add(AlertLog(device_id=device.id, alert_type='Water Leak', message=message))
-            for email in alert_recipients:
-                send_alert_email(email, f"CRITICAL: Water Leak on {device.name}", message)
-        elif not water_detected and device.water_alert_status:
-            device.water_alert_status = False
-            message = f"Water Leak Cleared for device '{device.name}'."
-            db.session.add(AlertLog(device_id=device.id, alert_type='Water Leak Cleared', message=message))
-            for email in alert_recipients:
-                send_alert_email(email, f"OK: Water Leak Cleared on {device.name}", message)
+def parse_reading_timestamp(value):
+    """
+    Parses a device-supplied timestamp (ISO-8601 string or UNIX epoch seconds)
+    into a naive UTC datetime, matching how timestamps are stored.
+    Returns None when no timestamp was supplied.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError("Invalid timestamp")
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def sensor_row(device_id, timestamp, sensor_readings):
+    """Builds the column mapping for one SensorData row."""
+    return {
+        'device_id': device_id,
+        'timestamp': truncate_to_millis(timestamp or datetime.utcnow()),
+        'temperature': sensor_readings.get('temperature'),
+        'humidity': sensor_readings.get('humidity'),
+        'ac_voltage': sensor_readings.get('ac_voltage'),
+        'water_detected': sensor_readings.get('water_detected', False)
+    }
+
+def persist_readings(readings):
+    """
+    Stores a list of (device, timestamp, sensor_readings) tuples with a single
+    bulk insert and runs alert evaluation for each device in timestamp order.
+    Devices are DeviceEntry snapshots from the device registry, brought up
+    to date with the alert state other workers committed first (one SELECT
+    per call, see INGEST_QUERY_BUDGET in app/commands.py); alert status
+    changes are claimed with one compare-and-set UPDATE per device, and the
+    state of their alert rules written with one bulk UPDATE.
+    The caller is responsible for committing the session.
+    Returns the SensorData row mappings that were inserted and the alert
+    transitions as (device_id, {status_field: new_value}) pairs.
+    """
+    if not readings:
+        return [], []
+    rows = [sensor_row(device.id, timestamp, sensor_readings) for device, timestamp, sensor_readings in readings]
+    # Readings that were already stored are dropped here, so retried
+    # uploads neither double-count in the rollups nor re-trigger alerts.
+    inserted = {id(row) for row in insert_sensor_rows(rows)}
+    stored = [(reading, row) for reading, row in zip(readings, rows) if id(row) in inserted]
+    rows = [row for _, row in stored]
+    upsert_device_latest(rows)
+    update_rollups(rows)
+
+    # Group the readings per device so alert state transitions are
+    # evaluated in the order they happened.
+    per_device = {}
+    transitions = []
+    rule_updates = []
+    for (device, _, sensor_readings), row in stored:
+        per_device.setdefault(device.id, (device, []))[1].append((row['timestamp'], sensor_readings))
+    refresh_alert_state([device for device, _ in per_device.values()])
+    for device, device_readings in per_device.values():
+        device_readings.sort(key=lambda item: item[0])
+        changes, updates = evaluate_alerts(device, device_readings)
+        rule_updates.extend(updates)
+        if changes:
+            transitions.append((device.id, changes))
+    if rule_updates:
+        db.session.execute(db.update(AlertRule), rule_updates)
+    # A late reading can flip an alert without becoming the latest reading
+    touch_device_latest([device_id for device_id, _ in transitions])
+    return rows, transitions
+
+def commit_readings(readings):
+    """
+    Persists readings and commits. If the transaction fails, the affected
+    registry entries are dropped because their alert state may no longer
+    match the database. Returns the SensorData row mappings that were
+    stored; readings already stored before are left out.
+    """
+    try:
+        rows, transitions = persist_readings(readings)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for device, _, _ in readings:
+            device_registry.invalidate(device.unique_hardware_id)
+        raise
+    recent = get_recent_readings()
+    if recent is not None:
+        recent.extend(rows)
+    monitor = get_offline_monitor()
+    if monitor is not None:
+        last_seen = {}
+        for row in rows:
+            if row['device_id'] not in last_seen or last_seen[row['device_id']] < row['timestamp']:
+                last_seen[row['device_id']] = row['timestamp']
+        monitor.seen(last_seen)
+    publish_events(rows, transitions)
+    return rows
+
+def publish_events(rows, transitions):
+    """Pushes committed readings and alert transitions to /stream clients."""
+    hub = get_event_hub()
+    for row in rows:
+        hub.publish(row['device_id'], 'reading', {
+            'device_id': row['device_id'],
+            'timestamp': row['timestamp'].isoformat(),
+            'temperature': row['temperature'],
+            'humidity': row['humidity'],
+            'ac_voltage': row['ac_voltage'],
+            'water_detected': bool(row['water_detected'])
+        })
+    for device_id, changes in transitions:
+        hub.publish(device_id, 'alert', {
+            'device_id': device_id,
+            'alerts': {ALERT_STATUS_KEYS[field]: bool(value) for field, value in changes.items()}
+        })
+
+def ingest_request_payload(single=False):
+    """The decoded body of an ingest request as (data, error); see decode_payload."""
+    return decode_payload(
+        request.get_data(), request.mimetype, request.headers.get('Content-Encoding'),
+        current_app.config['INGEST_MAX_DECODED_BYTES'], single=single
+    )
+
+# Measurement fields of a reading stored as numbers; water_detected is a bool
+NUMERIC_FIELDS = ('temperature', 'humidity', 'ac_voltage')
+# SensorData stores them as signed 64-bit hundredths
+MEASUREMENT_LIMIT = 2 ** 63 / 100
+
+def reading_values_error(sensor_readings):
+    """Message for a measurement of the wrong type, or None. Missing measurements are fine."""
+    for field in NUMERIC_FIELDS:
+        value = sensor_readings.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value)):
+            return f"'{field}' must be a number"
+        if value is not None and abs(value) >= MEASUREMENT_LIMIT:
+            return f"'{field}' is out of range"
+    if sensor_readings.get('water_detected') is not None and not isinstance(sensor_readings['water_detected'], bool):
+        return "'water_detected' must be true or false"
+    return None
+
+def ingest_payload_error(req_data):
+    """(message, status) for an invalid /api/ingest payload, or None."""
+    if not req_data or not isinstance(req_data, dict):
+        return "Invalid JSON", 400
+    if not req_data.get('device_id') or not req_data.get('data'):
+        return "Missing 'device_id' or 'data' in payload", 400
+    if not isinstance(req_data['device_id'], str):
+        return "'device_id' must be a string", 400
+    if not isinstance(req_data['data'], dict):
+        return "'data' must be an object", 400
+    error = reading_values_error(req_data['data'])
+    if error:
+        return error, 400
+    try:
+        parse_reading_timestamp(req_data.get('timestamp'))
+    except (TypeError, ValueError, OverflowError, OSError):
+        return "Invalid 'timestamp'", 400
+    return None
+
+def batch_payload_records(req_data):
+    """
+    The records of an /api/ingest/batch payload (a JSON array, or an object
+    with a `readings` array), or (message, status) if it is invalid.
+    """
+    if isinstance(req_data, dict):
+        req_data = req_data.get('readings')
+    if not isinstance(req_data, list):
+        return None, ("Expected a JSON array of readings", 400)
+    max_records = current_app.config['INGEST_BATCH_MAX_RECORDS']
+    if len(req_data) > max_records:
+        return None, (f"Batch exceeds the limit of {max_records} records", 413)
+    return req_data, None
+
+def batch_hardware_ids(records):
+    """Every hardware ID in a batch, so they can be resolved at once."""
+    return {record['device_id'] for record in records if isinstance(record, dict) and isinstance(record.get('device_id'), str)}
+
+def validate_batch(records, devices):
+    """
+    Checks each batch record against the resolved {hardware_id: device}.
+    Returns the per-record results and the (device, timestamp,
+    sensor_readings) tuples of the valid ones. Records without a timestamp
+    are stamped on arrival, one millisecond apart per device in record
+    order, so each keeps its own (device, millisecond) key.
+    """
+    results = []
+    readings = []
+    received = truncate_to_millis(datetime.utcnow())
+    unstamped = {}  # device id -> records stamped on arrival so far
+    for index, record in enumerate(records):
+        if not isinstance(record, dict) or not isinstance(record.get('device_id'), str) or not record.get('data'):
+            results.append({"index": index, "status": "error", "error": "Missing 'device_id' or 'data' in record"})
+            continue
+        device = devices.get(record['device_id'])
+        if not device:
+            results.append({"index": index, "status": "error", "error": f"Device with ID '{record['device_id']}' is not registered."})
+            continue
+        if not isinstance(record['data'], dict):
+            results.append({"index": index, "status": "error", "error": "'data' must be an object"})
+            continue
+        error = reading_values_error(record['data'])
+        if error:
+            results.append({"index": index, "status": "error", "error": error})
+            continue
+        try:
+            timestamp = parse_reading_timestamp(record.get('timestamp'))
+        except (TypeError, ValueError, OverflowError, OSError):
+            results.append({"index": index, "status": "error", "error": "Invalid 'timestamp'"})
+            continue
+        if timestamp is None:
+            timestamp = received + timedelta(milliseconds=unstamped.get(device.id, 0))
+            unstamped[device.id] = unstamped.get(device.id, 0) + 1
+        readings.append((device, timestamp, record['data']))
+        results.append({"index": index, "status": "ok"})
+    return results, readings
+
+def mark_duplicates(results, readings, rows):
+    """
+    Marks the 'ok' results of batch readings that were not stored because
+    their device already has a reading at that millisecond, stored before or
+    earlier in the batch; `rows` are the row mappings commit_readings
+    stored. Returns how many of the readings were stored.
+    """
+    stored = {(row['device_id'], row['timestamp']) for row in rows}
+    accepted = 0
+    ok_results = [result for result in results if result['status'] == 'ok']
+    for (device, timestamp, _), result in zip(readings, ok_results):
+        key = (device.id, truncate_to_millis(timestamp))
+        if key in stored:
+            stored.discard(key)
+            accepted += 1
+        else:
+            result['status'] = 'duplicate'
+    return accepted
+
+def recommended_intervals(readings):
+    """
+    {hardware_id: seconds until the device should report again} for the
+    devices of (device, timestamp, sensor_readings) tuples; see
+    app/reporting.py.
+    """
+    per_device = {}
+    received = datetime.utcnow()
+    for device, timestamp, sensor_readings in readings:
+        per_device.setdefault(device.unique_hardware_id, (device, []))[1].append((timestamp or received, sensor_readings))
+    return {
+        hardware_id: reporting_advisor.advise(device, sorted(device_readings, key=lambda item: item[0]))
+        for hardware_id, (device, device_readings) in per_device.items()
+    }
+
+def single_ingest_reply(stored, next_report_seconds):
+    """The /api/ingest response body; `stored` are the rows commit_readings stored."""
+    if not stored:
+        return {"status": "duplicate", "message": "The device already has a reading at that millisecond",
+                "next_report_seconds": next_report_seconds}
+    return {"status": "success", "message": "Data logged successfully", "next_report_seconds": next_report_seconds}
 
 @bp.route('/api/ingest', methods=['POST'])
 def ingest_data():
-    req_data = request.get_json()
-    if not req_data:
-        return jsonify({"error": "Invalid JSON"}), 400
-    device_hardware_id = req_data.get('device_id')
-    sensor_readings = req_data.get('data')
-    if not device_hardware_id or not sensor_readings:
-        return jsonify({"error": "Missing 'device_id' or 'data' in payload"}), 400
-    device = Device.query.filter_by(unique_hardware_id=device_hardware_id).first()
+    req_data, error = ingest_request_payload(single=True)
+    error = error or ingest_payload_error(req_data)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    device_hardware_id = req_data['device_id']
+    sensor_readings = req_data['data']
+    # The device's own timestamp if it sent one (binary bodies always
+    # carry one), otherwise the reading is stamped on arrival
+    timestamp = parse_reading_timestamp(req_data.get('timestamp'))
+    device = device_registry.get(device_hardware_id)
     if not device:
         return jsonify({"error": f"Device with ID '{device_hardware_id}' is not registered."}), 403
-    new_data_log = SensorData(
-        device_id=device.id,
-        temperature=sensor_readings.get('temperature'),
-        humidity=sensor_readings.get('humidity'),
-        ac_voltage=sensor_readings.get('ac_voltage'),
-        water_detected=sensor_readings.get('water_detected', False)
-    )
-    db.session.add(new_data_log)
-    check_and_send_alerts(device, sensor_readings)
-    db.session.commit()
-    return jsonify({"status": "success", "message": "Data logged successfully"}), 200
+    readings = [(device, timestamp, sensor_readings)]
+    if current_app.config['INGEST_MODE'] == 'write_behind':
+        if not get_ingest_writer().submit(device, timestamp, sensor_readings):
+            return jsonify({"error": "Ingest queue is full, retry later"}), 503, {'Retry-After': '1'}
+        return jsonify({
+            "status": "accepted", "message": "Data queued for storage",
+            "next_report_seconds": recommended_intervals(readings)[device_hardware_id]
+        }), 202
+    stored = commit_readings(readings)
+    return jsonify(single_ingest_reply(stored, recommended_intervals(readings)[device_hardware_id])), 200
+
+@bp.route('/api/ingest/batch', methods=['POST'])
+def ingest_batch():
+    """
+    Accepts a JSON array of {device_id, timestamp, data} records, possibly for
+    many devices, and stores them in one transaction. Each record gets its own
+    status in the response so one bad record does not reject the whole batch;
+    a reading the device already sent is reported as a duplicate.
+    The records can also come as MessagePack or binary readings, optionally
+    gzip-compressed (see app/payloads.py). The response recommends when each
+    device should report next.
+    """
+    req_data, error = ingest_request_payload()
+    if not error:
+        req_data, error = batch_payload_records(req_data)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    # Resolve every hardware ID in the batch at once; only IDs missing from
+    # the device registry are looked up, with a single query.
+    hardware_ids = batch_hardware_ids(req_data)
+    devices = device_registry.get_many(hardware_ids) if hardware_ids else {}
+    results, readings = validate_batch(req_data, devices)
+
+    if current_app.config['INGEST_MODE'] == 'write_behind':
+        # Queue record by record; whatever does not fit is reported back so
+        # the sender can retry just those records.
+        writer = get_ingest_writer()
+        ok_results = [result for result in results if result['status'] == 'ok']
+        accepted = 0
+        for (device, timestamp, sensor_readings), result in zip(readings, ok_results):
+            if writer.submit(device, timestamp, sensor_readings):
+                accepted += 1
+            else:
+                result.update({"status": "error", "error": "Ingest queue is full, retry later"})
+    else:
+        accepted = mark_duplicates(results, readings, commit_readings(readings))
+    return jsonify({
+        "status": "success" if accepted == len(req_data) else "partial",
+        "accepted": accepted,
+        "rejected": len(req_data) - accepted,
+        "results": results,
+        "next_report_seconds": recommended_intervals(readings)
+    }), 200
+
+def assigned_device_ids():
+    """Sorted ids of the current user's devices, from the access index."""
+    return sorted(access_index.device_ids(current_user.id))
+
+def assigned_devices():
+    """The current user's devices ordered by id, in one primary key lookup."""
+    device_ids = assigned_device_ids()
+    return Device.query.filter(Device.id.in_(device_ids)).order_by(Device.id).all() if device_ids else []
 
 @bp.route('/dashboard')
 @login_required
@@ -121,67 +389,363 @@ def dashboard():
     Renders the main dashboard, including live alert status for each device,
     respecting user-device assignments.
     """
-    assigned_devices = current_user.devices.all()
-    assigned_device_ids = [device.id for device in assigned_devices]
+    devices = assigned_devices()
+    assigned_device_ids = [device.id for device in devices]
     
     latest_logs_with_status = []
     if assigned_device_ids:
-        subquery = db.session.query(
-            SensorData.device_id,
-            db.func.max(SensorData.timestamp).label('max_timestamp')
-        ).filter(SensorData.device_id.in_(assigned_device_ids)).group_by(SensorData.device_id).subquery()
-
-        results = db.session.query(SensorData, Device).join(
-            subquery,
-            db.and_(
-                SensorData.device_id == subquery.c.device_id,
-                SensorData.timestamp == subquery.c.max_timestamp
-            )
-        ).join(Device, SensorData.device_id == Device.id).all()
-        
-        for log, device in results:
-            latest_logs_with_status.append({
-                'log': log,
-                'device': device
-            })
+        # Served from the in-memory recent readings where possible; the
+        # DeviceLatest table (one row per device) covers the rest.
+        latest, missing_ids = {}, assigned_device_ids
+        recent = get_recent_readings()
+        if recent is not None:
+            latest, missing_ids = recent.latest(assigned_device_ids)
+        if missing_ids:
+            latest.update({log.device_id: log for log in DeviceLatest.query.filter(DeviceLatest.device_id.in_(missing_ids))})
+
+        for device in devices:
+            if device.id in latest:
+                latest_logs_with_status.append({
+                    'log': latest[device.id],
+                    'device': device
+                })
 
     current_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
 
     return render_template(
         'dashboard.html', 
         items=latest_logs_with_status,
-        last_updated=current_time
+        last_updated=current_time,
+        poll_seconds=current_app.config['DASHBOARD_POLL_SECONDS']
     )
 
-@bp.route('/history')
+# Changes committed by a slower concurrent transaction can carry an
+# updated_at slightly older than a cursor already handed out, so `since`
+# polls look back this far; resending a device twice is harmless.
+DASHBOARD_SINCE_OVERLAP = timedelta(seconds=5)
+
+def latest_readings_query(device_ids):
+    """(Device, DeviceLatest) pairs of the given devices."""
+    return db.session.query(Device, DeviceLatest).join(
+        DeviceLatest, DeviceLatest.device_id == Device.id
+    ).filter(Device.id.in_(device_ids))
+
+def dashboard_device_json(device, latest):
+    return {
+        'id': device.id,
+        'name': device.name,
+        'hardware_id': device.unique_hardware_id,
+        'timestamp': latest.timestamp.isoformat(),
+        'temperature': latest.temperature,
+        'humidity': latest.humidity,
+        'ac_voltage': latest.ac_voltage,
+        'water_detected': latest.water_detected,
+        'alerts': {key: bool(getattr(device, field)) for field, key in ALERT_STATUS_KEYS.items()}
+    }
+
+@bp.route('/api/dashboard')
 @login_required
-def history():
-    assigned_devices = current_user.devices.all()
-    assigned_device_ids = [d.id for d in assigned_devices]
+def dashboard_api():
+    """
+    Latest reading and alert status of the user's devices as JSON.
+
+    Unchanged state is answered with 304 via ETag / If-None-Match after one
+    aggregate query. With ?since=<cursor> (the `cursor` of a previous
+    response) only devices that changed after it are returned; `device_ids`
+    always lists every assigned device so clients can drop removed ones.
+    """
+    device_ids = assigned_device_ids()
+    last_change, reporting = db.session.query(
+        db.func.max(DeviceLatest.updated_at), db.func.count()
+    ).filter(DeviceLatest.device_id.in_(device_ids)).one() if device_ids else (None, 0)
+    cursor = str(to_epoch_ms(last_change)) if last_change else '0'
+    etag = hashlib.sha1(f"{device_ids}:{reporting}:{cursor}".encode()).hexdigest()[:16]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    query = latest_readings_query(device_ids)
+    since = request.args.get('since', type=int)
+    if since:
+        query = query.filter(DeviceLatest.updated_at > from_epoch_ms(since) - DASHBOARD_SINCE_OVERLAP)
+    response = jsonify({
+        'cursor': cursor,
+        'device_ids': device_ids,
+        'devices': [dashboard_device_json(device, latest) for device, latest in query.order_by(Device.id)],
+        'server_time': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/stream')
+@login_required
+def stream():
+    """
+    Server-Sent Events stream of new readings ('reading') and alert status
+    changes ('alert') for the user's assigned devices. The assignments are
+    re-read every keepalive period, so devices unassigned meanwhile stop
+    streaming. The stream ends if the client falls too far behind;
+    EventSource then reconnects.
+    """
+    device_ids = assigned_device_ids()
+    keepalive = current_app.config['EVENTS_KEEPALIVE_SECONDS']
+    linger = current_app.config['EVENTS_LINGER_MS'] / 1000.0
+    hub = get_event_hub()
+    subscriber = hub.subscribe(device_ids, current_user.id)
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+    detached = request.environ.get('envmon.stream')
+    if detached is not None:
+        # asgi.py sends the frames itself on its event loop, so an open
+        # stream does not hold one of its WSGI threads
+        detached.append(subscriber)
+        return Response(mimetype='text/event-stream', headers=headers)
+
+    app = current_app._get_current_object()
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            checked = time.monotonic()
+            while not subscriber.dropped:
+                frames = subscriber.get_all(keepalive, linger)
+                if time.monotonic() - checked >= keepalive:
+                    with app.app_context():
+                        hub.refresh_access(subscriber)
+                    checked = time.monotonic()
+                # A comment line keeps proxies from closing an idle stream
+                yield ''.join(frames) if frames else ': keepalive\n\n'
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers=headers)
+
+# Chart.js series name -> reading field
+CHART_FIELDS = {'temperatures': 'temperature', 'humidities': 'humidity', 'ac_voltages': 'ac_voltage'}
+
+def build_chart_data(rows, max_points, bucket_seconds=None):
+    """
+    Builds the Chart.js series for the history page. Each series is reduced
+    independently with LTTB so the page size is bounded by max_points rather
+    than by the number of readings, while peaks are kept.
+
+    Rollup rows (`bucket_seconds` given) are plotted as their envelope: the
+    bucket's minimum at its start and its maximum half a bucket later,
+    rather than the average, so a short breach inside a bucket still shows.
+    """
+    if bucket_seconds is None:
+        timestamps = [to_epoch_ms(row.timestamp) / 1000 for row in rows]
+        columns = {field: [getattr(row, field) for row in rows] for field in CHART_FIELDS.values()}
+        return build_chart_series(timestamps, columns, max_points)
+    points = []
+    for row in rows:
+        start = to_epoch_ms(row.timestamp) / 1000
+        points.append((start, row, 'min'))
+        points.append((start + bucket_seconds / 2, row, 'max'))
+    # Rows of several devices share buckets; LTTB needs sorted x values
+    points.sort(key=lambda point: point[0])
+    timestamps = [x for x, _, _ in points]
+    columns = {
+        field: [getattr(row, f'{field}_{bound}') for _, row, bound in points] for field in CHART_FIELDS.values()
+    }
+    return build_chart_series(timestamps, columns, max_points)
+
+def build_chart_series(timestamps, columns, max_points):
+    """build_chart_data for column data: epoch seconds and {field: values}."""
+    chart_data = {}
+    for key, field in CHART_FIELDS.items():
+        xs, ys = downsample_series(timestamps, columns[field], max_points)
+        chart_data[key] = {
+            'x': [(EPOCH + timedelta(seconds=float(x))).isoformat() for x in xs],
+            'y': [round(float(y), 3) for y in ys]
+        }
+    return chart_data
+
+def history_filters():
+    """
+    Reads the date range and device filter shared by /history and its export.
+    Returns (device_ids, start_date_str, end_date_str, start_date, end_date,
+    selected_device_id); device_ids is already narrowed to the selected
+    device and never includes devices the user is not assigned.
+    """
+    assigned = assigned_device_ids()
     end_date_str = request.args.get('end_date', datetime.now(timezone.utc).strftime('%Y-%m-%d'))
     start_date_str = request.args.get('start_date', (datetime.now(timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%d'))
     selected_device_id = request.args.get('device_id', 'all')
     start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
     end_date = datetime.strptime(end_date_str, '%Y-%m-%d') + timedelta(days=1)
+    device_ids = assigned
+    if selected_device_id != 'all':
+        device_ids = [d for d in assigned if d == int(selected_device_id)]
+    return device_ids, start_date_str, end_date_str, start_date, end_date, selected_device_id
+
+def raw_history_query(device_ids, start_date, end_date, *entities):
+    """SensorData readings of the given devices in [start_date, end_date)."""
+    query = db.session.query(*entities) if entities else SensorData.query
+    return query.filter(SensorData.device_id.in_(device_ids), SensorData.timestamp >= start_date, SensorData.timestamp < end_date)
+
+def history_chart_query(device_ids, start_date, end_date, rollup_model=None):
+    """The chart's rows oldest first: raw readings, or the buckets of `rollup_model`."""
+    if rollup_model is None:
+        return raw_history_query(device_ids, start_date, end_date).order_by(SensorData.timestamp.asc(), SensorData.device_id.asc())
+    return rollup_model.query.filter(
+        rollup_model.device_id.in_(device_ids), rollup_model.bucket >= start_date, rollup_model.bucket < end_date
+    ).order_by(rollup_model.bucket.asc())
+
+@bp.route('/history')
+@login_required
+def history():
+    device_ids, start_date_str, end_date_str, start_date, end_date, selected_device_id = history_filters()
+    devices = assigned_devices()
+    # The page sends the chart width as max_points; never plot more points than pixels
+    max_points = request.args.get('max_points', current_app.config['HISTORY_MAX_POINTS'], type=int)
+    max_points = max(10, min(max_points, current_app.config['HISTORY_MAX_POINTS_LIMIT']))
     historical_data = []
-    if assigned_device_ids:
-        query = SensorData.query.filter(SensorData.device_id.in_(assigned_device_ids), SensorData.timestamp >= start_date, SensorData.timestamp < end_date)
-        if selected_device_id != 'all':
-            query = query.filter(SensorData.device_id == int(selected_device_id))
-        historical_data = query.order_by(SensorData.timestamp.asc()).all()
-    chart_data = {
-        'labels': [d.timestamp.isoformat() for d in historical_data],
-        'temperatures': [d.temperature for d in historical_data],
-        'humidities': [d.humidity for d in historical_data],
-        'ac_voltages': [d.ac_voltage for d in historical_data]
-    }
-    return render_template('history.html', data=historical_data, chart_data=chart_data, start_date=start_date_str, end_date=end_date_str, devices=assigned_devices, selected_device_id=selected_device_id)
+    chart_data = None
+    # Wide ranges are read from the rollup tables so the number of rows
+    # loaded stays roughly constant whatever the range.
+    resolution, rollup_model = choose_resolution(
+        start_date, end_date, current_app.config['HISTORY_MIN_POINTS'], current_app.config['HISTORY_MAX_BUCKETS']
+    )
+    recent = get_recent_readings() if device_ids else None
+    window = recent.window(device_ids, start_date, end_date) if recent is not None else None
+    if window is not None:
+        # Ranges still held in memory skip the database entirely, and can
+        # plot raw readings even where a rollup would otherwise be used.
+        resolution = 'raw'
+        timestamps, columns = window
+        chart_data = build_chart_series(timestamps / 1000.0, columns, max_points)
+    elif device_ids:
+        historical_data = history_chart_query(device_ids, start_date, end_date, rollup_model).all()
+        if rollup_model is None and has_archived_data(device_ids, start_date, end_date):
+            historical_data = list(merge_archived(
+                historical_data, [ArchivedReading(**row) for row in iter_archived(device_ids, start_date, end_date)],
+                key=lambda row: (row.timestamp, row.device_id)
+            ))
+    if chart_data is None:
+        chart_data = build_chart_data(historical_data, max_points, BUCKET_SECONDS.get(rollup_model))
+
+    # The table lists raw readings one keyset page at a time
+    page = KeysetPage([])
+    if device_ids:
+        # Readings older than the retention window live in the archive
+        archive_source = None
+        if has_archived_data(device_ids, start_date, end_date):
+            archive_source = archived_page_source(device_ids, start_date, end_date, {d.id: d for d in devices})
+        page = keyset_paginate(raw_history_query(device_ids, start_date, end_date), SensorData.timestamp, SensorData.device_id, requested_page_size(), extra_source=archive_source)
+    return render_template('history.html', page=page, chart_data=chart_data, start_date=start_date_str, end_date=end_date_str, devices=devices, selected_device_id=selected_device_id, resolution=resolution, max_points=max_points)
+
+EXPORT_COLUMNS = ('timestamp', 'device_id', 'device_name', 'temperature', 'humidity', 'ac_voltage', 'water_detected')
+
+def _gzip_stream(chunks):
+    """Compresses a stream of byte chunks into a single gzip member on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+@bp.route('/history/export')
+@login_required
+def history_export():
+    """
+    Streams the raw readings selected by the /history filters as CSV or
+    NDJSON. Rows are fetched in keyset chunks of EXPORT_CHUNK_ROWS, each in
+    its own short read transaction, and written out as they arrive, so
+    memory use stays flat for any range and a slow download never holds
+    the database while ingest waits to commit.
+    """
+    device_ids, start_date_str, end_date_str, start_date, end_date, _ = history_filters()
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({"error": "format must be 'csv' or 'ndjson'"}), 400
+    use_gzip = request.args.get('gzip') in ('1', 'true', 'yes')
+    chunk_rows = current_app.config['EXPORT_CHUNK_ROWS']
+
+    def generate_rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(EXPORT_COLUMNS)
+        # Send the header straight away, before the query runs
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        if not device_ids:
+            return
+        query = raw_history_query(
+            device_ids, start_date, end_date,
+            SensorData.timestamp, SensorData.device_id, Device.name, SensorData.temperature,
+            SensorData.humidity, SensorData.ac_voltage, SensorData.water_detected
+        ).join(Device, SensorData.device_id == Device.id)
+
+        def stored_rows():
+            after = None
+            while True:
+                chunk = keyset_query(query, SensorData.timestamp, SensorData.device_id, after=after).limit(chunk_rows).all()
+                # End the read transaction before the chunk is sent
+                db.session.rollback()
+                yield from chunk
+                if len(chunk) < chunk_rows:
+                    return
+                after = (chunk[-1][0], chunk[-1][1])
+
+        rows = stored_rows()
+        if has_archived_data(device_ids, start_date, end_date):
+            # Interleave archived readings, still in (timestamp, device_id) order
+            names = dict(db.session.query(Device.id, Device.name).filter(Device.id.in_(device_ids)).all())
+            archived = (
+                (row['timestamp'], row['device_id'], names.get(row['device_id']), row['temperature'],
+                 row['humidity'], row['ac_voltage'], row['water_detected'])
+                for row in iter_archived(device_ids, start_date, end_date)
+            )
+            rows = merge_archived(rows, archived, key=lambda row: (row[0], row[1]))
+        for count, row in enumerate(rows, 1):
+            values = (row[0].isoformat(),) + tuple(row[1:])
+            if export_format == 'csv':
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))) + '\n')
+            if count % chunk_rows == 0:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+
+    body = generate_rows()
+    filename = f"history_{start_date_str}_{end_date_str}.{export_format}"
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    if use_gzip:
+        body = _gzip_stream(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def alert_log_query(device_ids, device_id='all', alert_type='all'):
+    """AlertLog entries of the given devices, optionally narrowed to one device or alert type."""
+    query = AlertLog.query.filter(AlertLog.device_id.in_(device_ids))
+    if device_id != 'all':
+        query = query.filter(AlertLog.device_id == int(device_id))
+    if alert_type != 'all':
+        query = query.filter(AlertLog.alert_type == alert_type)
+    return query
 
 @bp.route('/alerts')
 @login_required
 def alerts():
-    assigned_device_ids = [device.id for device in current_user.devices.all()]
-    user_alerts = []
+    devices = assigned_devices()
+    assigned_device_ids = [device.id for device in devices]
+    selected_device_id = request.args.get('device_id', 'all')
+    selected_alert_type = request.args.get('alert_type', 'all')
+    page = KeysetPage([])
     if assigned_device_ids:
-        user_alerts = AlertLog.query.filter(AlertLog.device_id.in_(assigned_device_ids)).order_by(AlertLog.timestamp.desc()).all()
-    return render_template('alerts.html', alerts=user_alerts)
+        query = alert_log_query(assigned_device_ids, selected_device_id, selected_alert_type)
+        page = keyset_paginate(query, AlertLog.timestamp, AlertLog.id, requested_page_size(), descending=True)
+    return render_template('alerts.html', page=page, devices=devices, alert_types=ALERT_TYPES, selected_device_id=selected_device_id, selected_alert_type=selected_alert_type)
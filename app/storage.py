@@ -0,0 +1,111 @@
+# /app/storage.py
+
+from datetime import datetime
+from sqlalchemy import event
+from app import db
+from app.models import DeviceLatest, SensorData
+
+# Columns copied from a SensorData row into DeviceLatest
+LATEST_FIELDS = ('temperature', 'humidity', 'ac_voltage', 'water_detected', 'timestamp')
+
+# Rows per multi-row INSERT ... ON CONFLICT statement
+UPSERT_CHUNK_SIZE = 100
+
+def configure_sqlite(engine, journal_mode):
+    """
+    Sets `journal_mode` on every new connection of a file-backed SQLite
+    engine. In-memory databases and other dialects are left alone.
+    """
+    if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+        return
+
+    def set_journal_mode(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        cursor.close()
+    event.listen(engine, 'connect', set_journal_mode)
+
+def dialect_insert(model):
+    """
+    Returns an INSERT construct for the active database that supports
+    ON CONFLICT upserts, or None if the dialect does not have one.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(model)
+
+def insert_sensor_rows(rows):
+    """
+    Bulk-inserts SensorData row mappings inside the caller's transaction.
+    A device has at most one reading per millisecond, so a reading that is
+    already stored (e.g. an upload retried after a timeout) is skipped
+    instead of failing the batch. Returns the rows that were inserted.
+    """
+    unique = {}
+    for row in rows:
+        unique.setdefault((row['device_id'], row['timestamp']), row)
+    stmt = dialect_insert(SensorData)
+    if stmt is None:
+        values = list(unique.values())
+        if values:
+            db.session.execute(db.insert(SensorData), values)
+        return values
+    inserted = []
+    values = list(unique.values())
+    for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+        chunk = stmt.values(values[start:start + UPSERT_CHUNK_SIZE]).on_conflict_do_nothing()
+        stored = db.session.execute(chunk.returning(SensorData.device_id, SensorData.timestamp)).all()
+        inserted.extend(unique[key] for key in map(tuple, stored))
+    return inserted
+
+def touch_device_latest(device_ids):
+    """Marks the dashboard state of `device_ids` as changed without a new reading."""
+    if device_ids:
+        db.session.execute(
+            db.update(DeviceLatest).where(DeviceLatest.device_id.in_(device_ids)).values(updated_at=datetime.utcnow())
+        )
+
+def latest_per_device(rows):
+    """Reduces SensorData row mappings to the newest one per device."""
+    latest = {}
+    for row in rows:
+        current = latest.get(row['device_id'])
+        if current is None or row['timestamp'] >= current['timestamp']:
+            latest[row['device_id']] = row
+    return list(latest.values())
+
+def upsert_device_latest(rows):
+    """
+    Upserts DeviceLatest from SensorData row mappings inside the caller's
+    transaction. A stored reading is only replaced by a newer one, so late
+    or out-of-order readings never move a device's "last seen" backwards.
+    """
+    rows = latest_per_device(rows)
+    if not rows:
+        return
+    now = datetime.utcnow()
+    values = [{'device_id': row['device_id'], 'updated_at': now, **{field: row[field] for field in LATEST_FIELDS}} for row in rows]
+    stmt = dialect_insert(DeviceLatest)
+    if stmt is None:
+        for value in values:
+            current = db.session.get(DeviceLatest, value['device_id'])
+            if current is None:
+                db.session.add(DeviceLatest(**value))
+            elif value['timestamp'] >= current.timestamp:
+                for field in LATEST_FIELDS + ('updated_at',):
+                    setattr(current, field, value[field])
+        return
+    # Chunked to stay well below SQLite's bound-parameter limit
+    for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+        chunk = stmt.values(values[start:start + UPSERT_CHUNK_SIZE])
+        chunk = chunk.on_conflict_do_update(
+            index_elements=['device_id'],
+            set_={field: chunk.excluded[field] for field in LATEST_FIELDS + ('updated_at',)},
+            where=DeviceLatest.timestamp <= chunk.excluded.timestamp
+        )
+        db.session.execute(chunk)
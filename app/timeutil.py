@@ -0,0 +1,15 @@
+# /app/timeutil.py
+
+from datetime import datetime, timedelta
+
+# Timestamps are naive UTC datetimes throughout the app
+EPOCH = datetime(1970, 1, 1)
+
+def to_epoch_ms(timestamp):
+    """Integer milliseconds since the epoch of a naive UTC datetime (sub-millisecond part dropped)."""
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+def from_epoch_ms(value):
+    """The naive UTC datetime `value` milliseconds after the epoch."""
+    return EPOCH + timedelta(milliseconds=int(value))
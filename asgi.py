@@ -0,0 +1,14 @@
+# /asgi.py
+
+from app import create_app
+from app.async_ingest import IngestASGI
+
+# ASGI entry point for large device fleets. Device ingest is served on an
+# asyncio event loop and everything else by the Flask app, e.g.:
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000 --backlog 4096
+#
+# Run a single worker process: the recent readings buffer, the live event
+# stream and the ingest batcher all live in this process.
+flask_app = create_app()
+app = IngestASGI(flask_app)
@@ -19,6 +19,10 @@ class Config:
         'sqlite:///' + os.path.join(basedir, 'app.db') + '?timeout=15'
         
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite journal mode set on every connection. In WAL mode readers (a
+    # long export, the history page) don't block ingest commits and vice
+    # versa; set to DELETE to keep SQLite's default rollback journal.
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
 
     # --- Email Configuration ---
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.sendgrid.net'
@@ -27,3 +31,129 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or 'alerts@yourdomain.com'
+
+    # --- Notification Outbox Configuration ---
+    # Emails are queued in the outbox table and delivered by notification_worker.py.
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE') or 50)
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL') or 5)
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS') or 8)
+    OUTBOX_RETRY_BASE_SECONDS = int(os.environ.get('OUTBOX_RETRY_BASE_SECONDS') or 30)
+    OUTBOX_RETRY_MAX_SECONDS = int(os.environ.get('OUTBOX_RETRY_MAX_SECONDS') or 3600)
+    # Alert emails to the same recipient are held for up to this long and
+    # sent as one digest. Critical alerts (water leaks) are never held; 0
+    # only folds alerts that happen to be waiting at the same time.
+    ALERT_DIGEST_SECONDS = int(os.environ.get('ALERT_DIGEST_SECONDS') or 60)
+    # Period covered by the notification counters in /admin/stats.
+    NOTIFICATION_STATS_MINUTES = int(os.environ.get('NOTIFICATION_STATS_MINUTES') or 60)
+
+    # --- Ingestion Configuration ---
+    # Upper bound on the number of records accepted by /api/ingest/batch.
+    INGEST_BATCH_MAX_RECORDS = int(os.environ.get('INGEST_BATCH_MAX_RECORDS') or 1000)
+    # Ingest bodies may be gzip-compressed (Content-Encoding: gzip) and sent
+    # as JSON, MessagePack or compact binary readings (see app/payloads.py);
+    # this caps the size of a body once decompressed.
+    INGEST_MAX_DECODED_BYTES = int(os.environ.get('INGEST_MAX_DECODED_BYTES') or 1024 * 1024)
+    # Seconds a cached device registry entry is trusted before it is reloaded.
+    # Admin edits invalidate the cache immediately in the process that made them;
+    # this is the fallback for other processes.
+    DEVICE_REGISTRY_TTL = int(os.environ.get('DEVICE_REGISTRY_TTL') or 60)
+    # Same for the cached user-device assignments (see app/access.py), and
+    # for the logged-in user loaded on every request, which is kept short so
+    # a user deleted by another process is logged out soon.
+    ACCESS_INDEX_TTL = int(os.environ.get('ACCESS_INDEX_TTL') or 60)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 30)
+
+    # 'sync' commits every request on its own (default). 'write_behind' queues
+    # readings in memory and lets one writer thread group-commit them, which
+    # avoids "database is locked" stalls on SQLite under concurrent traffic.
+    INGEST_MODE = os.environ.get('INGEST_MODE') or 'sync'
+    INGEST_FLUSH_INTERVAL_MS = int(os.environ.get('INGEST_FLUSH_INTERVAL_MS') or 200)
+    INGEST_FLUSH_MAX_ROWS = int(os.environ.get('INGEST_FLUSH_MAX_ROWS') or 500)
+    INGEST_QUEUE_MAX_SIZE = int(os.environ.get('INGEST_QUEUE_MAX_SIZE') or 10000)
+    # Seconds a request waits for queue space before answering 503
+    INGEST_QUEUE_PUT_TIMEOUT = float(os.environ.get('INGEST_QUEUE_PUT_TIMEOUT') or 0.5)
+    # Under asgi.py, ingest always group-commits on the event loop (using
+    # INGEST_FLUSH_MAX_ROWS and INGEST_QUEUE_MAX_SIZE) and every other
+    # request is served by the Flask app on this many threads.
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS') or 32)
+    # Request bodies larger than this are answered 413 while being read
+    ASGI_MAX_BODY_BYTES = int(os.environ.get('ASGI_MAX_BODY_BYTES') or 1024 * 1024)
+
+    # --- Adaptive Reporting ---
+    # Ingest responses tell each device when to report next
+    # (next_report_seconds): the fast interval while it is in or near an
+    # alert, the normal one while its readings change and the slow one while
+    # they are stable. Admins can set these per device category on the
+    # Reporting page; these are the defaults. The interval never exceeds half
+    # of the device's offline threshold, so a stable device is not reported
+    # as lost.
+    REPORT_FAST_SECONDS = int(os.environ.get('REPORT_FAST_SECONDS') or 10)
+    REPORT_NORMAL_SECONDS = int(os.environ.get('REPORT_NORMAL_SECONDS') or 60)
+    REPORT_SLOW_SECONDS = int(os.environ.get('REPORT_SLOW_SECONDS') or 300)
+    REPORT_NEAR_ALERT_PERCENT = float(os.environ.get('REPORT_NEAR_ALERT_PERCENT') or 10)
+    REPORT_STABLE_CHANGE_PERCENT = float(os.environ.get('REPORT_STABLE_CHANGE_PERCENT') or 1)
+    # Seconds the policies are cached; admin edits apply at once in their process
+    REPORTING_POLICY_TTL = int(os.environ.get('REPORTING_POLICY_TTL') or 60)
+
+    # --- History Configuration ---
+    # /history reads the rollup (minute, 5-minute, 15-minute, hour, 6-hour or
+    # day) whose points per series come closest to this band, and raw
+    # readings for ranges shorter than HISTORY_MIN_POINTS minutes.
+    HISTORY_MIN_POINTS = int(os.environ.get('HISTORY_MIN_POINTS') or 1000)
+    HISTORY_MAX_BUCKETS = int(os.environ.get('HISTORY_MAX_BUCKETS') or 2000)
+    # Each chart series is downsampled (LTTB) to max_points, which the page
+    # derives from the chart width; these are the default and the upper bound.
+    HISTORY_MAX_POINTS = int(os.environ.get('HISTORY_MAX_POINTS') or 1000)
+    HISTORY_MAX_POINTS_LIMIT = int(os.environ.get('HISTORY_MAX_POINTS_LIMIT') or 5000)
+
+    # --- Recent Readings Buffer ---
+    # Newest readings kept in memory per device (NumPy ring buffer, about 21
+    # bytes each) to serve the dashboard and short history ranges; loaded
+    # from the database at startup. 2880 is 48 hours at one reading per
+    # minute. The buffer is per process and only sees the readings that
+    # process ingests, so it is off (0) by default: only enable it when one
+    # process serves both the pages and all ingest (`python run.py`, or a
+    # single uvicorn worker running asgi.py).
+    RECENT_READINGS_CAPACITY = int(os.environ.get('RECENT_READINGS_CAPACITY') or 0)
+
+    # --- Dashboard ---
+    # How often the dashboard page polls /api/dashboard for changes
+    DASHBOARD_POLL_SECONDS = int(os.environ.get('DASHBOARD_POLL_SECONDS') or 10)
+
+    # --- Live Event Stream (/stream) ---
+    # Events buffered per connected client; a client that falls this far
+    # behind is disconnected instead of slowing ingest down.
+    EVENTS_CLIENT_BUFFER = int(os.environ.get('EVENTS_CLIENT_BUFFER') or 256)
+    EVENTS_KEEPALIVE_SECONDS = int(os.environ.get('EVENTS_KEEPALIVE_SECONDS') or 15)
+    # Delay before a client's stream is flushed, so bursts go out as one write
+    EVENTS_LINGER_MS = int(os.environ.get('EVENTS_LINGER_MS') or 100)
+
+    # --- Connection Loss Detection ---
+    # Defaults for devices without their own settings: a device is offline
+    # after this many minutes without a reading, and is alerted about again
+    # at most this often while it stays offline.
+    OFFLINE_AFTER_MINUTES = int(os.environ.get('OFFLINE_AFTER_MINUTES') or 5)
+    REALERT_AFTER_MINUTES = int(os.environ.get('REALERT_AFTER_MINUTES') or 15)
+    # 'poll' leaves detection to connection_checker.py (default). 'event' runs
+    # it inside the app: ingest tracks when each device goes offline and a
+    # thread wakes up exactly then, so alerts go out within seconds. Like the
+    # recent readings buffer this needs a single process handling all ingest.
+    OFFLINE_DETECTION = os.environ.get('OFFLINE_DETECTION') or 'poll'
+
+    # --- Pagination ---
+    # Rows per page for the history table and the alert lists (?page_size=)
+    PAGE_SIZE = int(os.environ.get('PAGE_SIZE') or 50)
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE') or 500)
+
+    # Rows fetched per round trip (and per streamed chunk) by /history/export
+    EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS') or 5000)
+
+    # --- Retention / Archive Configuration ---
+    # `flask archive-readings` moves raw readings older than RETENTION_DAYS out of
+    # SQLite into Parquet files under ARCHIVE_DIR (partitioned by device and month).
+    # /history and /history/export read across both transparently.
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or os.path.join(basedir, 'archive')
+    RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS') or 30)
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE') or 5000)
+    # Seconds to pause between batches so ingest can take the write lock
+    ARCHIVE_BATCH_PAUSE = float(os.environ.get('ARCHIVE_BATCH_PAUSE') or 0.2)
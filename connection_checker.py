@@ -1,10 +1,9 @@
 # /connection_checker.py
 
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 from app import create_app, db
-from app.models import Device, SensorData, AlertLog
-from app.email import send_alert_email
+from app.offline import offline_devices_query, raise_connection_loss_alerts
 
 # Create a Flask app instance to work with the database
 app = create_app()
@@ -15,63 +14,26 @@ with app.app_context():
     def check_device_status():
         """
         Checks all devices for connection loss and sends alerts if a device is offline.
+        One query finds every offline device without a recent alert, so the
+        cost of a pass barely grows with the size of the fleet.
         """
         print(f"[{datetime.utcnow()}] Running device status check...")
-        
-        # Define the time threshold for a device to be considered offline
-        offline_threshold = datetime.utcnow() - timedelta(minutes=5)
-        
-        # Get all devices from the database
-        devices = Device.query.all()
-        
-        for device in devices:
-            # Find the most recent sensor log for this device
-            latest_log = SensorData.query.filter_by(device_id=device.id).order_by(SensorData.timestamp.desc()).first()
-            
-            is_offline = False
-            if latest_log is None:
-                # If a device has never sent data, it's considered offline
-                is_offline = True
-            elif latest_log.timestamp < offline_threshold:
-                # If the latest data point is older than our threshold, it's offline
-                is_offline = True
-
-            if is_offline:
-                # --- CHECK IF AN OFFLINE ALERT WAS RECENTLY SENT ---
-                # This prevents spamming the admin with an email every minute for the same offline device.
-                # We check if the last alert for this device in the past 15 minutes was a 'Connection Loss' alert.
-                recent_alert_threshold = datetime.utcnow() - timedelta(minutes=15)
-                
-                last_offline_alert = AlertLog.query.filter(
-                    AlertLog.device_id == device.id,
-                    AlertLog.alert_type == 'Connection Loss',
-                    AlertLog.timestamp > recent_alert_threshold
-                ).first()
-
-                if not last_offline_alert:
-                    print(f"ALERT: Device '{device.name}' appears to be offline. Sending notification.")
-                    
-                    message = f"Connection Loss Alert for device '{device.name}'. No data has been received in over 5 minutes."
-                    
-                    # 1. Log the alert to the database
-                    new_alert = AlertLog(
-                        device_id=device.id,
-                        alert_type='Connection Loss',
-                        message=message
-                    )
-                    db.session.add(new_alert)
-                    db.session.commit()
-                    
-                    # 2. Send an email to the admin
-                    # TODO: Make the recipient dynamic in the future
-                    admin_email = 'admin@example.com' 
-                    subject = f"Device Offline: {device.name}"
-                    send_alert_email(recipient=admin_email, subject=subject, body=message)
-                else:
-                    print(f"INFO: Device '{device.name}' is offline, but an alert was sent recently. Skipping.")
+        now = datetime.utcnow()
+        offline = db.session.execute(offline_devices_query(now)).all()
+        # Log every alert and queue the emails to the admin in one transaction;
+        # the notification worker delivers them. Devices another checker
+        # claimed first are left out.
+        offline = raise_connection_loss_alerts(offline, now)
+        db.session.commit()
+        for device_id, name, _, _ in offline:
+            print(f"ALERT: Device '{name}' appears to be offline. Sending notification.")
 
     # --- Main Loop ---
     if __name__ == "__main__":
+        if app.config['OFFLINE_DETECTION'] == 'event':
+            # The app detects offline devices itself; checking here too would double-alert
+            print("OFFLINE_DETECTION is 'event'; connection loss is detected by the server (run.py or asgi.py) from startup. Exiting.")
+            raise SystemExit(0)
         print("Starting Connection Loss Checker...")
         while True:
             check_device_status()
@@ -0,0 +1,96 @@
+"""Add 5-minute, 15-minute and 6-hour sensor rollup tables
+
+Revision ID: 91d3dcbe69ee
+Revises: 661ef4b08a66
+Create Date: 2026-10-17 21:40:12.318264
+
+"""
+from datetime import datetime, timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '91d3dcbe69ee'
+down_revision = '661ef4b08a66'
+branch_labels = None
+depends_on = None
+
+METRICS = ('temperature', 'humidity', 'ac_voltage')
+
+# new table, finer table it is filled from, bucket length in seconds
+NEW_LEVELS = (
+    ('sensor_rollup_five_minute', 'sensor_rollup_minute', 300),
+    ('sensor_rollup_quarter_hour', 'sensor_rollup_minute', 900),
+    ('sensor_rollup_six_hour', 'sensor_rollup_hour', 21600),
+)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _columns():
+    columns = [
+        sa.Column('device_id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('reading_count', sa.Integer(), nullable=False),
+    ]
+    for metric in METRICS:
+        columns += [
+            sa.Column(f'{metric}_min', sa.Float(), nullable=True),
+            sa.Column(f'{metric}_max', sa.Float(), nullable=True),
+            sa.Column(f'{metric}_sum', sa.Float(), nullable=True),
+            sa.Column(f'{metric}_count', sa.Integer(), nullable=False),
+        ]
+    columns.append(sa.Column('water_detected', sa.Boolean(), nullable=True))
+    return columns
+
+
+def _fill(target, source, seconds):
+    """Re-aggregates the finer rollup table's rows into the new buckets."""
+    bind = op.get_bind()
+    source_table = sa.table(source, *[sa.column(c.name, c.type) for c in _columns()])
+    target_table = sa.table(target, *[sa.column(c.name, c.type) for c in _columns()])
+    rows = bind.execute(
+        sa.select(source_table).order_by(source_table.c.device_id, source_table.c.bucket)
+    ).mappings()
+
+    pending = []
+    current = None
+    for row in rows:
+        offset = int((row['bucket'] - _EPOCH).total_seconds()) // seconds * seconds
+        bucket = _EPOCH + timedelta(seconds=offset)
+        if current is None or (current['device_id'], current['bucket']) != (row['device_id'], bucket):
+            current = dict(row, bucket=bucket, water_detected=bool(row['water_detected']))
+            pending.append(current)
+            if len(pending) > 5000:
+                bind.execute(target_table.insert(), pending[:-1])
+                del pending[:-1]
+            continue
+        current['reading_count'] += row['reading_count']
+        current['water_detected'] = current['water_detected'] or bool(row['water_detected'])
+        for metric in METRICS:
+            if not row[f'{metric}_count']:
+                continue
+            for suffix, pick in (('min', min), ('max', max)):
+                existing = current[f'{metric}_{suffix}']
+                current[f'{metric}_{suffix}'] = row[f'{metric}_{suffix}'] if existing is None else pick(existing, row[f'{metric}_{suffix}'])
+            current[f'{metric}_sum'] = (current[f'{metric}_sum'] or 0) + row[f'{metric}_sum']
+            current[f'{metric}_count'] += row[f'{metric}_count']
+    if pending:
+        bind.execute(target_table.insert(), pending)
+
+
+def upgrade():
+    for target, _, _ in NEW_LEVELS:
+        op.create_table(target,
+        *_columns(),
+        sa.ForeignKeyConstraint(['device_id'], ['device.id'], ),
+        sa.PrimaryKeyConstraint('device_id', 'bucket')
+        )
+    for target, source, seconds in NEW_LEVELS:
+        _fill(target, source, seconds)
+
+
+def downgrade():
+    for target, _, _ in reversed(NEW_LEVELS):
+        op.drop_table(target)
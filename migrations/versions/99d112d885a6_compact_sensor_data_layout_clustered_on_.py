@@ -0,0 +1,83 @@
+"""Compact sensor_data layout clustered on device_id and epoch ms
+
+Revision ID: 99d112d885a6
+Revises: 185b905d820d
+Create Date: 2026-10-17 18:01:24.688491
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '99d112d885a6'
+down_revision = '185b905d820d'
+branch_labels = None
+depends_on = None
+
+
+def _to_epoch_ms(dialect):
+    if dialect == 'postgresql':
+        return "CAST(EXTRACT(EPOCH FROM timestamp) * 1000 AS BIGINT)"
+    return ("CAST(strftime('%s', timestamp) AS INTEGER) * 1000"
+            " + CAST(substr(strftime('%f', timestamp), 4, 3) AS INTEGER)")
+
+
+def _from_epoch_ms(dialect):
+    if dialect == 'postgresql':
+        return "to_timestamp(ts_epoch_ms / 1000.0) AT TIME ZONE 'UTC'"
+    return "strftime('%Y-%m-%d %H:%M:%f', ts_epoch_ms / 1000.0, 'unixepoch') || '000'"
+
+
+def upgrade():
+    # Rebuilds sensor_data as a table clustered on (device_id, ts_epoch_ms)
+    # (WITHOUT ROWID on SQLite). Measurements become integer hundredths.
+    # Rows without a device, or repeating a device's millisecond, are dropped.
+    dialect = op.get_bind().dialect.name
+    op.rename_table('sensor_data', 'sensor_data_legacy')
+    op.create_table('sensor_data',
+    sa.Column('device_id', sa.Integer(), nullable=False),
+    sa.Column('ts_epoch_ms', sa.BigInteger(), nullable=False),
+    sa.Column('temperature', sa.Integer(), nullable=True),
+    sa.Column('humidity', sa.Integer(), nullable=True),
+    sa.Column('ac_voltage', sa.Integer(), nullable=True),
+    sa.Column('water_detected', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['device_id'], ['device.id'], ),
+    sa.PrimaryKeyConstraint('device_id', 'ts_epoch_ms'),
+    sqlite_with_rowid=False
+    )
+    op.execute(
+        "INSERT INTO sensor_data (device_id, ts_epoch_ms, temperature, humidity, ac_voltage, water_detected) "
+        f"SELECT device_id, {_to_epoch_ms(dialect)}, "
+        "CAST(ROUND(temperature * 100) AS INTEGER), CAST(ROUND(humidity * 100) AS INTEGER), "
+        "CAST(ROUND(ac_voltage * 100) AS INTEGER), water_detected "
+        "FROM sensor_data_legacy WHERE device_id IS NOT NULL AND timestamp IS NOT NULL "
+        "ON CONFLICT DO NOTHING"
+    )
+    op.drop_table('sensor_data_legacy')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    op.rename_table('sensor_data', 'sensor_data_compact')
+    op.create_table('sensor_data',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('temperature', sa.Float(), nullable=True),
+    sa.Column('humidity', sa.Float(), nullable=True),
+    sa.Column('ac_voltage', sa.Float(), nullable=True),
+    sa.Column('water_detected', sa.Boolean(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('device_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['device_id'], ['device.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(
+        "INSERT INTO sensor_data (device_id, timestamp, temperature, humidity, ac_voltage, water_detected) "
+        f"SELECT device_id, {_from_epoch_ms(dialect)}, "
+        "temperature / 100.0, humidity / 100.0, ac_voltage / 100.0, water_detected "
+        "FROM sensor_data_compact ORDER BY ts_epoch_ms, device_id"
+    )
+    op.drop_table('sensor_data_compact')
+    with op.batch_alter_table('sensor_data', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sensor_data_timestamp'), ['timestamp'], unique=False)
+        batch_op.create_index('ix_sensor_data_device_id_timestamp', ['device_id', 'timestamp'], unique=False)
@@ -0,0 +1,22 @@
+# /notification_worker.py
+
+import time
+from datetime import datetime
+from app import create_app
+from app.email import deliver_pending_emails
+
+# Create a Flask app instance to work with the database and mail settings
+app = create_app()
+
+# --- Main Loop ---
+if __name__ == "__main__":
+    print("Starting Notification Worker...")
+    with app.app_context():
+        poll_interval = app.config['OUTBOX_POLL_INTERVAL']
+        while True:
+            processed = deliver_pending_emails()
+            if processed:
+                print(f"[{datetime.utcnow()}] Processed {processed} queued email(s).")
+                # There may be more waiting; drain the backlog before sleeping.
+                continue
+            time.sleep(poll_interval)
@@ -1,4 +1,7 @@
 import time
+import gzip
+import random
+import sqlite3
 import requests
 import board
 import adafruit_dht
@@ -6,11 +9,38 @@ import busio
 import adafruit_ads1x15.ads1115 as ADS
 from adafruit_ads1x15.analog_in import AnalogIn
 import json
+import struct
 
 # --- Configuration ---
 # TODO: Replace with your device's unique ID and Server URL
 DEVICE_ID = "RPI_SERVER_ROOM_A_01" 
-SERVER_URL = "http://<YOUR_SERVER_IP>:5000/api/ingest" # This will be the IP of your computer running the Flask app
+SERVER_URL = "http://<YOUR_SERVER_IP>:5000/api/ingest/batch" # This will be the IP of your computer running the Flask app
+# "binary" sends readings in the server's compact layout (16 bytes each
+# instead of about 160 of JSON, which matters on metered links); "json" for
+# servers that predate it. Batches of GZIP_MIN_READINGS or more are gzipped.
+PAYLOAD_FORMAT = "binary"
+BINARY_CONTENT_TYPE = "application/x-envmon-readings"
+GZIP_MIN_READINGS = 10
+SAMPLE_INTERVAL = 60  # seconds between readings, until the server says otherwise
+# The server answers each upload with when to read again (next_report_seconds):
+# sooner while an alert is near, later while the room is stable. Its advice
+# is kept within these bounds.
+MIN_SAMPLE_INTERVAL = 5
+MAX_SAMPLE_INTERVAL = 900
+
+# --- Store-and-Forward ---
+# Readings are written to a local SQLite file first and removed once the
+# server has them, so a server restart or a network outage loses nothing.
+# Past BUFFER_MAX_READINGS (about 70 days at one per minute) the oldest go.
+BUFFER_PATH = "readings_buffer.db"
+BUFFER_MAX_READINGS = 100000
+# Readings per upload (the server accepts up to 1000), and the pause between
+# batches while a backlog drains, so a long outage does not end in a flood.
+UPLOAD_BATCH_SIZE = 100
+DRAIN_BATCH_INTERVAL = 2
+# Failed uploads are retried after 5, 10, 20... seconds, up to 5 minutes
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 300
 
 # --- Sensor Initialization ---
 # Initialize DHT22 Temperature/Humidity Sensor
@@ -82,35 +112,171 @@ def read_sensors():
         
     return data
 
-def send_to_server(payload):
-    """Sends the data payload to the server's ingestion endpoint."""
-    try:
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(SERVER_URL, data=json.dumps(payload), headers=headers, timeout=10)
-        
+def pack_readings(readings):
+    """
+    (device id, epoch seconds, data) tuples in the server's binary layout;
+    raises struct.error if a value does not fit. This is a copy of
+    pack_readings in app/payloads.py, so the Pi needs no server code;
+    tests/test_payloads.py checks that both produce the same bytes.
+    """
+    def scaled(value, missing):
+        return missing if value is None else round(value * 100)
+    ids = {}
+    records = []
+    for device_id, timestamp, data in readings:
+        water = data.get("water_detected")
+        records.append(struct.pack(
+            '!BqhHHB', ids.setdefault(device_id, len(ids)), round(timestamp * 1000),
+            scaled(data.get("temperature"), -0x8000),
+            scaled(data.get("humidity"), 0xFFFF),
+            scaled(data.get("ac_voltage"), 0xFFFF),
+            0xFF if water is None else int(bool(water))
+        ))
+    header = struct.pack('!2sBB', b'EM', 1, len(ids))
+    for device_id in ids:
+        encoded = device_id.encode('utf8')
+        header += struct.pack('!B', len(encoded)) + encoded
+    return header + struct.pack('!H', len(records)) + b''.join(records)
+
+class ReadingBuffer:
+    """Durable FIFO of the readings the server does not have yet, in a local SQLite file."""
+
+    def __init__(self, path, max_readings):
+        self.max_readings = max_readings
+        self.conn = sqlite3.connect(path)
+        # WAL with NORMAL sync survives a power cut and spares the SD card
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, device_id TEXT NOT NULL, timestamp REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def add(self, device_id, timestamp, data):
+        with self.conn:
+            last_id = self.conn.execute(
+                "INSERT INTO readings (device_id, timestamp, data) VALUES (?, ?, ?)", (device_id, timestamp, json.dumps(data))
+            ).lastrowid
+            dropped = self.conn.execute("DELETE FROM readings WHERE id <= ?", (last_id - self.max_readings,)).rowcount
+        if dropped:
+            print(f"Buffer full, dropped the {dropped} oldest reading(s).")
+
+    def oldest(self, limit):
+        """The oldest buffered readings as (id, device id, timestamp, data)."""
+        rows = self.conn.execute("SELECT id, device_id, timestamp, data FROM readings ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [(row_id, device_id, timestamp, json.loads(data)) for row_id, device_id, timestamp, data in rows]
+
+    def remove(self, ids):
+        with self.conn:
+            self.conn.executemany("DELETE FROM readings WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+class Uploader:
+    """Sends the buffered readings to the server in batches over one keep-alive connection."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.session = requests.Session()
+        self.payload_format = PAYLOAD_FORMAT
+        self.batch_size = UPLOAD_BATCH_SIZE
+        self.sample_interval = SAMPLE_INTERVAL
+
+    def encode(self, batch):
+        """(body, headers) of a batch in the payload format, falling back to JSON."""
+        readings = [(device_id, timestamp, data) for _, device_id, timestamp, data in batch]
+        body, headers = None, {}
+        if self.payload_format == "binary":
+            try:
+                body, headers = pack_readings(readings), {'Content-Type': BINARY_CONTENT_TYPE}
+            except struct.error:
+                pass
+        if body is None:
+            records = [{"device_id": device_id, "timestamp": timestamp, "data": data} for device_id, timestamp, data in readings]
+            body, headers = json.dumps(records).encode(), {'Content-Type': 'application/json'}
+        if len(batch) >= GZIP_MIN_READINGS:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        return body, headers
+
+    def upload(self):
+        """
+        Uploads the oldest batch and removes what the server took. Returns
+        False if the server could not be reached or asked to retry later.
+        """
+        batch = self.buffer.oldest(self.batch_size)
+        if not batch:
+            return True
+        body, headers = self.encode(batch)
+        try:
+            response = self.session.post(SERVER_URL, data=body, headers=headers, timeout=30)
+        except requests.exceptions.RequestException as e:
+            print(f"Could not connect to server: {e}")
+            return False
+
         if response.status_code == 200:
-            print("Data sent successfully.")
-        else:
-            print(f"Failed to send data. Status: {response.status_code}, Response: {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Could not connect to server: {e}")
+            reply = response.json()
+            advised = (reply.get("next_report_seconds") or {}).get(DEVICE_ID)
+            if isinstance(advised, (int, float)):
+                self.sample_interval = min(max(advised, MIN_SAMPLE_INTERVAL), MAX_SAMPLE_INTERVAL)
+            done, retry = [], 0
+            for (row_id, _, _, _), result in zip(batch, reply.get("results", [])):
+                if result.get("status") in ("ok", "duplicate"):
+                    done.append(row_id)
+                elif "retry later" in result.get("error", ""):
+                    retry += 1
+                else:
+                    # Will never be accepted, e.g. the device is not registered
+                    print(f"Reading rejected by the server: {result.get('error')}")
+                    done.append(row_id)
+            self.buffer.remove(done)
+            print(f"Uploaded {len(done)} reading(s), {len(self.buffer)} left in the buffer.")
+            return not retry
+        if response.status_code == 415 and self.payload_format != "json":
+            print("Server does not accept binary readings, switching to JSON.")
+            self.payload_format = "json"
+            return True
+        if response.status_code == 413 and self.batch_size > 1:
+            self.batch_size = max(1, self.batch_size // 2)
+            return True
+        if response.status_code == 429 or response.status_code >= 500:
+            print(f"Server busy or failing. Status: {response.status_code}")
+            return False
+        print(f"Failed to send data, dropping {len(batch)} reading(s). Status: {response.status_code}, Response: {response.text}")
+        self.buffer.remove([row_id for row_id, _, _, _ in batch])
+        return True
 
 # --- Main Loop ---
 if __name__ == "__main__":
     print("Starting Server Room Monitoring System...")
+    buffer = ReadingBuffer(BUFFER_PATH, BUFFER_MAX_READINGS)
+    uploader = Uploader(buffer)
+    next_sample = next_upload = last_sample = time.monotonic()
+    failures = 0
     while True:
-        print("Reading sensor data...")
-        sensor_data = read_sensors()
-        
-        payload = {
-            "device_id": DEVICE_ID,
-            "data": sensor_data
-        }
-        
-        print(f"Payload: {payload}")
-        
-        print("Sending data to server...")
-        send_to_server(payload)
-        
-        print("Waiting for 60 seconds...")
-        time.sleep(60)
\ No newline at end of file
+        now = time.monotonic()
+        if now >= next_sample:
+            print("Reading sensor data...")
+            sensor_data = read_sensors()
+            # Stamped on the device, so readings uploaded late keep their time
+            buffer.add(DEVICE_ID, time.time(), sensor_data)
+            print(f"Buffered: {sensor_data}")
+            last_sample = now
+            next_sample = now + uploader.sample_interval
+
+        if now >= next_upload:
+            if uploader.upload():
+                failures = 0
+                # Follow the server's advice from the next reading on
+                next_sample = max(last_sample + uploader.sample_interval, time.monotonic())
+                # Keep draining a backlog at a bounded rate, else wait for the next reading
+                next_upload = time.monotonic() + DRAIN_BATCH_INTERVAL if len(buffer) else next_sample
+            else:
+                failures += 1
+                backoff = min(BACKOFF_BASE_SECONDS * 2 ** (failures - 1), BACKOFF_MAX_SECONDS)
+                next_upload = time.monotonic() + backoff * random.uniform(0.5, 1)
+                print(f"Upload failed, retrying in about {backoff} seconds ({len(buffer)} reading(s) buffered).")
+
+        time.sleep(max(0, min(next_sample, next_upload) - time.monotonic()))
@@ -1,7 +1,9 @@
 # /run.py
 
+import os
 from app import create_app, db
 from app.models import User, Device, SensorData
+from app.offline import start_offline_monitor
 
 # Create the Flask app instance using our factory
 app = create_app()
@@ -19,4 +21,8 @@ if __name__ == '__main__':
     # This makes the app accessible on your local network,
     # so the Raspberry Pi can send data to it.
     # `debug=True` enables the debugger and auto-reloads the server on code changes.
+    # The reloader runs the app in a child process; only start the offline
+    # monitor there, not in the watcher.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_offline_monitor(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,19 @@
+import pytest
+from app import create_app, db
+from config import Config
+
+
+class TestConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    TESTING = True
+    OFFLINE_DETECTION = 'poll'
+    RECENT_READINGS_CAPACITY = 0
+
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
@@ -0,0 +1,6 @@
+def test_concurrent_ingest_neither_duplicates_nor_loses_alert_transitions(app):
+    result = app.test_cli_runner().invoke(args=[
+        'stress-alert-transitions', '--processes', '3', '--devices', '2', '--readings', '60'
+    ])
+    assert result.exit_code == 0, result.output
+    assert result.output.count('[ok]') == 2
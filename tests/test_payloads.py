@@ -0,0 +1,60 @@
+import importlib
+import sys
+from datetime import datetime
+from unittest import mock
+import pytest
+from app import db
+from app.models import Device, SensorData
+from app.payloads import READINGS_TYPE, pack_readings, unpack_readings
+
+READINGS = [
+    ('RPI_1', 1760000000.123, {'temperature': -4.25, 'humidity': 51.5, 'ac_voltage': 229.87, 'water_detected': False}),
+    ('RPI_2', 1760000060.0, {'temperature': 21.0, 'humidity': None, 'ac_voltage': None, 'water_detected': None}),
+    ('RPI_1', 1760000120.5, {'temperature': None, 'humidity': 0.0, 'ac_voltage': 655.34, 'water_detected': True}),
+]
+
+HARDWARE_MODULES = ('board', 'busio', 'adafruit_dht', 'adafruit_ads1x15', 'adafruit_ads1x15.ads1115',
+                    'adafruit_ads1x15.analog_in', 'RPi', 'RPi.GPIO')
+
+
+@pytest.fixture
+def rpi_monitor(monkeypatch):
+    """rpi_monitor.py imported with its Raspberry Pi hardware modules replaced by mocks."""
+    pytest.importorskip('requests')
+    for name in HARDWARE_MODULES:
+        monkeypatch.setitem(sys.modules, name, mock.MagicMock())
+    monkeypatch.delitem(sys.modules, 'rpi_monitor', raising=False)
+    return importlib.import_module('rpi_monitor')
+
+
+def test_rpi_monitor_encodes_readings_like_the_server(rpi_monitor):
+    body = rpi_monitor.pack_readings(READINGS)
+    assert body == pack_readings(READINGS)
+    assert unpack_readings(body) == [
+        {'device_id': hardware_id, 'timestamp': timestamp, 'data': data} for hardware_id, timestamp, data in READINGS
+    ]
+
+
+def test_binary_reading_on_single_endpoint_keeps_device_timestamp(app):
+    db.session.add(Device(name='Pi', unique_hardware_id='RPI_1'))
+    db.session.commit()
+    body = pack_readings([READINGS[0]])
+    client = app.test_client()
+
+    response = client.post('/api/ingest', data=body, content_type=READINGS_TYPE)
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'success'
+    stored = SensorData.query.one()
+    assert stored.timestamp == datetime(2025, 10, 9, 8, 53, 20, 123000)
+    assert stored.temperature == -4.25
+
+    response = client.post('/api/ingest', data=body, content_type=READINGS_TYPE)
+    assert response.get_json()['status'] == 'duplicate'
+    assert SensorData.query.count() == 1
+
+
+@pytest.mark.parametrize('device_id', [123, ['RPI_1'], {'id': 'RPI_1'}])
+def test_single_ingest_rejects_non_string_device_id(app, device_id):
+    response = app.test_client().post('/api/ingest', json={'device_id': device_id, 'data': {'temperature': 20.0}})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == "'device_id' must be a string"
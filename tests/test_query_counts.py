@@ -0,0 +1,7 @@
+from app.commands import PAGE_QUERY_BUDGETS
+
+
+def test_pages_and_ingest_stay_within_their_query_budgets(app):
+    result = app.test_cli_runner().invoke(args=['check-query-counts', '--devices', '10'])
+    assert result.exit_code == 0, result.output
+    assert result.output.count('[ok]') == len(PAGE_QUERY_BUDGETS) + 1
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from app.commands import explain_query_plan, history_table_scans, hot_queries, seed_plan_database
+
+
+def test_history_table_scans_matches_old_and_new_sqlite_wording():
+    assert history_table_scans(['SCAN sensor_data']) == ['SCAN sensor_data']
+    assert history_table_scans(['SCAN TABLE alert_log']) == ['SCAN TABLE alert_log']
+    assert history_table_scans(['SCAN TABLE alert_log AS a']) == ['SCAN TABLE alert_log AS a']
+
+
+def test_history_table_scans_ignores_index_walks():
+    assert history_table_scans(['SCAN sensor_rollup_hour USING INDEX x']) == []
+    assert history_table_scans(['SCAN sensor_data USING COVERING INDEX ix_sensor_data_ts']) == []
+    assert history_table_scans(['SCAN TABLE alert_log USING INDEX ix_alert_log_timestamp']) == []
+    assert history_table_scans(['SCAN device', 'SEARCH sensor_data USING PRIMARY KEY (device_id=?)']) == []
+
+
+def test_hot_queries_never_scan_history_tables(app):
+    engine = create_engine('sqlite://')
+    seed_plan_database(engine, devices=50, readings_per_device=200)
+    now = datetime.utcnow()
+    with engine.connect() as conn:
+        plans = {
+            name: explain_query_plan(conn, query)
+            for name, query in hot_queries([1, 2, 3], now - timedelta(days=1), now).items()
+        }
+    scans = {name: plan for name, plan in plans.items() if history_table_scans(plan)}
+    assert not scans
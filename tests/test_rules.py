@@ -0,0 +1,59 @@
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from app.rules import METRICS, CompiledRules
+
+START = datetime(2026, 1, 1)
+
+
+def random_rules(rng, count):
+    rules = []
+    for rule_id in range(1, count + 1):
+        metric = rng.choice(list(METRICS))
+        if metric == 'water_detected':
+            low, high = None, 0.5
+        else:
+            low = rng.choice([None, rng.uniform(0, 40)])
+            high = rng.choice([None, (low or 0) + rng.uniform(5, 40)])
+        rules.append(SimpleNamespace(
+            id=rule_id, metric=metric, low_threshold=low, high_threshold=high,
+            hysteresis=rng.choice([None, 0, rng.uniform(0, 5)]),
+            min_duration_seconds=rng.choice([None, 0, 60, 300]),
+            active=rng.random() < 0.3,
+            pending_since=rng.choice([None, START - timedelta(seconds=rng.randint(0, 600))]),
+        ))
+    return rules
+
+
+def random_readings(rng, count):
+    readings = []
+    timestamp = START
+    for _ in range(count):
+        timestamp += timedelta(milliseconds=rng.randint(1, 120000))
+        values = {}
+        for metric in METRICS:
+            if rng.random() < 0.1:
+                continue  # left out of the reading
+            if metric == 'water_detected':
+                values[metric] = rng.random() < 0.2
+            else:
+                values[metric] = rng.choice([None, rng.uniform(-10, 90)])
+        readings.append((timestamp, values))
+    return readings
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_evaluate_batch_matches_evaluate(seed):
+    rng = random.Random(seed)
+    rules = random_rules(rng, rng.randint(1, 24))
+    readings = random_readings(rng, rng.randint(1, 400))
+    looped, batched = CompiledRules(rules), CompiledRules(rules)
+
+    # Two calls each, so the state carried between calls is compared too
+    split = rng.randint(0, len(readings))
+    for part in (readings[:split], readings[split:]):
+        assert batched.evaluate_batch(part) == looped.evaluate(part)
+        assert batched.active == looped.active
+        assert batched.pending == looped.pending
+    assert batched.state_changes() == looped.state_changes()
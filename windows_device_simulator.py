@@ -24,13 +24,17 @@ def generate_fake_sensor_data():
     return data
 
 def send_to_server(payload):
-    """Sends the data payload to the server's ingestion endpoint."""
+    """
+    Sends the data payload to the server's ingestion endpoint. Returns the
+    seconds the server advises to wait before the next reading, or None.
+    """
     try:
         headers = {'Content-Type': 'application/json'}
         response = requests.post(SERVER_URL, data=json.dumps(payload), headers=headers, timeout=10)
         
         if response.status_code == 200:
             print(f"SUCCESS: Sent payload: {payload}")
+            return response.json().get("next_report_seconds")
         else:
             print(f"FAIL: Status Code {response.status_code}, Response: {response.text}")
     except requests.exceptions.RequestException as e:
@@ -48,8 +52,7 @@ if __name__ == "__main__":
             "data": sensor_data
         }
         
-        send_to_server(payload)
-        
-        # Send data more frequently for faster testing
-        print("Waiting for 10 seconds...\n")
-        time.sleep(10)
\ No newline at end of file
+        # Report as often as the server advises, every 10 seconds otherwise
+        wait = send_to_server(payload) or 10
+        print(f"Waiting for {wait} seconds...\n")
+        time.sleep(wait)
\ No newline at end of file